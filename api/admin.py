@@ -1,4 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request, Query, BackgroundTasks
+from fastapi.responses import StreamingResponse, PlainTextResponse, FileResponse
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from sqlalchemy import desc, func
 from typing import List, Optional
@@ -6,9 +8,22 @@ from datetime import datetime, timedelta
 import pytz
 from pydantic import BaseModel, ConfigDict
 import json
+import asyncio
+import csv
+import time
+import io
+import zlib
+from urllib.parse import urlencode
 
-from .models import get_db, User, ActivityLog, Role
-from .auth import get_current_user, has_role, log_activity
+from .models import SessionLocal, DATABASE_PATH, User, ActivityLog, Role, run_db
+from .auth import get_current_user, get_current_stream_user, has_role, log_activity, validate_role, invalidate_principal, principal_cache, Principal
+from .passwords import hash_password, hashing_stats
+from .events import broadcaster, format_sse, publish_stats_delta
+from .metrics import registry as metrics_registry
+from .profiling import list_profiles, profile_path
+from .sql_stats import sql_stats
+from .backup import create_backup, list_backups, verify_backup, backup_status, current_backup_status, BackupInProgressError
+from .settings import system_settings
 
 # Router
 router = APIRouter(prefix="/api/admin", tags=["admin"])
@@ -67,89 +82,79 @@ class SystemSettingUpdate(BaseModel):
     maintenance_mode: Optional[bool] = None
     debug_mode: Optional[bool] = None
     api_rate_limiting: Optional[bool] = None
+    request_profiling: Optional[bool] = None
 
 class SystemSettings(BaseModel):
     maintenance_mode: bool
     debug_mode: bool
     api_rate_limiting: bool
+    request_profiling: bool
     last_backup: str
 
-# In-memory storage for system settings (in a real app, this would be in the database)
 ist = pytz.timezone('Asia/Kolkata')
-system_settings = {
-   "maintenance_mode": False,
-   "debug_mode": True,
-   "api_rate_limiting": True,
-   "last_backup": (datetime.now(ist) - timedelta(days=2)).strftime("%Y-%m-%d %H:%M:%S")
-}
 
 # API Routes
 # User management endpoints
 @router.get("/users", response_model=List[UserResponse])
-async def get_users(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(has_role("admin"))
-):
-    users = db.query(User).all()
-    return users
+async def get_users(current_user: Principal = Depends(has_role("admin"))):
+    return await run_db(lambda db: db.query(User).all())
 
 # Add the POST endpoint for creating users after the get_all_users endpoint
 @router.post("/users", response_model=UserResponse)
 async def create_user(
     user_data: dict,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(has_role("admin"))
+    current_user: Principal = Depends(has_role("admin"))
 ):
-    # Check if username exists
-    existing_user = db.query(User).filter(User.username == user_data["username"]).first()
-    if existing_user:
-        raise HTTPException(status_code=400, detail="Username already exists")
-    
-    # Check if email exists
-    existing_email = db.query(User).filter(User.email == user_data["email"]).first()
-    if existing_email:
-        raise HTTPException(status_code=400, detail="Email already exists")
-    
-    # Validate role
-    from .auth import validate_role
-    validate_role(user_data["role"], db)
+    def check_available(db: Session):
+        # Check if username exists
+        existing_user = db.query(User).filter(User.username == user_data["username"]).first()
+        if existing_user:
+            raise HTTPException(status_code=400, detail="Username already exists")
+        
+        # Check if email exists
+        existing_email = db.query(User).filter(User.email == user_data["email"]).first()
+        if existing_email:
+            raise HTTPException(status_code=400, detail="Email already exists")
     
-    # Create new user
-    from datetime import datetime
-    import pytz
-
-    hashed_password = User.get_password_hash(user_data["password"])
-    ist = pytz.timezone('Asia/Kolkata')
-    now = datetime.now(ist)
-    new_user = User(
-        username=user_data["username"],
-        email=user_data["email"],
-        hashed_password=hashed_password,
-        role=user_data["role"],
-        is_active=user_data.get("is_active", True),
-        created_at=now
-    )
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await run_db(check_available)
+    hashed_password = await hash_password(user_data["password"])
     
-    # Log the activity
-    log_activity(
-        db=db,
-        username=current_user.username,
-        action="User created",
-        details=f"Created user {new_user.username} (ID: {new_user.id})"
-    )
+    def create(db: Session):
+        # Validate role
+        validate_role(user_data["role"], db)
+        
+        # Create new user
+        now = datetime.now(ist)
+        new_user = User(
+            username=user_data["username"],
+            email=user_data["email"],
+            hashed_password=hashed_password,
+            role=user_data["role"],
+            is_active=user_data.get("is_active", True),
+            created_at=now
+        )
+        db.add(new_user)
+        db.commit()
+        db.refresh(new_user)
+        publish_stats_delta(total_users=1, active_users=1 if new_user.is_active else 0)
+        
+        # Log the activity
+        log_activity(
+            db=db,
+            username=current_user.username,
+            action="User created",
+            details=f"Created user {new_user.username} (ID: {new_user.id})"
+        )
+        return new_user
     
-    return new_user
+    return await run_db(create)
 
 @router.get("/users/{user_id}", response_model=UserResponse)
 async def get_user(
     user_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(has_role("admin"))
+    current_user: Principal = Depends(has_role("admin"))
 ):
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await run_db(lambda db: db.query(User).filter(User.id == user_id).first())
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
@@ -158,65 +163,75 @@ async def get_user(
 async def update_user(
     user_id: int,
     user_data: dict,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(has_role("admin"))
+    current_user: Principal = Depends(has_role("admin"))
 ):
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    # Update user fields
-    if "username" in user_data:
-        user.username = user_data["username"]
-    if "email" in user_data:
-        user.email = user_data["email"]
-    if "role" in user_data:
-        # Validate role
-        from .auth import validate_role
-        validate_role(user_data["role"], db)
-        user.role = user_data["role"]
-    if "is_active" in user_data:
-        user.is_active = user_data["is_active"]
-    
-    db.commit()
-    db.refresh(user)
-    
-    # Log the activity
-    log_activity(
-        db=db,
-        username=current_user.username,
-        action="User updated",
-        details=f"Updated user {user.username} (ID: {user.id})"
-    )
+    def update(db: Session):
+        user = db.query(User).filter(User.id == user_id).first()
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        
+        old_username = user.username
+        
+        # Update user fields
+        if "username" in user_data:
+            user.username = user_data["username"]
+        if "email" in user_data:
+            user.email = user_data["email"]
+        if "role" in user_data:
+            # Validate role
+            validate_role(user_data["role"], db)
+            user.role = user_data["role"]
+        was_active = user.is_active
+        if "is_active" in user_data:
+            user.is_active = user_data["is_active"]
+        
+        db.commit()
+        db.refresh(user)
+        invalidate_principal(old_username, user.username)
+        if user.is_active != was_active:
+            publish_stats_delta(active_users=1 if user.is_active else -1)
+        
+        # Log the activity
+        log_activity(
+            db=db,
+            username=current_user.username,
+            action="User updated",
+            details=f"Updated user {user.username} (ID: {user.id})"
+        )
+        return user
     
-    return user
+    return await run_db(update)
 
 @router.delete("/users/{user_id}")
 async def delete_user(
     user_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(has_role("admin"))
+    current_user: Principal = Depends(has_role("admin"))
 ):
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    # Don't allow deleting yourself
-    if user.id == current_user.id:
-        raise HTTPException(status_code=400, detail="Cannot delete your own account")
-    
-    username = user.username
-    db.delete(user)
-    db.commit()
-    
-    # Log the activity
-    log_activity(
-        db=db,
-        username=current_user.username,
-        action="User deleted",
-        details=f"Deleted user {username} (ID: {user_id})"
-    )
+    def delete(db: Session):
+        user = db.query(User).filter(User.id == user_id).first()
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        
+        # Don't allow deleting yourself
+        if user.id == current_user.id:
+            raise HTTPException(status_code=400, detail="Cannot delete your own account")
+        
+        username = user.username
+        was_active = user.is_active
+        db.delete(user)
+        db.commit()
+        invalidate_principal(username)
+        publish_stats_delta(total_users=-1, active_users=-1 if was_active else 0)
+        
+        # Log the activity
+        log_activity(
+            db=db,
+            username=current_user.username,
+            action="User deleted",
+            details=f"Deleted user {username} (ID: {user_id})"
+        )
     
+    await run_db(delete)
     return {"message": "User deleted successfully"}
 
 # Activity log endpoints
@@ -229,59 +244,60 @@ async def get_activity_logs(
     page_url: Optional[str] = None,  # Add page_url filter
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(has_role("admin"))  # Only admin can view logs
+    current_user: Principal = Depends(has_role("admin"))  # Only admin can view logs
 ):
-    # Build query
-    query = db.query(ActivityLog)
-    
-    # Apply filters
-    if username:
-        query = query.filter(ActivityLog.username == username)
-    if action:
-        query = query.filter(ActivityLog.action == action)
-    if page_url:  # Add page_url filter
-        query = query.filter(ActivityLog.page_url == page_url)
-    
-    # Apply date filters
-    ist = pytz.timezone('Asia/Kolkata')
-    if start_date:
-        try:
-            start_datetime = datetime.fromisoformat(start_date.replace('Z', '+00:00')).astimezone(ist)
-            query = query.filter(ActivityLog.timestamp >= start_datetime)
-        except ValueError:
-            pass
-    
-    if end_date:
-        try:
-            end_datetime = datetime.fromisoformat(end_date.replace('Z', '+00:00')).astimezone(ist)
-            query = query.filter(ActivityLog.timestamp <= end_datetime)
-        except ValueError:
-            pass
-    
-    # Order by timestamp (newest first)
-    query = query.order_by(desc(ActivityLog.timestamp))
-    
-    # Apply pagination
-    logs = query.offset(offset).limit(limit).all()
-    
-    # Print debug information
-    print(f"Retrieved {len(logs)} activity logs")
-    for log in logs[:5]:  # Print first 5 logs for debugging
-        print(f"Log: id={log.id}, username={log.username}, action={log.action}")
+    def query_logs(db: Session):
+        # Build query
+        query = db.query(ActivityLog)
+        
+        # Apply filters
+        if username:
+            query = query.filter(ActivityLog.username == username)
+        if action:
+            query = query.filter(ActivityLog.action == action)
+        if page_url:  # Add page_url filter
+            query = query.filter(ActivityLog.page_url == page_url)
+        
+        # Apply date filters
+        ist = pytz.timezone('Asia/Kolkata')
+        if start_date:
+            try:
+                start_datetime = datetime.fromisoformat(start_date.replace('Z', '+00:00')).astimezone(ist)
+                query = query.filter(ActivityLog.timestamp >= start_datetime)
+            except ValueError:
+                pass
+        
+        if end_date:
+            try:
+                end_datetime = datetime.fromisoformat(end_date.replace('Z', '+00:00')).astimezone(ist)
+                query = query.filter(ActivityLog.timestamp <= end_datetime)
+            except ValueError:
+                pass
+        
+        # Order by timestamp (newest first)
+        query = query.order_by(desc(ActivityLog.timestamp))
+        
+        # Apply pagination
+        logs = query.offset(offset).limit(limit).all()
+        
+        # Print debug information
+        print(f"Retrieved {len(logs)} activity logs")
+        for log in logs[:5]:  # Print first 5 logs for debugging
+            print(f"Log: id={log.id}, username={log.username}, action={log.action}")
+        
+        return logs
     
-    return logs
+    return await run_db(query_logs)
 
 @router.post("/activity/log")
 async def log_admin_activity(
     log_data: dict,
     request: Request,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)  # Changed from has_role("admin") to get_current_user
+    current_user: Principal = Depends(get_current_user)  # Changed from has_role("admin") to get_current_user
 ):
     # Log the activity
-    log_activity(
-        db=db,
+    await run_db(
+        log_activity,
         username=current_user.username,
         action=log_data.get("action", "Admin action"),
         details=log_data.get("details"),
@@ -292,12 +308,60 @@ async def log_admin_activity(
     
     return {"message": "Activity logged successfully"}
 
-# System statistics
-@router.get("/stats", response_model=SystemStatsResponse)
-async def get_system_stats(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(has_role("admin"))
+# Live activity feed
+EVENT_HEARTBEAT_SECONDS = 15
+# recent_activity counts a sliding 24 hours, which deltas can't follow, so the stats are resent this often
+EVENT_SNAPSHOT_SECONDS = 60
+
+@router.get("/events")
+async def stream_admin_events(
+    request: Request,
+    current_user: Principal = Depends(get_current_stream_user)
 ):
+    """
+    Server-sent events feed of new activity logs and dashboard stat deltas (admin only).
+    Starts with a full stats snapshot, then pushes changes as they happen and
+    a fresh snapshot every EVENT_SNAPSHOT_SECONDS.
+    """
+    if not current_user.is_active or current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="User does not have the required role: admin"
+        )
+    
+    snapshot = await run_db(compute_system_stats)
+    subscriber = broadcaster.subscribe()
+    
+    async def event_stream():
+        try:
+            yield "retry: 5000\n\n"
+            yield format_sse("snapshot", snapshot)
+            next_snapshot = time.monotonic() + EVENT_SNAPSHOT_SECONDS
+            while True:
+                if time.monotonic() >= next_snapshot:
+                    yield format_sse("snapshot", await run_db(compute_system_stats))
+                    next_snapshot = time.monotonic() + EVENT_SNAPSHOT_SECONDS
+                timeout = min(EVENT_HEARTBEAT_SECONDS, max(next_snapshot - time.monotonic(), 0))
+                try:
+                    event, data = await asyncio.wait_for(subscriber.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    if time.monotonic() < next_snapshot:
+                        yield ": keep-alive\n\n"
+                    continue
+                yield format_sse(event, data, data.get("id") if event == "activity" else None)
+        finally:
+            broadcaster.unsubscribe(subscriber)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# System statistics
+def compute_system_stats(db: Session):
     # Get IST timezone
     ist = pytz.timezone('Asia/Kolkata')
     now = datetime.now(ist)
@@ -316,178 +380,227 @@ async def get_system_stats(
         "recent_activity": recent_logs
     }
 
+@router.get("/stats", response_model=SystemStatsResponse)
+async def get_system_stats(current_user: Principal = Depends(has_role("admin"))):
+    return await run_db(compute_system_stats)
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics(current_user: Principal = Depends(has_role("admin"))):
+    """Prometheus metrics for this worker (admin only)"""
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+@router.get("/profiles")
+async def get_profiles(current_user: Principal = Depends(has_role("admin"))):
+    """List stored request profiles, newest first (admin only)"""
+    return list_profiles()
+
+@router.get("/profiles/{request_id}")
+async def download_profile(
+    request_id: str,
+    current_user: Principal = Depends(has_role("admin"))
+):
+    """Download a request profile as a pstats file, e.g. for snakeviz or flameprof (admin only)"""
+    path = profile_path(request_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(str(path), media_type="application/octet-stream", filename=path.name)
+
+@router.get("/sql-stats")
+async def get_sql_stats(
+    limit: int = Query(50, ge=1, le=1000),
+    current_user: Principal = Depends(has_role("admin"))
+):
+    """Statement timings per normalized SQL shape and recent N+1 patterns (admin only)"""
+    return {
+        "statements": sql_stats.summary(limit),
+        "n_plus_one": list(reversed(sql_stats.n_plus_one))
+    }
+
+@router.get("/slow-queries")
+async def get_slow_queries(current_user: Principal = Depends(has_role("admin"))):
+    """Most recent statements over the slow-query threshold, newest first (admin only)"""
+    return list(reversed(sql_stats.slow_queries))
+
+@router.delete("/sql-stats")
+async def reset_sql_stats(current_user: Principal = Depends(has_role("admin"))):
+    """Clear collected SQL statistics (admin only)"""
+    sql_stats.reset()
+    return {"message": "SQL statistics cleared"}
+
+@router.get("/hashing-stats")
+async def get_hashing_stats(current_user: Principal = Depends(has_role("admin"))):
+    """Password hashing pool queue metrics (admin only)"""
+    return hashing_stats()
+
 # Role management
 @router.get("/roles")
-async def get_roles(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(has_role("admin"))
-):
-    roles = db.query(Role).all()
+async def get_roles(current_user: Principal = Depends(has_role("admin"))):
+    roles = await run_db(lambda db: db.query(Role).all())
     return [{"id": role.id, "name": role.name, "description": role.description} for role in roles]
 
 @router.post("/roles")
 async def create_role(
     role_data: dict,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(has_role("admin"))
+    current_user: Principal = Depends(has_role("admin"))
 ):
-    # Check if role exists
-    existing_role = db.query(Role).filter(Role.name == role_data["name"]).first()
-    if existing_role:
-        raise HTTPException(status_code=400, detail="Role already exists")
-    
-    # Create new role
-    new_role = Role(
-        name=role_data["name"],
-        description=role_data.get("description", "")
-    )
-    db.add(new_role)
-    db.commit()
-    db.refresh(new_role)
-    
-    # Log the activity
-    log_activity(
-        db=db,
-        username=current_user.username,
-        action="Role created",
-        details=f"Created role {new_role.name} (ID: {new_role.id})"
-    )
+    def create(db: Session):
+        # Check if role exists
+        existing_role = db.query(Role).filter(Role.name == role_data["name"]).first()
+        if existing_role:
+            raise HTTPException(status_code=400, detail="Role already exists")
+        
+        # Create new role
+        new_role = Role(
+            name=role_data["name"],
+            description=role_data.get("description", "")
+        )
+        db.add(new_role)
+        db.commit()
+        db.refresh(new_role)
+        
+        # Log the activity
+        log_activity(
+            db=db,
+            username=current_user.username,
+            action="Role created",
+            details=f"Created role {new_role.name} (ID: {new_role.id})"
+        )
+        
+        return {"id": new_role.id, "name": new_role.name, "description": new_role.description}
     
-    return {"id": new_role.id, "name": new_role.name, "description": new_role.description}
+    return await run_db(create)
 
 @router.put("/roles/{role_id}")
 async def update_role(
     role_id: int,
     role_data: dict,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(has_role("admin"))
+    current_user: Principal = Depends(has_role("admin"))
 ):
-    role = db.query(Role).filter(Role.id == role_id).first()
-    if not role:
-        raise HTTPException(status_code=404, detail="Role not found")
-    
-    # Update role fields
-    if "name" in role_data:
-        # Check if the new name already exists
-        if role_data["name"] != role.name:
-            existing_role = db.query(Role).filter(Role.name == role_data["name"]).first()
-            if existing_role:
-                raise HTTPException(status_code=400, detail="Role name already exists")
-        role.name = role_data["name"]
-    
-    if "description" in role_data:
-        role.description = role_data["description"]
-    
-    db.commit()
-    db.refresh(role)
-    
-    # Log the activity
-    log_activity(
-        db=db,
-        username=current_user.username,
-        action="Role updated",
-        details=f"Updated role {role.name} (ID: {role.id})"
-    )
+    def update(db: Session):
+        role = db.query(Role).filter(Role.id == role_id).first()
+        if not role:
+            raise HTTPException(status_code=404, detail="Role not found")
+        
+        # Update role fields
+        if "name" in role_data:
+            # Check if the new name already exists
+            if role_data["name"] != role.name:
+                existing_role = db.query(Role).filter(Role.name == role_data["name"]).first()
+                if existing_role:
+                    raise HTTPException(status_code=400, detail="Role name already exists")
+            role.name = role_data["name"]
+        
+        if "description" in role_data:
+            role.description = role_data["description"]
+        
+        db.commit()
+        db.refresh(role)
+        principal_cache.clear()
+        
+        # Log the activity
+        log_activity(
+            db=db,
+            username=current_user.username,
+            action="Role updated",
+            details=f"Updated role {role.name} (ID: {role.id})"
+        )
+        
+        return {"id": role.id, "name": role.name, "description": role.description}
     
-    return {"id": role.id, "name": role.name, "description": role.description}
+    return await run_db(update)
 
 @router.delete("/roles/{role_id}")
 async def delete_role(
     role_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(has_role("admin"))
+    current_user: Principal = Depends(has_role("admin"))
 ):
-    role = db.query(Role).filter(Role.id == role_id).first()
-    if not role:
-        raise HTTPException(status_code=404, detail="Role not found")
-    
-    # Check if role is in use
-    users_with_role = db.query(User).filter(User.role == role.name).count()
-    if users_with_role > 0:
-        raise HTTPException(
-            status_code=400, 
-            detail=f"Cannot delete role that is assigned to {users_with_role} users"
+    def delete(db: Session):
+        role = db.query(Role).filter(Role.id == role_id).first()
+        if not role:
+            raise HTTPException(status_code=404, detail="Role not found")
+        
+        # Check if role is in use
+        users_with_role = db.query(User).filter(User.role == role.name).count()
+        if users_with_role > 0:
+            raise HTTPException(
+                status_code=400, 
+                detail=f"Cannot delete role that is assigned to {users_with_role} users"
+            )
+        
+        role_name = role.name
+        db.delete(role)
+        db.commit()
+        principal_cache.clear()
+        
+        # Log the activity
+        log_activity(
+            db=db,
+            username=current_user.username,
+            action="Role deleted",
+            details=f"Deleted role {role_name} (ID: {role_id})"
         )
     
-    role_name = role.name
-    db.delete(role)
-    db.commit()
-    
-    # Log the activity
-    log_activity(
-        db=db,
-        username=current_user.username,
-        action="Role deleted",
-        details=f"Deleted role {role_name} (ID: {role_id})"
-    )
-    
+    await run_db(delete)
     return {"message": "Role deleted successfully"}
 
 @router.get("/settings", response_model=SystemSettings)
-async def get_system_settings(current_user: User = Depends(has_role("admin"))):
+async def get_system_settings(current_user: Principal = Depends(has_role("admin"))):
     """Get system settings (admin only)"""
-    return system_settings
+    return system_settings.as_dict()
 
 # Add more logging to the settings update endpoint
 @router.put("/settings", response_model=SystemSettings)
 async def update_system_settings(
     settings: SystemSettingUpdate,
-    current_user: User = Depends(has_role("admin")),
-    db: Session = Depends(get_db),
+    current_user: Principal = Depends(has_role("admin")),
     request: Request = None
 ):
     """Update system settings (admin only)"""
-    changes = []
-    
-    if settings.maintenance_mode is not None:
-        old_value = system_settings["maintenance_mode"]
-        system_settings["maintenance_mode"] = settings.maintenance_mode
-        if old_value != settings.maintenance_mode:
-            changes.append(f"maintenance_mode: {old_value} -> {settings.maintenance_mode}")
-    
-    if settings.debug_mode is not None:
-        old_value = system_settings["debug_mode"]
-        system_settings["debug_mode"] = settings.debug_mode
-        if old_value != settings.debug_mode:
-            changes.append(f"debug_mode: {old_value} -> {settings.debug_mode}")
-    
-    if settings.api_rate_limiting is not None:
-        old_value = system_settings["api_rate_limiting"]
-        system_settings["api_rate_limiting"] = settings.api_rate_limiting
-        if old_value != settings.debug_mode:
-            changes.append(f"api_rate_limiting: {old_value} -> {settings.api_rate_limiting}")
-    
-    # Log the settings changes
-    if changes:
-        ip = request.client.host if request else None
-        user_agent = request.headers.get("user-agent") if request else None
-        log_activity(
-            db=db,
-            username=current_user.username,
-            action="System settings updated",
-            details=", ".join(changes),
-            ip_address=ip,
-            user_agent=user_agent
-        )
+    updates = settings.model_dump(exclude_none=True)
+    changes = [
+        f"{key}: {system_settings[key]} -> {value}"
+        for key, value in updates.items()
+        if system_settings[key] != value
+    ]
+    ip = request.client.host if request else None
+    user_agent = request.headers.get("user-agent") if request else None
     
-    return system_settings
+    def save(db: Session):
+        # Stored in the database so every worker picks the change up
+        system_settings.save(db, updates)
+        
+        # Log the settings changes
+        if changes:
+            log_activity(
+                db=db,
+                username=current_user.username,
+                action="System settings updated",
+                details=", ".join(changes),
+                ip_address=ip,
+                user_agent=user_agent
+            )
+    
+    if updates:
+        await run_db(save)
+    return system_settings.as_dict()
 
 @router.post("/backup", status_code=200)
 async def run_backup(
     background_tasks: BackgroundTasks,
-    current_user: User = Depends(has_role("admin")),
-    db: Session = Depends(get_db),
+    current_user: Principal = Depends(has_role("admin")),
     request: Request = None
 ):
     """Run a database backup (admin only)"""
-    # In a real system, you would run an actual backup process
-    # For this demo, we'll just update the last backup time
+    if DATABASE_PATH is None:
+        raise HTTPException(status_code=400, detail="Online backups are only available for the SQLite backend")
+    if current_backup_status()["state"] == "running":
+        raise HTTPException(status_code=409, detail="A backup is already running")
     
     # Log the backup action
     ip = request.client.host if request else None
     user_agent = request.headers.get("user-agent") if request else None
-    log_activity(
-        db=db,
+    await run_db(
+        log_activity,
         username=current_user.username,
         action="Database backup initiated",
         details="Manual backup started by admin",
@@ -495,39 +608,152 @@ async def run_backup(
         user_agent=user_agent
     )
     
+    username = current_user.username
+    
     def perform_backup():
-        # Simulate a backup process
-        import time
-        time.sleep(2)  # Simulate a 2-second backup process
-        ist = pytz.timezone('Asia/Kolkata')
-        system_settings["last_backup"] = datetime.now(ist).strftime("%Y-%m-%d %H:%M:%S")
-        
-        # Log backup completion
-        log_activity(
-            db=db,
-            username=current_user.username,
-            action="Database backup completed",
-            details="Backup completed successfully"
-        )
+        # The request-scoped session is closed by the time this runs, so use a fresh one
+        task_db = SessionLocal()
+        try:
+            manifest = create_backup()
+            system_settings.save(task_db, {"last_backup": backup_status["finished_at"]})
+            log_activity(
+                db=task_db,
+                username=username,
+                action="Database backup completed",
+                details=f"Backup {manifest['file']} completed in {manifest['duration_seconds']}s ({manifest['size_bytes']} bytes)"
+            )
+        except BackupInProgressError:
+            pass
+        except Exception as e:
+            log_activity(
+                db=task_db,
+                username=username,
+                action="Database backup failed",
+                details=str(e)
+            )
+        finally:
+            task_db.close()
     
     background_tasks.add_task(perform_backup)
     return {"message": "Backup started"}
 
+@router.get("/backup/status")
+async def get_backup_status(current_user: Principal = Depends(has_role("admin"))):
+    """Get progress of the current or most recent backup (admin only)"""
+    return current_backup_status()
+
+@router.get("/backups")
+async def get_backups(current_user: Principal = Depends(has_role("admin"))):
+    """List retained backups, newest first (admin only)"""
+    return list_backups()
+
+@router.post("/backups/{backup_name}/verify")
+async def verify_backup_file(
+    backup_name: str,
+    current_user: Principal = Depends(has_role("admin"))
+):
+    """Check that a backup restores to a consistent database (admin only)"""
+    try:
+        return await run_in_threadpool(verify_backup, backup_name)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Backup not found")
+
+# Data export
+EXPORT_TABLES = ("users", "roles", "activity_logs")
+EXPORT_BATCH_SIZE = 1000  # Rows fetched per round trip while streaming
+EXPORT_FLUSH_BYTES = 64 * 1024  # Uncompressed bytes buffered before each gzip flush
+
+def _export_columns(table: str):
+    """Columns included in the export for a table (password hashes are never exported)"""
+    if table == "users":
+        return User, ["id", "username", "email", "role", "is_active", "created_at"]
+    if table == "roles":
+        return Role, ["id", "name", "description"]
+    return ActivityLog, ["id", "username", "action", "details", "timestamp", "ip_address", "user_agent", "page_url"]
+
+def _export_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+def _iter_export_rows(db: Session, table: str):
+    """Yield one dict per row, reading in batches so memory stays flat regardless of table size"""
+    model, columns = _export_columns(table)
+    query = db.query(*[getattr(model, column) for column in columns]).order_by(model.id)
+    for row in query.yield_per(EXPORT_BATCH_SIZE):
+        yield {column: _export_value(value) for column, value in zip(columns, row)}
+
+def stream_export(tables: List[str], export_format: str, username: str):
+    """
+    Generate a gzip-compressed NDJSON or CSV export chunk by chunk.
+    NDJSON tags every record with its table; CSV covers a single table.
+    """
+    db = SessionLocal()
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 produces a gzip container
+    buffer = io.StringIO()
+    counts = {}
+    try:
+        for table in tables:
+            counts[table] = 0
+            writer = None
+            if export_format == "csv":
+                writer = csv.writer(buffer)
+                writer.writerow(_export_columns(table)[1])
+            for record in _iter_export_rows(db, table):
+                if writer:
+                    writer.writerow(record.values())
+                else:
+                    buffer.write(json.dumps({"table": table, **record}, default=str))
+                    buffer.write("\n")
+                counts[table] += 1
+                if buffer.tell() >= EXPORT_FLUSH_BYTES:
+                    chunk = compressor.compress(buffer.getvalue().encode("utf-8"))
+                    buffer.seek(0)
+                    buffer.truncate()
+                    if chunk:
+                        yield chunk
+        yield compressor.compress(buffer.getvalue().encode("utf-8")) + compressor.flush()
+
+        log_activity(
+            db=db,
+            username=username,
+            action="Data export completed",
+            details=", ".join(f"{table}: {count} rows" for table, count in counts.items())
+        )
+    finally:
+        db.close()
+
+def parse_export_tables(tables: Optional[str], export_format: str) -> List[str]:
+    """Validate the requested table list for an export"""
+    if tables:
+        requested = [table.strip() for table in tables.split(",") if table.strip()]
+    elif export_format == "csv":
+        requested = ["activity_logs"]
+    else:
+        requested = list(EXPORT_TABLES)
+
+    unknown = [table for table in requested if table not in EXPORT_TABLES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown export tables: {', '.join(unknown)}")
+    if export_format == "csv" and len(requested) != 1:
+        raise HTTPException(status_code=400, detail="CSV exports cover exactly one table")
+    return requested
+
 @router.post("/export-data", status_code=200)
 async def export_system_data(
-    current_user: User = Depends(has_role("admin")),
-    db: Session = Depends(get_db),
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    tables: Optional[str] = None,
+    current_user: Principal = Depends(has_role("admin")),
     request: Request = None
 ):
-    """Export system data (admin only)"""
-    # In a real system, you would generate and return actual export data
-    # For this demo, we'll just return a success message
+    """Prepare a system data export (admin only)"""
+    parse_export_tables(tables, format)
     
     # Log the export action
     ip = request.client.host if request else None
     user_agent = request.headers.get("user-agent") if request else None
-    log_activity(
-        db=db,
+    await run_db(
+        log_activity,
         username=current_user.username,
         action="Data export initiated",
         details="System data export started by admin",
@@ -535,12 +761,35 @@ async def export_system_data(
         user_agent=user_agent
     )
     
-    return {"message": "Data export initiated", "download_url": "/api/admin/download-export"}
+    params = {"format": format}
+    if tables:
+        params["tables"] = tables
+    download_url = f"/api/admin/download-export?{urlencode(params)}"
+    return {"message": "Data export initiated", "download_url": download_url}
+
+@router.get("/download-export")
+async def download_export(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    tables: Optional[str] = None,
+    current_user: Principal = Depends(has_role("admin"))
+):
+    """Stream users, roles and activity logs as gzip NDJSON, or one table as gzip CSV (admin only)"""
+    requested = parse_export_tables(tables, format)
+    
+    timestamp = datetime.now(ist).strftime("%Y%m%d-%H%M%S")
+    name = "export" if format == "ndjson" else requested[0]
+    filename = f"{name}-{timestamp}.{format}.gz"
+    
+    return StreamingResponse(
+        stream_export(requested, format, current_user.username),
+        media_type="application/gzip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
 
 @router.post("/cleanup-data", status_code=200)
 async def cleanup_data(
     background_tasks: BackgroundTasks,
-    current_user: User = Depends(has_role("admin"))
+    current_user: Principal = Depends(has_role("admin"))
 ):
     """Clean up old or unused data (admin only)"""
     # In a real system, you would run an actual cleanup process
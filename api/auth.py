@@ -1,13 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Query
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
-from typing import Optional
+from typing import NamedTuple, Optional
 from datetime import datetime, timedelta
+from collections import OrderedDict
 from jose import jwt
+import os
+import threading
+import time
 from pydantic import BaseModel, ConfigDict
 import pytz
 
-from .models import User, get_db, ActivityLog, Role
+from .models import User, get_db, run_db, ActivityLog, Role
+from .events import publish_activity, publish_stats_delta
+from .passwords import hash_password, verify_password
 
 # Router
 router = APIRouter(prefix="/api/auth", tags=["auth"])
@@ -20,6 +26,95 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 # OAuth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/token")
 
+# Resolved principals are cached so hot endpoints skip the JWT decode and user lookup
+PRINCIPAL_CACHE_TTL = float(os.environ.get("PRINCIPAL_CACHE_TTL", 30))  # Seconds
+PRINCIPAL_CACHE_SIZE = int(os.environ.get("PRINCIPAL_CACHE_SIZE", 1024))
+
+class Principal(NamedTuple):
+    """
+    The authenticated caller, as resolved from a token. Read-only and not
+    bound to a session, since it may come from the principal cache: handlers
+    that change the account load the User row in their own session.
+    """
+    id: int
+    username: str
+    email: str
+    role: str
+    is_active: bool
+    created_at: Optional[datetime]
+
+class PrincipalCache:
+    """
+    Bounded LRU cache of token -> Principal with a TTL.
+    Entries never outlive the token they were resolved from, and can be
+    dropped per username when that user is changed.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # token -> (expires_at, principal)
+        self._tokens_by_username = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Optional[Principal]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, principal = entry
+            if expires_at <= time.monotonic():
+                self._remove(token)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return principal
+
+    def set(self, token: str, principal: Principal, token_exp: Optional[float] = None):
+        if self.ttl <= 0 or self.maxsize <= 0:
+            return
+        ttl = self.ttl
+        if token_exp is not None:
+            ttl = min(ttl, token_exp - time.time())
+            if ttl <= 0:
+                return
+        with self._lock:
+            if token in self._entries:
+                self._remove(token)
+            self._entries[token] = (time.monotonic() + ttl, principal)
+            self._tokens_by_username.setdefault(principal.username, set()).add(token)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, username: str):
+        with self._lock:
+            for token in list(self._tokens_by_username.get(username, ())):
+                self._remove(token)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tokens_by_username.clear()
+
+    def _remove(self, token: str):
+        _, principal = self._entries.pop(token)
+        tokens = self._tokens_by_username.get(principal.username)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_username[principal.username]
+
+principal_cache = PrincipalCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL)
+
+def invalidate_principal(*usernames: str):
+    """Drop cached principals for users whose account, role or status changed"""
+    for username in usernames:
+        principal_cache.invalidate(username)
+
 # Models
 class Token(BaseModel):
     access_token: str
@@ -57,32 +152,90 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+def load_principal(db: Session, token: str) -> Optional[Principal]:
+    """
+    The caller a token belongs to, as the users table has them now, or None
+    for an invalid token or unknown user. Cached per token; usable with run_db.
+    """
+    cached = principal_cache.get(token)
+    if cached is not None:
+        return cached
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-        token_data = TokenData(username=username)
     except jwt.JWTError:
-        raise credentials_exception
-    user = db.query(User).filter(User.username == token_data.username).first()
+        return None
+    username = payload.get("sub")
+    if not username:
+        return None
+    user = db.query(User).filter(User.username == username).first()
     if user is None:
-        raise credentials_exception
-    return user
+        return None
+    # The same read-only shape whether or not the cache answered, so no handler relies on a live row
+    principal = Principal(user.id, user.username, user.email, user.role, user.is_active, user.created_at)
+    principal_cache.set(token, principal, payload.get("exp"))
+    return principal
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> Principal:
+    principal = load_principal(db, token)
+    if principal is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return principal
+
+async def token_identity(token: str):
+    """
+    Username and role of the caller, for middleware that picks limits or
+    permissions. The role is read from the users table (through the
+    principal cache), never from the token, so a changed role applies within
+    PRINCIPAL_CACHE_TTL. Returns (None, "anonymous") for invalid tokens,
+    unknown and inactive users.
+    """
+    principal = principal_cache.get(token)
+    if principal is None:
+        principal = await run_db(load_principal, token)
+    if principal is None or not principal.is_active:
+        return None, "anonymous"
+    return principal.username, principal.role
 
-def get_current_active_user(current_user: User = Depends(get_current_user)):
+def token_username(token: str) -> Optional[str]:
+    """Username a valid token was issued to, without touching the database; for logging who called"""
+    cached = principal_cache.get(token)
+    if cached is not None:
+        return cached.username
+    try:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+    except jwt.JWTError:
+        return None
+
+def get_stream_token(request: Request, token: Optional[str] = Query(None)) -> str:
+    """
+    Bearer token for streaming endpoints. Browsers' EventSource cannot set
+    headers, so the token may also be passed as a ?token= query parameter.
+    """
+    auth_header = request.headers.get("Authorization")
+    if auth_header and auth_header.startswith("Bearer "):
+        return auth_header[len("Bearer "):]
+    if token:
+        return token
+    raise HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Not authenticated",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+def get_current_stream_user(token: str = Depends(get_stream_token), db: Session = Depends(get_db)):
+    return get_current_user(token=token, db=db)
+
+def get_current_active_user(current_user: Principal = Depends(get_current_user)):
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
 def has_role(role: str):
-    def role_checker(current_user: User = Depends(get_current_active_user)):
+    def role_checker(current_user: Principal = Depends(get_current_active_user)):
         # Admin can access everything
         if current_user.role == "admin":
             return current_user
@@ -134,6 +287,19 @@ def log_activity(
         db.commit()
         
         print(f"Activity log created successfully: {activity_log.id}")
+        
+        # Push the new entry to admins watching the live feed
+        publish_activity({
+            "id": activity_log.id,
+            "username": username,
+            "action": action,
+            "details": details,
+            "timestamp": now.isoformat(),
+            "ip_address": ip_address,
+            "user_agent": user_agent,
+            "page_url": page_url
+        })
+        publish_stats_delta(total_activity_logs=1)
     except Exception as e:
         import logging
         logging.error(f"Failed to log activity: {str(e)}")
@@ -160,11 +326,10 @@ def validate_role(role_name: str, db: Session):
 @router.post("/token", response_model=Token)
 async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db),
     request: Request = None
 ):
-    user = db.query(User).filter(User.username == form_data.username).first()
-    if not user or not user.verify_password(form_data.password):
+    user = await run_db(lambda db: db.query(User).filter(User.username == form_data.username).first())
+    if not user or not await verify_password(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -179,8 +344,8 @@ async def login_for_access_token(
     print(f"Logging login activity for user: {user.username}")
     
     # Explicitly use the user's username, not "system"
-    log_activity(
-        db=db,
+    await run_db(
+        log_activity,
         username=user.username,  # Use the actual username, not "system"
         action="Login",
         details=f"User {user.username} logged in successfully",
@@ -189,6 +354,7 @@ async def login_for_access_token(
     )
     
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    # No role claim: it would outlive a role change for the token's lifetime, so roles come from the database
     access_token = create_access_token(
         data={"sub": user.username}, expires_delta=access_token_expires
     )
@@ -203,63 +369,67 @@ async def login_for_access_token(
 @router.post("/register", response_model=UserResponse)
 async def register_user(
     user_data: UserCreate,
-    db: Session = Depends(get_db),
     request: Request = None
 ):
-    # Check if username exists
-    db_user = db.query(User).filter(User.username == user_data.username).first()
-    if db_user:
-        raise HTTPException(status_code=400, detail="Username already registered")
-    
-    # Check if email exists
-    db_email = db.query(User).filter(User.email == user_data.email).first()
-    if db_email:
-        raise HTTPException(status_code=400, detail="Email already registered")
-    
-    # Validate role
-    validate_role(user_data.role, db)
-    
-    # Create new user
-    hashed_password = User.get_password_hash(user_data.password)
-    db_user = User(
-        username=user_data.username,
-        email=user_data.email,
-        hashed_password=hashed_password,
-        role=user_data.role
-    )
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    def check_available(db: Session):
+        # Check if username exists
+        db_user = db.query(User).filter(User.username == user_data.username).first()
+        if db_user:
+            raise HTTPException(status_code=400, detail="Username already registered")
+        
+        # Check if email exists
+        db_email = db.query(User).filter(User.email == user_data.email).first()
+        if db_email:
+            raise HTTPException(status_code=400, detail="Email already registered")
+        
+        # Validate role
+        validate_role(user_data.role, db)
     
-    # Log the registration activity
+    await run_db(check_available)
+    hashed_password = await hash_password(user_data.password)
     ip = request.client.host if request else None
     user_agent = request.headers.get("user-agent") if request else None
-    log_activity(
-        db=db,
-        username=db_user.username,
-        action="Registration",
-        details="User registered successfully",
-        ip_address=ip,
-        user_agent=user_agent
-    )
     
-    return db_user
+    def create(db: Session):
+        # Create new user
+        db_user = User(
+            username=user_data.username,
+            email=user_data.email,
+            hashed_password=hashed_password,
+            role=user_data.role
+        )
+        db.add(db_user)
+        db.commit()
+        db.refresh(db_user)
+        publish_stats_delta(total_users=1, active_users=1 if db_user.is_active else 0)
+        
+        # Log the registration activity
+        log_activity(
+            db=db,
+            username=db_user.username,
+            action="Registration",
+            details="User registered successfully",
+            ip_address=ip,
+            user_agent=user_agent
+        )
+        return db_user
+    
+    return await run_db(create)
 
 @router.get("/me", response_model=UserResponse)
-async def read_users_me(current_user: User = Depends(get_current_active_user)):
+async def read_users_me(current_user: Principal = Depends(get_current_active_user)):
     return current_user
 
 @router.post("/logout")
 async def logout(
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_active_user),
     request: Request = None
 ):
     # Log the logout activity
     ip = request.client.host if request else None
     user_agent = request.headers.get("user-agent") if request else None
-    log_activity(
-        db=db,
+    await run_db(
+        log_activity,
         username=current_user.username,
         action="Logout",
         details="User logged out",
@@ -0,0 +1,293 @@
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+import pytz
+
+from .models import DATABASE_PATH
+
+# Backup configuration
+BACKUP_DIR = Path(os.environ.get("BACKUP_DIR", Path(__file__).parent / "backups"))
+BACKUP_RETENTION = int(os.environ.get("BACKUP_RETENTION", 7))  # Number of backups to keep
+BACKUP_PAGES_PER_STEP = 256  # Pages copied per backup step; the source is only locked during a step
+BACKUP_STEP_PAUSE = 0.005  # Seconds between steps so writers can get in
+BACKUP_MAX_RESTARTS = 5  # Restarts (caused by concurrent writes) tolerated before copying in one step
+BACKUP_STATUS_FILE = BACKUP_DIR / "status.json"  # Shares progress with the other workers
+BACKUP_STATUS_STALE_SECONDS = 120  # A "running" status not updated for this long was left by a dead worker
+
+ist = pytz.timezone('Asia/Kolkata')
+
+# Status of the most recent backup run by this worker
+backup_status: Dict[str, Any] = {
+    "state": "idle",
+    "progress": 0.0,
+    "started_at": None,
+    "finished_at": None,
+    "duration_seconds": None,
+    "file": None,
+    "size_bytes": None,
+    "error": None,
+}
+
+_backup_lock = threading.Lock()
+_status_written_at = 0.0
+
+class BackupInProgressError(Exception):
+    pass
+
+class BackupNotSupportedError(Exception):
+    pass
+
+class _TooManyRestarts(Exception):
+    pass
+
+def _table_counts(conn: sqlite3.Connection) -> Dict[str, int]:
+    tables = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+    )]
+    return {table: conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0] for table in tables}
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _update_status(force: bool = True, **changes):
+    """Update this worker's status and mirror it to BACKUP_STATUS_FILE (progress at most twice a second)"""
+    global _status_written_at
+    backup_status.update(changes)
+    now = time.time()
+    if not force and now - _status_written_at < 0.5:
+        return
+    _status_written_at = now
+    try:
+        BACKUP_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_path = BACKUP_STATUS_FILE.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({**backup_status, "updated_at": now}, f)
+        os.replace(tmp_path, BACKUP_STATUS_FILE)
+    except OSError as e:
+        print(f"Error writing backup status: {e}")
+
+def current_backup_status() -> Dict[str, Any]:
+    """Status of the most recent backup started by any worker"""
+    try:
+        with open(BACKUP_STATUS_FILE) as f:
+            status = json.load(f)
+    except (OSError, ValueError):
+        return backup_status
+    updated_at = status.pop("updated_at", 0)
+    if status["state"] == "running" and time.time() - updated_at > BACKUP_STATUS_STALE_SECONDS:
+        status.update({"state": "failed", "error": "Backup was interrupted"})
+    return status
+
+def _manifest_path(backup_path: Path) -> Path:
+    return backup_path.with_name(backup_path.name[:-len(".db.gz")] + ".json")
+
+def _copy_database(source_path: str, target_path: str):
+    """
+    Copy the live database with the SQLite online backup API.
+    Pages are copied in small steps so writers are only held off for the
+    duration of one step rather than the whole backup. If a busy writer keeps
+    restarting the paged copy, fall back to copying in a single step.
+    """
+    restarts = 0
+    last_remaining = None
+
+    def progress(status, remaining, total):
+        nonlocal restarts, last_remaining
+        # A concurrent write restarts the backup, which shows up as remaining going back up
+        if last_remaining is not None and remaining > last_remaining:
+            restarts += 1
+            if restarts > BACKUP_MAX_RESTARTS:
+                raise _TooManyRestarts()
+        last_remaining = remaining
+        _update_status(force=False, progress=round((total - remaining) / total, 4) if total else 1.0)
+        time.sleep(BACKUP_STEP_PAUSE)
+
+    source = sqlite3.connect(source_path, timeout=30)
+    target = sqlite3.connect(target_path)
+    try:
+        try:
+            source.backup(target, pages=BACKUP_PAGES_PER_STEP, progress=progress)
+        except _TooManyRestarts:
+            print(f"Backup restarted {restarts} times due to concurrent writes, copying in one step")
+            source.backup(target)
+            _update_status(progress=1.0)
+    finally:
+        target.close()
+        source.close()
+
+def _apply_retention():
+    backups = list_backups()
+    for backup in backups[BACKUP_RETENTION:]:
+        path = BACKUP_DIR / backup["file"]
+        path.unlink(missing_ok=True)
+        _manifest_path(path).unlink(missing_ok=True)
+
+def create_backup() -> Dict[str, Any]:
+    """
+    Create a compressed backup of the application database.
+    Raises BackupInProgressError if another backup is already running.
+    """
+    if DATABASE_PATH is None:
+        raise BackupNotSupportedError("Online backups are only available for SQLite; back up server databases with their own tools (e.g. pg_dump)")
+    if not _backup_lock.acquire(blocking=False):
+        raise BackupInProgressError("A backup is already running")
+
+    started = time.perf_counter()
+    _update_status(
+        state="running",
+        progress=0.0,
+        started_at=datetime.now(ist).strftime("%Y-%m-%d %H:%M:%S"),
+        finished_at=None,
+        duration_seconds=None,
+        file=None,
+        size_bytes=None,
+        error=None,
+    )
+
+    try:
+        BACKUP_DIR.mkdir(parents=True, exist_ok=True)
+        name = f"backup-{datetime.now(ist).strftime('%Y%m%d-%H%M%S-%f')}"
+        backup_path = BACKUP_DIR / f"{name}.db.gz"
+
+        with tempfile.TemporaryDirectory(dir=BACKUP_DIR) as tmp_dir:
+            raw_path = os.path.join(tmp_dir, f"{name}.db")
+            _copy_database(DATABASE_PATH, raw_path)
+
+            conn = sqlite3.connect(raw_path)
+            try:
+                counts = _table_counts(conn)
+            finally:
+                conn.close()
+
+            with open(raw_path, "rb") as src, gzip.open(backup_path, "wb", compresslevel=6) as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+
+        duration = round(time.perf_counter() - started, 3)
+        manifest = {
+            "file": backup_path.name,
+            "created_at": backup_status["started_at"],
+            "duration_seconds": duration,
+            "size_bytes": backup_path.stat().st_size,
+            "sha256": _sha256(backup_path),
+            "table_counts": counts,
+        }
+        with open(_manifest_path(backup_path), "w") as f:
+            json.dump(manifest, f, indent=2)
+
+        _apply_retention()
+
+        _update_status(
+            state="completed",
+            progress=1.0,
+            finished_at=datetime.now(ist).strftime("%Y-%m-%d %H:%M:%S"),
+            duration_seconds=duration,
+            file=backup_path.name,
+            size_bytes=manifest["size_bytes"],
+        )
+        return manifest
+    except Exception as e:
+        _update_status(
+            state="failed",
+            finished_at=datetime.now(ist).strftime("%Y-%m-%d %H:%M:%S"),
+            duration_seconds=round(time.perf_counter() - started, 3),
+            error=str(e),
+        )
+        raise
+    finally:
+        _backup_lock.release()
+
+def list_backups() -> List[Dict[str, Any]]:
+    """List available backups, newest first"""
+    if not BACKUP_DIR.exists():
+        return []
+
+    backups = []
+    for path in sorted(BACKUP_DIR.glob("backup-*.db.gz"), reverse=True):
+        manifest_path = _manifest_path(path)
+        manifest = {}
+        if manifest_path.exists():
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        backups.append({
+            "file": path.name,
+            "created_at": manifest.get("created_at"),
+            "duration_seconds": manifest.get("duration_seconds"),
+            "size_bytes": path.stat().st_size,
+            "table_counts": manifest.get("table_counts"),
+        })
+    return backups
+
+def resolve_backup(name: str) -> Optional[Path]:
+    """Return the path of a backup by file name, refusing anything outside the backup directory"""
+    if "/" in name or "\\" in name or not name.endswith(".db.gz"):
+        return None
+    path = BACKUP_DIR / name
+    return path if path.exists() else None
+
+def verify_backup(name: str) -> Dict[str, Any]:
+    """
+    Check that a backup can be restored: the checksum matches its manifest,
+    the decompressed database passes an integrity check and the table row
+    counts match the ones recorded when the backup was taken.
+    """
+    path = resolve_backup(name)
+    if path is None:
+        raise FileNotFoundError(name)
+
+    manifest_path = _manifest_path(path)
+    manifest = {}
+    if manifest_path.exists():
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    result = {"file": name, "checksum_ok": None, "integrity_ok": False, "counts_ok": None, "errors": []}
+
+    if manifest.get("sha256"):
+        result["checksum_ok"] = _sha256(path) == manifest["sha256"]
+        if not result["checksum_ok"]:
+            result["errors"].append("Checksum does not match manifest")
+
+    with tempfile.TemporaryDirectory(dir=BACKUP_DIR) as tmp_dir:
+        restored_path = os.path.join(tmp_dir, "restore-check.db")
+        try:
+            with gzip.open(path, "rb") as src, open(restored_path, "wb") as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+        except (OSError, EOFError) as e:
+            result["errors"].append(f"Could not decompress backup: {e}")
+            result["verified"] = False
+            return result
+
+        conn = sqlite3.connect(restored_path)
+        try:
+            integrity = conn.execute("PRAGMA integrity_check").fetchone()[0]
+            result["integrity_ok"] = integrity == "ok"
+            if not result["integrity_ok"]:
+                result["errors"].append(f"Integrity check failed: {integrity}")
+
+            counts = _table_counts(conn)
+            result["table_counts"] = counts
+            if manifest.get("table_counts") is not None:
+                result["counts_ok"] = counts == manifest["table_counts"]
+                if not result["counts_ok"]:
+                    result["errors"].append("Table row counts do not match manifest")
+        except sqlite3.DatabaseError as e:
+            result["errors"].append(f"Backup is not a valid database: {e}")
+        finally:
+            conn.close()
+
+    result["verified"] = not result["errors"]
+    return result
@@ -0,0 +1 @@
+# Micro-benchmarks for the API; run each module with python -m api.benchmarks.<name>
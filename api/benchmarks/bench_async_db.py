@@ -0,0 +1,133 @@
+"""
+Latency of async handlers that query inline versus through run_db.
+
+Requests for a dashboard-style query endpoint arrive at a fixed rate,
+interleaved with pings of a handler that does no database work. Inline
+queries stall the event loop, so the pings (and every other request)
+queue behind them.
+Runs against a scratch SQLite database.
+
+    python -m api.benchmarks.bench_async_db [--seconds 5] [--rate 200]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from datetime import datetime
+
+SEED_ROWS = 20000
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+def build_app():
+    from sqlalchemy import desc, func
+    from starlette.applications import Starlette
+    from starlette.responses import JSONResponse, PlainTextResponse
+    from starlette.routing import Route
+
+    from ..models import SessionLocal, ActivityLog, run_db
+
+    def dashboard(db):
+        total = db.query(func.count(ActivityLog.id)).scalar()
+        recent = db.query(ActivityLog).order_by(desc(ActivityLog.timestamp)).limit(50).all()
+        return {"total": total, "recent": len(recent)}
+
+    async def inline(request):
+        db = SessionLocal()
+        try:
+            return JSONResponse(dashboard(db))
+        finally:
+            db.close()
+
+    async def offloaded(request):
+        return JSONResponse(await run_db(dashboard))
+
+    async def ping(request):
+        return PlainTextResponse("pong")
+
+    return Starlette(routes=[Route("/inline", inline), Route("/offloaded", offloaded), Route("/ping", ping)])
+
+async def call(app, path: str, arrived: float, latencies: list):
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+        "root_path": "", "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 1234), "server": ("bench", 80),
+    }
+    body_sent = False
+    response_done = asyncio.Event()
+
+    async def receive():
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await response_done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body" and not message.get("more_body", False):
+            response_done.set()
+
+    await app(scope, receive, send)
+    # Measured from the scheduled arrival, so time spent queued behind a blocked loop counts
+    latencies.append(time.perf_counter() - arrived)
+
+async def run(app, path: str, seconds: float, rate: float):
+    """Open-loop load: query and ping requests arrive on a fixed schedule regardless of progress"""
+    query_latencies, ping_latencies = [], []
+    tasks = []
+    started = time.perf_counter()
+    interval = 1.0 / rate
+    for i in range(int(seconds * rate)):
+        arrived = started + i * interval
+        delay = arrived - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(call(app, path, arrived, query_latencies)))
+        tasks.append(asyncio.create_task(call(app, "/ping", arrived, ping_latencies)))
+    await asyncio.gather(*tasks)
+    return {
+        "query p50 ms": percentile(query_latencies, 50) * 1000,
+        "query p99 ms": percentile(query_latencies, 99) * 1000,
+        "ping p50 ms": percentile(ping_latencies, 50) * 1000,
+        "ping p99 ms": percentile(ping_latencies, 99) * 1000,
+    }
+
+async def main(seconds: float, rate: float):
+    app = build_app()
+    results = {}
+    for name, path in (("inline", "/inline"), ("run_db", "/offloaded")):
+        await run(app, path, 0.5, rate)  # Warm up
+        results[name] = await run(app, path, seconds, rate)
+    print(f"{'':<14}" + "".join(f"{name:>12}" for name in results))
+    for metric in results["inline"]:
+        print(f"{metric:<14}" + "".join(f"{result[metric]:>12,.1f}" for result in results.values()))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--rate", type=float, default=200, help="query requests per second")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Point the application engine at a scratch database before it is imported
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+        from ..models import Base, SessionLocal, ActivityLog, engine
+
+        Base.metadata.create_all(bind=engine)
+        db = SessionLocal()
+        db.bulk_save_objects([
+            ActivityLog(username=f"user{i % 50}", action="Page visit", details="seed", timestamp=datetime.utcnow())
+            for i in range(SEED_ROWS)
+        ])
+        db.commit()
+        db.close()
+
+        asyncio.run(main(args.seconds, args.rate))
+        engine.dispose()
@@ -0,0 +1,112 @@
+"""
+Running time of the graph analytics on synthetic graphs.
+
+Each graph has one node per 3 edges, with targets skewed towards low ids
+as in bench_graph_traversal. PageRank and one betweenness search are
+compared against straightforward loops over Python adjacency lists, up to
+--python-limit edges, and checked to agree with them.
+
+    python -m api.benchmarks.bench_graph_analytics [--edges 300000 3000000] [--samples 32]
+"""
+import argparse
+import collections
+import time
+
+import numpy as np
+
+from ..graph_analytics import betweenness, degree_centrality, graph_arrays, label_propagation, modularity, pagerank
+from ..graph_store import GraphStore
+
+def build_graph(edges: int, seed: int = 0) -> GraphStore:
+    rng = np.random.default_rng(seed)
+    nodes = max(edges // 3, 3)
+    store = GraphStore()
+    store.add_nodes([f"node {i}" for i in range(nodes)], ["Entity"] * nodes)
+    src = rng.integers(0, nodes, edges)
+    dst = (nodes * rng.random(edges) ** 3).astype(np.int64)
+    store.add_edges(src, dst, ["related to"] * edges)
+    return store
+
+def python_pagerank(nodes: int, src, dst, iterations: int, damping: float = 0.85):
+    out = collections.Counter(src)
+    rank = [1.0 / nodes] * nodes
+    for _ in range(iterations):
+        dangling = sum(rank[node] for node in range(nodes) if not out[node])
+        new_rank = [(1 - damping) / nodes + damping * dangling / nodes] * nodes
+        for s, d in zip(src, dst):
+            new_rank[d] += damping * rank[s] / out[s]
+        rank = new_rank
+    return np.array(rank)
+
+def python_dependencies(adjacency, nodes: int, source: int):
+    """Brandes' single-source dependencies with a queue, what a straightforward implementation would do"""
+    order, parents = [], collections.defaultdict(list)
+    paths, distance = [0] * nodes, [-1] * nodes
+    paths[source], distance[source] = 1, 0
+    queue = collections.deque([source])
+    while queue:
+        node = queue.popleft()
+        order.append(node)
+        for neighbor in adjacency[node]:
+            if distance[neighbor] < 0:
+                distance[neighbor] = distance[node] + 1
+                queue.append(neighbor)
+            if distance[neighbor] == distance[node] + 1:
+                paths[neighbor] += paths[node]
+                parents[neighbor].append(node)
+    dependency = [0.0] * nodes
+    for node in reversed(order):
+        for parent in parents[node]:
+            dependency[parent] += paths[parent] / paths[node] * (1 + dependency[node])
+    dependency[source] = 0.0
+    return np.array(dependency)
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def run(edges: int, samples: int, python_limit: int):
+    store = build_graph(edges)
+    graph, load = timed(graph_arrays, store)
+    nodes = store.node_count
+    result = {"edges": edges, "arrays s": load}
+    _, result["degree s"] = timed(degree_centrality, graph)
+    rank, result["pagerank s"] = timed(pagerank, graph, tolerance=0, max_iterations=20)
+    _, result["between. s"] = timed(betweenness, graph, samples)
+    result["per search s"] = result["between. s"] / min(samples, nodes)
+    community, result["communities s"] = timed(label_propagation, graph)
+    result["communities"] = float(community.max() + 1)
+    result["modularity"] = modularity(graph, community)
+
+    if edges <= python_limit:
+        src, dst = graph.src.tolist(), graph.dst.tolist()
+        expected, result["py pagerank s"] = timed(python_pagerank, nodes, src, dst, 20)
+        assert np.allclose(rank, expected)
+        adjacency = collections.defaultdict(list)
+        for s, d in zip(src, dst):
+            adjacency[s].append(d)
+            adjacency[d].append(s)
+        # betweenness draws its sources the same way; with one source it is that source's dependencies, scaled
+        source = int(np.random.default_rng(0).choice(np.flatnonzero(graph.alive), 1, replace=False)[0])
+        expected, result["py search s"] = timed(python_dependencies, adjacency, nodes, source)
+        assert np.allclose(betweenness(graph, 1), expected * nodes / ((nodes - 1) * (nodes - 2)))
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--edges", type=int, nargs="+", default=[300_000, 3_000_000])
+    parser.add_argument("--samples", type=int, default=32)
+    parser.add_argument("--python-limit", type=int, default=300_000, help="largest graph to run the Python loops on")
+    args = parser.parse_args()
+
+    results = [run(edges, args.samples, args.python_limit) for edges in args.edges]
+    print(f"{'':<16}" + "".join(f"{result['edges']:>14,}" for result in results))
+    for metric in results[0]:
+        if metric == "edges":
+            continue
+        cells = "".join(f"{result[metric]:>14,.3f}" if metric in result else f"{'-':>14}" for result in results)
+        print(f"{metric:<16}" + cells)
+
+if __name__ == "__main__":
+    main()
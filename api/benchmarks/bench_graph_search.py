@@ -0,0 +1,86 @@
+"""
+Latency of node label search on synthetic graphs.
+
+Labels are two words from a small vocabulary and a number ("Maria Garcia
+48213"), so every trigram of the words is shared by a large share of the
+labels; real labels are more varied, which makes fuzzy search cheaper.
+Compared against a linear scan over the labels.
+
+    python -m api.benchmarks.bench_graph_search [--nodes 100000 1000000] [--queries 20]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from ..graph_search import SearchIndex, normalize
+from ..graph_store import GraphStore
+
+WORDS = (
+    "alpha", "beta", "gamma", "delta", "acme", "corp", "new", "york", "london", "paris", "john", "smith",
+    "maria", "garcia", "institute", "bank", "river", "north", "south", "labs", "systems", "energy", "health",
+)
+
+def build_graph(nodes: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    words = np.array([word.title() for word in WORDS], dtype=object)
+    first = words[rng.integers(0, len(words), nodes)]
+    second = words[rng.integers(0, len(words), nodes)]
+    labels = [f"{a} {b} {n}" for a, b, n in zip(first, second, rng.integers(0, 10 ** 6, nodes).tolist())]
+    store = GraphStore()
+    store.add_nodes(labels, ["Entity"] * nodes)
+    return store, labels
+
+def queries(labels, count: int, seed: int = 1):
+    """Prefixes of existing labels, and the same with two letters swapped (typos)"""
+    rng = np.random.default_rng(seed)
+    prefixes, typos = [], []
+    for i in rng.integers(0, len(labels), count).tolist():
+        text = labels[i][:rng.integers(3, len(labels[i]) + 1)]
+        prefixes.append(text)
+        swap = int(rng.integers(0, len(text) - 1))
+        typos.append(text[:swap] + text[swap + 1] + text[swap] + text[swap + 2:])
+    return prefixes, typos
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
+
+def run(nodes: int, count: int):
+    store, labels = build_graph(nodes)
+    index = SearchIndex(store)
+    _, build = timed(index.ensure)
+    prefixes, typos = queries(labels, count)
+    normalized = [normalize(label) for label in labels]
+
+    result = {"nodes": nodes, "build s": build / 1000, "prefix ms": [], "fuzzy ms": [], "auto typo ms": [], "scan ms": []}
+    for prefix, typo in zip(prefixes, typos):
+        hits, ms = timed(index.search, prefix, 10, "prefix")
+        result["prefix ms"].append(ms)
+        assert hits and all(normalize(hit["label"]).startswith(normalize(prefix)) for hit in hits)
+        _, ms = timed(index.search, prefix, 10, "fuzzy")
+        result["fuzzy ms"].append(ms)
+        _, ms = timed(index.search, typo, 10, "auto")
+        result["auto typo ms"].append(ms)
+        text = normalize(prefix)
+        _, ms = timed(lambda: sorted(label for label in normalized if label.startswith(text))[:10])
+        result["scan ms"].append(ms)
+    return {key: float(np.median(value)) if isinstance(value, list) else value for key, value in result.items()}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--nodes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--queries", type=int, default=20)
+    args = parser.parse_args()
+
+    results = [run(nodes, args.queries) for nodes in args.nodes]
+    print("Medians per query")
+    print(f"{'':<14}" + "".join(f"{result['nodes']:>14,}" for result in results))
+    for metric in results[0]:
+        if metric == "nodes":
+            continue
+        print(f"{metric:<14}" + "".join(f"{result[metric]:>14,.2f}" for result in results))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Latency of the graph traversal queries on synthetic graphs.
+
+Each graph has one node per 8 edges; sources are uniform and targets
+skewed towards low ids, so a few hubs collect most edges, as in real
+knowledge graphs. Shortest paths are compared against one-sided array BFS
+and, up to --python-limit edges, against BFS over Python adjacency lists.
+
+    python -m api.benchmarks.bench_graph_traversal [--edges 100000 1000000 10000000] [--queries 20]
+"""
+import argparse
+import collections
+import time
+
+import numpy as np
+
+from ..graph_store import GraphStore
+from ..graph_traversal import _expand, k_hop, neighbors, shortest_path
+
+EDGE_LABELS = ("knows", "works at", "lives in", "hosts")
+
+def build_graph(edges: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    nodes = max(edges // 8, 2)
+    store = GraphStore()
+    store.add_nodes([f"node {i}" for i in range(nodes)], ["Entity"] * nodes)
+    src = rng.integers(0, nodes, edges)
+    dst = (nodes * rng.random(edges) ** 3).astype(np.int64)
+    labels = np.array(EDGE_LABELS, dtype=object)[rng.integers(0, len(EDGE_LABELS), edges)].tolist()
+    store.add_edges(src, dst, labels)
+    return store, src, dst
+
+def one_sided_path_length(store: GraphStore, source: int, target: int):
+    """Plain level-synchronous BFS from the source only, on the same arrays"""
+    csr = store.csr("both")
+    seen = np.zeros(store.node_capacity, dtype=np.bool_)
+    seen[source] = True
+    frontier = np.array([source], dtype=np.int32)
+    depth = 0
+    while len(frontier):
+        depth += 1
+        _, found, _ = _expand(store, csr, frontier, None)
+        frontier = np.unique(found[~seen[found]])
+        seen[frontier] = True
+        if seen[target]:
+            return depth
+    return None
+
+def python_path_length(adjacency, source: int, target: int):
+    """BFS over a dict of Python lists, what a straightforward implementation would do"""
+    distance = {source: 0}
+    queue = collections.deque([source])
+    while queue:
+        node = queue.popleft()
+        for neighbor in adjacency[node]:
+            if neighbor not in distance:
+                distance[neighbor] = distance[node] + 1
+                if neighbor == target:
+                    return distance[neighbor]
+                queue.append(neighbor)
+    return None
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
+
+def run(edges: int, queries: int, python_limit: int):
+    start = time.perf_counter()
+    store, src, dst = build_graph(edges)
+    for direction in ("out", "in", "both"):
+        store.csr(direction)
+    build = time.perf_counter() - start
+
+    rng = np.random.default_rng(1)
+    nodes = store.node_capacity
+    pairs = rng.integers(0, nodes, (queries, 2)).tolist()
+    result = {
+        "edges": edges,
+        "build s": build,
+        "array MB": store.memory_bytes() / 1e6,
+        "neighbors ms": [],
+        "2-hop ms": [],
+        "2-hop nodes": [],
+        "path ms": [],
+        "one-sided ms": [],
+        "python ms": [],
+    }
+
+    adjacency = None
+    if edges <= python_limit:
+        adjacency = collections.defaultdict(list)
+        for s, d in zip(src.tolist(), dst.tolist()):
+            adjacency[s].append(d)
+            adjacency[d].append(s)
+
+    for source, target in pairs:
+        _, ms = timed(neighbors, store, source, ["knows"])
+        result["neighbors ms"].append(ms)
+        ego, ms = timed(k_hop, store, source, 2)
+        result["2-hop ms"].append(ms)
+        result["2-hop nodes"].append(len(ego["nodes"]))
+        path, ms = timed(shortest_path, store, source, target, max_hops=20)
+        result["path ms"].append(ms)
+        length, ms = timed(one_sided_path_length, store, source, target)
+        result["one-sided ms"].append(ms)
+        assert length == path["length"], (source, target, length, path["length"])
+        if adjacency is not None:
+            length, ms = timed(python_path_length, adjacency, source, target)
+            result["python ms"].append(ms)
+            assert length == path["length"]
+
+    return {key: float(np.median(value)) if isinstance(value, list) and value else value for key, value in result.items()}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--edges", type=int, nargs="+", default=[100_000, 1_000_000, 10_000_000])
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--python-limit", type=int, default=1_000_000, help="largest graph to run the Python BFS on")
+    args = parser.parse_args()
+
+    results = [run(edges, args.queries, args.python_limit) for edges in args.edges]
+    print("Medians per query")
+    print(f"{'':<14}" + "".join(f"{result['edges']:>14,}" for result in results))
+    for metric in results[0]:
+        if metric == "edges":
+            continue
+        cells = "".join(
+            f"{result[metric]:>14,.2f}" if isinstance(result[metric], float) else f"{'-':>14}" for result in results
+        )
+        print(f"{metric:<14}" + cells)
+
+if __name__ == "__main__":
+    main()
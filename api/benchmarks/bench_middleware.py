@@ -0,0 +1,102 @@
+"""
+Compare the old BaseHTTPMiddleware activity logger with the pure-ASGI one.
+
+Requests are driven straight through the ASGI interface, so the numbers
+measure middleware overhead rather than networking.
+
+    python -m api.benchmarks.bench_middleware [--requests 5000]
+"""
+import argparse
+import asyncio
+import time
+
+from starlette.applications import Starlette
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+from ..middleware import ActivityLoggerMiddleware
+
+STREAM_CHUNKS = 64
+STREAM_CHUNK_SIZE = 64 * 1024
+
+class NullSink:
+    def put(self, event):
+        pass
+
+class LegacyActivityLoggerMiddleware(BaseHTTPMiddleware):
+    """The previous implementation, minus the database write"""
+
+    async def dispatch(self, request, call_next):
+        path = request.url.path
+        if path.startswith("/static/") or path.endswith((".ico", ".png", ".jpg", ".css", ".js")):
+            return await call_next(request)
+        response = await call_next(request)
+        if 200 <= response.status_code < 300 and not path.startswith("/api/"):
+            request.headers.get("Authorization")
+            request.headers.get("user-agent")
+        return response
+
+async def page(request):
+    return PlainTextResponse("ok")
+
+async def stream(request):
+    async def body():
+        chunk = b"x" * STREAM_CHUNK_SIZE
+        for _ in range(STREAM_CHUNKS):
+            yield chunk
+    return StreamingResponse(body())
+
+def build_app(wrapper):
+    app = Starlette(routes=[Route("/page", page), Route("/stream", stream)])
+    return wrapper(app)
+
+async def run(app, path: str, requests: int) -> float:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+        "root_path": "", "headers": [(b"host", b"bench"), (b"user-agent", b"bench")],
+        "client": ("127.0.0.1", 1234), "server": ("bench", 80),
+    }
+
+    started = time.perf_counter()
+    for _ in range(requests):
+        body_sent = False
+        response_done = asyncio.Event()
+
+        async def receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            # Like a real server, report the disconnect once the response is complete
+            await response_done.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                response_done.set()
+
+        await app(dict(scope), receive, send)
+    return requests / (time.perf_counter() - started)
+
+async def main(requests: int):
+    variants = {
+        "BaseHTTPMiddleware (before)": build_app(LegacyActivityLoggerMiddleware),
+        "pure ASGI (after)": build_app(lambda app: ActivityLoggerMiddleware(app, sink=NullSink())),
+    }
+    for path, count in (("/page", requests), ("/stream", max(1, requests // 10))):
+        print(f"{path}:")
+        results = {}
+        for name, app in variants.items():
+            await run(app, path, min(count, 100))  # Warm up
+            results[name] = await run(app, path, count)
+            print(f"  {name:<28} {results[name]:>10,.0f} req/s")
+        before, after = results.values()
+        print(f"  speedup: {after / before:.2f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests))
@@ -0,0 +1,107 @@
+"""
+Mixed read/write throughput of the SQLite storage profiles.
+
+Reader threads run the admin dashboard queries (counts and a page of recent
+activity) while writer threads insert activity logs, against a scratch copy
+of the schema for each profile.
+
+    python -m api.benchmarks.bench_storage [--seconds 5] [--readers 8] [--writers 2]
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import desc, func
+from sqlalchemy.orm import sessionmaker
+
+from ..models import Base, ActivityLog, User, build_engine
+
+SEED_ROWS = 20000
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+def run_profile(profile: str, seconds: float, readers: int, writers: int):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine = build_engine(f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}", profile)
+        Base.metadata.create_all(bind=engine)
+        Session = sessionmaker(bind=engine)
+
+        db = Session()
+        db.bulk_save_objects([
+            ActivityLog(username=f"user{i % 50}", action="Page visit", details="seed", timestamp=datetime.utcnow())
+            for i in range(SEED_ROWS)
+        ])
+        db.add(User(username="bench", email="bench@example.com", hashed_password="x"))
+        db.commit()
+        db.close()
+
+        stop = threading.Event()
+        read_latencies, write_latencies, errors = [], [], []
+
+        def reader():
+            session = Session()
+            while not stop.is_set():
+                started = time.perf_counter()
+                try:
+                    session.query(func.count(User.id)).scalar()
+                    session.query(func.count(ActivityLog.id)).scalar()
+                    session.query(ActivityLog).order_by(desc(ActivityLog.timestamp)).limit(50).all()
+                    session.rollback()
+                    read_latencies.append(time.perf_counter() - started)
+                except Exception as e:
+                    errors.append(e)
+                    session.rollback()
+            session.close()
+
+        def writer():
+            session = Session()
+            while not stop.is_set():
+                started = time.perf_counter()
+                try:
+                    session.add(ActivityLog(username="writer", action="Page visit", details="bench", timestamp=datetime.utcnow()))
+                    session.commit()
+                    write_latencies.append(time.perf_counter() - started)
+                except Exception as e:
+                    errors.append(e)
+                    session.rollback()
+            session.close()
+
+        threads = [threading.Thread(target=reader) for _ in range(readers)]
+        threads += [threading.Thread(target=writer) for _ in range(writers)]
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        engine.dispose()
+
+    return {
+        "reads/s": len(read_latencies) / seconds,
+        "writes/s": len(write_latencies) / seconds,
+        "read p99 ms": percentile(read_latencies, 99) * 1000,
+        "write p99 ms": percentile(write_latencies, 99) * 1000,
+        "errors": len(errors),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    args = parser.parse_args()
+
+    results = {profile: run_profile(profile, args.seconds, args.readers, args.writers) for profile in ("default", "production")}
+    print(f"{'':<14}" + "".join(f"{profile:>14}" for profile in results))
+    for metric in next(iter(results.values())):
+        print(f"{metric:<14}" + "".join(f"{result[metric]:>14,.1f}" for result in results.values()))
+
+if __name__ == "__main__":
+    main()
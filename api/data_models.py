@@ -42,6 +42,116 @@ class GraphMetrics(BaseModel):
     total_edges: int
     density: float
     avg_degree: float
+    max_degree: int = 0
+    isolated_nodes: int = 0
+    connected_components: int = 0
+    largest_component: int = 0
+    degree_distribution: List[List[int]] = []  # [degree, node count] pairs
+
+class GraphSubgraph(BaseModel):
+    nodes: List[GraphNode]
+    edges: List[GraphEdge]
+    truncated: bool = False
+
+class NeighborhoodNode(GraphNode):
+    distance: int  # Hops from the center
+
+class GraphNeighborhood(BaseModel):
+    center: int
+    hops: int
+    nodes: List[NeighborhoodNode]
+    edges: List[GraphEdge]
+    truncated: bool = False
+
+class GraphPath(BaseModel):
+    found: bool
+    length: Optional[int] = None  # Number of edges
+    nodes: List[GraphNode]  # In path order
+    edges: List[GraphEdge]
+
+class GraphSearchHit(GraphNode):
+    match: str  # exact, prefix or fuzzy
+    score: float  # Share of the label the query covers (exact, prefix) or trigram similarity (fuzzy)
+
+class AnalyticsNode(GraphNode):
+    # None until analytics have run on a graph version that has the node
+    pagerank: Optional[float] = None
+    betweenness: Optional[float] = None  # Normalized, estimated from sampled sources
+    degree_centrality: Optional[float] = None
+    community: Optional[int] = None  # Numbered by size, 0 is the largest
+
+class GraphCommunity(BaseModel):
+    id: int
+    size: int
+    label: str  # Label of its highest-ranked node
+
+class GraphAnalytics(BaseModel):
+    version: int  # Graph version the results were computed on
+    stale: bool  # The graph has changed since
+    computed_at: str
+    elapsed_seconds: float
+    communities: int
+    modularity: float
+    largest_communities: List[GraphCommunity]
+    top_pagerank: List[AnalyticsNode]
+    top_betweenness: List[AnalyticsNode]
+
+class GraphNodeMapping(BaseModel):
+    column: str  # Values identify the entities (rows with the same value are one node)
+    type: str  # Node type given to them
+    label_column: Optional[str] = None  # Column with display labels; defaults to column
+
+class GraphEdgeMapping(BaseModel):
+    source: str  # Key column of a node mapping
+    target: str  # Key column of another node mapping, e.g. a foreign key
+    type: str  # Relationship label
+
+class GraphBuildRequest(BaseModel):
+    file_id: str  # An uploaded DataPuur file
+    nodes: List[GraphNodeMapping]
+    edges: List[GraphEdgeMapping] = []
+    chunk_size: Optional[int] = None  # Rows per batch; defaults to GRAPH_BUILD_CHUNK_SIZE
+
+class GraphCluster(BaseModel):
+    id: int
+    label: str  # Label of the best-connected member
+    type: str  # Most common member type
+    color: str
+    x: float
+    y: float
+    count: int
+
+class GraphClusterEdge(BaseModel):
+    from_cluster: int
+    to_cluster: int
+    count: int  # Graph edges merged into this one
+
+class GraphViewport(BaseModel):
+    version: int
+    level: int  # 0 = individual nodes, higher = coarser clusters
+    truncated: bool
+    nodes: List[GraphNode]
+    edges: List[GraphEdge]
+    clusters: List[GraphCluster]
+    cluster_edges: List[GraphClusterEdge]
+
+class GraphChange(BaseModel):
+    sequence: int  # Graph version after the change
+    event: str  # nodes_added, nodes_removed, edges_added, edges_removed or reset
+    summary: str
+    time: str
+    nodes: List[GraphNode] = []  # Added nodes, as they are now
+    edges: List[GraphEdge] = []  # Added edges
+    removed_node_ids: List[int] = []
+    removed_edge_ids: List[int] = []
+
+class GraphChanges(BaseModel):
+    epoch: str  # Identifies the change log; sequences from another epoch don't apply
+    sequence: int  # Last change in this page; pass as since for the next one
+    latest: int
+    has_more: bool
+    reload: bool  # The changes can't bring the client up to date; reload the graph
+    changes: List[GraphChange]
 
 # Dashboard models
 class DashboardData(BaseModel):
@@ -53,4 +163,5 @@ class KGraphDashboard(BaseModel):
     graph: Dict[str, Any]
     metrics: GraphMetrics
     updates: List[Dict[str, str]]
+    analytics: Optional[GraphAnalytics] = None  # None before the first analytics job completes
 
@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request, UploadFile, File, Form, BackgroundTasks, Query
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from typing import List, Dict, Any, Optional
 import random
@@ -13,8 +14,8 @@ from pathlib import Path
 import sqlalchemy
 from sqlalchemy import create_engine, MetaData, Table, inspect
 
-from .models import User, get_db
-from .auth import get_current_active_user, has_role
+from .models import UploadedFile, get_db, run_db
+from .auth import get_current_active_user, has_role, Principal
 from .data_models import DataSource, DataMetrics, Activity, DashboardData
 
 # Router
@@ -24,9 +25,6 @@ router = APIRouter(prefix="/api/datapuur", tags=["datapuur"])
 UPLOAD_DIR = Path(__file__).parent / "uploads"
 UPLOAD_DIR.mkdir(exist_ok=True)
 
-# In-memory storage for uploaded files and their schemas
-uploaded_files = {}
-
 # Helper functions
 def detect_csv_schema(file_path, chunk_size=1000):
     """Detect schema from a CSV file"""
@@ -319,7 +317,7 @@ def create_connection_string(db_type, config):
 async def upload_file(
     file: UploadFile = File(...),
     chunkSize: int = Form(1000),
-    current_user: User = Depends(has_role("researcher"))
+    current_user: Principal = Depends(has_role("researcher"))
 ):
     """Upload a file for data ingestion"""
     # Validate file type
@@ -346,38 +344,43 @@ async def upload_file(
     finally:
         file.file.close()
     
-    # Store file info
-    uploaded_files[file_id] = {
-        "filename": file.filename,
-        "path": str(file_path),
-        "type": file_ext,
-        "uploaded_by": current_user.username,
-        "uploaded_at": datetime.now().isoformat(),
-        "chunk_size": chunkSize
-    }
+    # Store file info in the database so every worker can find it
+    def save(db: Session):
+        db.add(UploadedFile(
+            id=file_id,
+            filename=file.filename,
+            path=str(file_path),
+            type=file_ext,
+            uploaded_by=current_user.username,
+            uploaded_at=datetime.now(),
+            chunk_size=chunkSize
+        ))
+        db.commit()
+    
+    await run_db(save)
     
     return {"file_id": file_id, "message": "File uploaded successfully"}
 
 @router.get("/schema/{file_id}", status_code=status.HTTP_200_OK)
 async def get_file_schema(
     file_id: str,
-    current_user: User = Depends(has_role("researcher"))
+    current_user: Principal = Depends(has_role("researcher"))
 ):
     """Get schema for an uploaded file"""
-    if file_id not in uploaded_files:
+    file_info = await run_db(lambda db: db.query(UploadedFile).filter(UploadedFile.id == file_id).first())
+    if not file_info:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="File not found"
         )
     
-    file_info = uploaded_files[file_id]
-    file_path = file_info["path"]
-    chunk_size = file_info.get("chunk_size", 1000)
+    file_path = file_info.path
+    chunk_size = file_info.chunk_size or 1000
     
     try:
-        if file_info["type"] == "csv":
+        if file_info.type == "csv":
             schema = detect_csv_schema(file_path, chunk_size)
-        elif file_info["type"] == "json":
+        elif file_info.type == "json":
             schema = detect_json_schema(file_path, chunk_size)
         else:
             raise HTTPException(
@@ -385,9 +388,12 @@ async def get_file_schema(
                 detail="Unsupported file type"
             )
         
-        # Store schema in file info
-        file_info["schema"] = schema
-        uploaded_files[file_id] = file_info
+        # Store schema with the file info
+        def save_schema(db: Session):
+            db.query(UploadedFile).filter(UploadedFile.id == file_id).update({"schema": json.dumps(schema)})
+            db.commit()
+        
+        await run_db(save_schema)
         
         return {"schema": schema}
     except Exception as e:
@@ -399,7 +405,7 @@ async def get_file_schema(
 @router.post("/test-connection", status_code=status.HTTP_200_OK)
 async def test_database_connection(
     connection_info: dict,
-    current_user: User = Depends(has_role("researcher"))
+    current_user: Principal = Depends(has_role("researcher"))
 ):
     """Test a database connection"""
     try:
@@ -418,11 +424,17 @@ async def test_database_connection(
         # Create connection string
         connection_string = create_connection_string(db_type, config)
         
-        # Test connection
-        engine = create_engine(connection_string)
-        with engine.connect() as connection:
-            # Just test the connection
-            pass
+        # Test connection off the event loop; connecting can take seconds
+        def check_connection():
+            engine = create_engine(connection_string)
+            try:
+                with engine.connect() as connection:
+                    # Just test the connection
+                    pass
+            finally:
+                engine.dispose()
+        
+        await run_in_threadpool(check_connection)
         
         return {"message": "Connection successful"}
     except Exception as e:
@@ -434,7 +446,7 @@ async def test_database_connection(
 @router.post("/db-schema", status_code=status.HTTP_200_OK)
 async def get_database_schema(
     connection_info: dict,
-    current_user: User = Depends(has_role("researcher"))
+    current_user: Principal = Depends(has_role("researcher"))
 ):
     """Get schema from a database table"""
     try:
@@ -452,7 +464,7 @@ async def get_database_schema(
                 )
         
         # Get schema
-        schema = get_db_schema(db_type, config, chunk_size)
+        schema = await run_in_threadpool(get_db_schema, db_type, config, chunk_size)
         
         return {"schema": schema}
     except Exception as e:
@@ -467,7 +479,7 @@ async def get_database_schema(
 async def get_injection_history(
     limit: int = Query(20, ge=1, le=100),
     offset: int = Query(0, ge=0),
-    current_user: User = Depends(has_role("researcher"))
+    current_user: Principal = Depends(has_role("researcher"))
 ):
     """Get history of data injections for the current user"""
     # In a real implementation, this would query a database table
@@ -554,15 +566,15 @@ async def get_injection_history(
 
 # Original routes from the template
 @router.get("/sources", response_model=List[DataSource])
-async def get_data_sources(current_user: User = Depends(has_role("researcher"))):
+async def get_data_sources(current_user: Principal = Depends(has_role("researcher"))):
    return generate_data_sources()
 
 @router.get("/metrics", response_model=DataMetrics)
-async def get_data_metrics(current_user: User = Depends(has_role("researcher"))):
+async def get_data_metrics(current_user: Principal = Depends(has_role("researcher"))):
    return generate_data_metrics()
 
 @router.get("/activities", response_model=List[Activity])
-async def get_activities(current_user: User = Depends(has_role("researcher"))):
+async def get_activities(current_user: Principal = Depends(has_role("researcher"))):
    # Sort activities by time (most recent first)
    activities = generate_activities()
    sorted_activities = sorted(
@@ -573,7 +585,7 @@ async def get_activities(current_user: User = Depends(has_role("researcher"))):
    return sorted_activities
 
 @router.get("/dashboard", response_model=Dict[str, Any])
-async def get_dashboard_data(current_user: User = Depends(has_role("researcher"))):
+async def get_dashboard_data(current_user: Principal = Depends(has_role("researcher"))):
    # Generate random data for charts
    chart_data = {
        "bar_chart": [random.randint(30, 80) for _ in range(7)],
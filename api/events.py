@@ -0,0 +1,177 @@
+import asyncio
+import json
+import os
+import threading
+from typing import Any, Dict, Optional
+
+from sqlalchemy import func
+
+from .models import SessionLocal, ActivityLog, User
+
+# Events buffered per subscriber before the oldest ones are dropped
+SUBSCRIBER_QUEUE_SIZE = 256
+
+# "local": subscribers see changes made by their own worker, as they happen.
+# "database": each worker tails the database, so subscribers see changes from every worker.
+EVENTS_SOURCE = os.environ.get("EVENTS_SOURCE", "local")
+EVENTS_POLL_SECONDS = float(os.environ.get("EVENTS_POLL_SECONDS", 1))
+EVENTS_POLL_BATCH = 500
+
+class Subscriber:
+    def __init__(self, loop: asyncio.AbstractEventLoop, maxsize: int = SUBSCRIBER_QUEUE_SIZE):
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def offer(self, item):
+        """Queue an event without ever blocking; a full queue drops its oldest event"""
+        if self.queue.full():
+            try:
+                self.queue.get_nowait()
+                self.dropped += 1
+            except asyncio.QueueEmpty:
+                pass
+        self.queue.put_nowait(item)
+
+class EventBroadcaster:
+    """
+    Fans out events to every subscribed client from a single place.
+    Each subscriber has its own bounded queue, so a slow client only loses
+    its own oldest events and never holds up publishers or other clients.
+    publish() is safe to call from any thread.
+    """
+
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self) -> Subscriber:
+        subscriber = Subscriber(asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, event: str, data: Dict[str, Any]):
+        if not self._subscribers:
+            return
+        item = (event, data)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber.offer, item)
+            except RuntimeError:
+                # The subscriber's loop has shut down
+                self.unsubscribe(subscriber)
+
+class DatabaseTail:
+    """
+    Publishes activity logs and user count changes written by any worker by
+    polling the database every EVENTS_POLL_SECONDS. Polls are skipped while
+    this worker has no subscribers.
+    """
+
+    def __init__(self, broadcaster: EventBroadcaster, interval: float = EVENTS_POLL_SECONDS):
+        self.broadcaster = broadcaster
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_id = None
+        self._user_counts = None
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="events-tail", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join(self.interval + 1)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if not self.broadcaster.subscriber_count:
+                # Start from the current position when someone subscribes again
+                self._last_id = None
+                continue
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Error polling events: {e}")
+
+    def poll(self):
+        db = SessionLocal()
+        try:
+            user_counts = (
+                db.query(func.count(User.id)).scalar(),
+                db.query(func.count(User.id)).filter(User.is_active == True).scalar(),
+            )
+            if self._last_id is None:
+                self._last_id = db.query(func.max(ActivityLog.id)).scalar() or 0
+                self._user_counts = user_counts
+                return
+            logs = (
+                db.query(ActivityLog)
+                .filter(ActivityLog.id > self._last_id)
+                .order_by(ActivityLog.id)
+                .limit(EVENTS_POLL_BATCH)
+                .all()
+            )
+        finally:
+            db.close()
+
+        for log in logs:
+            self.broadcaster.publish("activity", {
+                "id": log.id,
+                "username": log.username,
+                "action": log.action,
+                "details": log.details,
+                "timestamp": log.timestamp.isoformat() if log.timestamp else None,
+                "ip_address": log.ip_address,
+                "user_agent": log.user_agent,
+                "page_url": log.page_url,
+            })
+        if logs:
+            self._last_id = logs[-1].id
+
+        delta = {}
+        if logs:
+            delta["total_activity_logs"] = len(logs)
+        if user_counts != self._user_counts:
+            delta["total_users"] = user_counts[0] - self._user_counts[0]
+            delta["active_users"] = user_counts[1] - self._user_counts[1]
+            self._user_counts = user_counts
+        if delta:
+            self.broadcaster.publish("stats", {"delta": delta})
+
+# Shared broadcaster for admin activity and stats
+broadcaster = EventBroadcaster()
+database_tail = DatabaseTail(broadcaster)
+
+def publish_activity(log: Dict[str, Any]):
+    """Announce a newly written activity log entry"""
+    # In database mode the tail publishes it, including for this worker
+    if EVENTS_SOURCE == "local":
+        broadcaster.publish("activity", log)
+
+def publish_stats_delta(**delta: int):
+    """Announce changes to the admin dashboard counters, e.g. publish_stats_delta(total_users=1)"""
+    if EVENTS_SOURCE == "local":
+        broadcaster.publish("stats", {"delta": delta})
+
+def format_sse(event: str, data: Any, event_id: Optional[int] = None) -> str:
+    message = f"event: {event}\n"
+    if event_id is not None:
+        message += f"id: {event_id}\n"
+    return message + f"data: {json.dumps(data, default=str)}\n\n"
@@ -0,0 +1,431 @@
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+from .graph_store import CSR, GraphStore, graph_store
+
+PAGERANK_DAMPING = float(os.environ.get("PAGERANK_DAMPING", 0.85))
+PAGERANK_TOLERANCE = float(os.environ.get("PAGERANK_TOLERANCE", 1e-6))
+PAGERANK_MAX_ITERATIONS = int(os.environ.get("PAGERANK_MAX_ITERATIONS", 100))
+# Breadth-first searches betweenness is estimated from; each one visits the whole graph
+BETWEENNESS_SAMPLES = int(os.environ.get("BETWEENNESS_SAMPLES", 32))
+LABEL_PROPAGATION_MAX_ITERATIONS = int(os.environ.get("LABEL_PROPAGATION_MAX_ITERATIONS", 30))
+# Analytics jobs kept for listing, most recent first
+MAX_ANALYTICS_JOBS = int(os.environ.get("MAX_ANALYTICS_JOBS", 20))
+
+NODE_METRICS = ("pagerank", "betweenness", "degree_centrality")
+
+class AnalyticsCancelled(Exception):
+    pass
+
+class GraphArrays(NamedTuple):
+    """The parts of one graph version the analytics read, safe to use without the store lock"""
+    version: int
+    alive: np.ndarray  # bool per node id
+    src: np.ndarray  # Live edges
+    dst: np.ndarray
+    both: CSR  # Undirected adjacency
+
+def graph_arrays(store: GraphStore) -> GraphArrays:
+    with store.lock:
+        edge_ids = store.alive_edge_ids()
+        return GraphArrays(
+            store.version,
+            store.node_alive.view().copy(),
+            store.edge_src.view()[edge_ids],
+            store.edge_dst.view()[edge_ids],
+            # CSR arrays are rebuilt, never updated, when the graph changes
+            store.csr("both"),
+        )
+
+def _group_rows(owners: np.ndarray) -> np.ndarray:
+    """Start of each run of equal values in a sorted array"""
+    return np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]])
+
+def degree_centrality(graph: GraphArrays) -> np.ndarray:
+    """Undirected degree over the number of other live nodes"""
+    nodes = int(graph.alive.sum())
+    degree = np.diff(graph.both.offsets).astype(np.float64)
+    return degree / (nodes - 1) if nodes > 1 else degree * 0
+
+def pagerank(
+    graph: GraphArrays,
+    damping: float = PAGERANK_DAMPING,
+    tolerance: float = PAGERANK_TOLERANCE,
+    max_iterations: int = PAGERANK_MAX_ITERATIONS,
+    tick: Optional[Callable[[float], None]] = None,
+) -> np.ndarray:
+    """
+    PageRank by power iteration over the edge list: each step scatters every
+    node's rank along its out-edges with one bincount. Rank of nodes without
+    out-edges is spread over all nodes. Stops when the L1 change drops below
+    nodes * tolerance. Removed nodes get 0.
+    """
+    capacity = len(graph.alive)
+    nodes = int(graph.alive.sum())
+    rank = np.zeros(capacity)
+    if not nodes:
+        return rank
+    rank[graph.alive] = 1.0 / nodes
+    out_degree = np.bincount(graph.src, minlength=capacity)
+    share = 1.0 / out_degree[graph.src]
+    dangling = graph.alive & (out_degree == 0)
+
+    for iteration in range(max_iterations):
+        if tick:
+            tick(iteration / max_iterations)
+        spread = np.bincount(graph.dst, weights=rank[graph.src] * share, minlength=capacity)
+        new_rank = damping * (spread + rank[dangling].sum() / nodes) + (1 - damping) / nodes
+        new_rank[~graph.alive] = 0.0
+        change = np.abs(new_rank - rank).sum()
+        rank = new_rank
+        if change < nodes * tolerance:
+            break
+    return rank
+
+def betweenness(
+    graph: GraphArrays,
+    samples: int = BETWEENNESS_SAMPLES,
+    seed: int = 0,
+    tick: Optional[Callable[[float], None]] = None,
+) -> np.ndarray:
+    """
+    Normalized betweenness centrality of the undirected graph, estimated
+    with Brandes' algorithm from a sample of source nodes and scaled up (exact
+    when samples covers every node). Each search runs level by level: a
+    forward pass counts shortest paths per node, a backward pass over the
+    same levels accumulates dependencies, both as bincounts over the edges
+    between consecutive levels.
+    """
+    capacity = len(graph.alive)
+    live = np.flatnonzero(graph.alive)
+    nodes = len(live)
+    centrality = np.zeros(capacity)
+    if nodes < 3:
+        return centrality
+    sources = np.random.default_rng(seed).choice(live, min(samples, nodes), replace=False)
+    csr = graph.both
+    slot = np.zeros(capacity, dtype=np.int32)
+
+    for done, source in enumerate(sources.tolist()):
+        if tick:
+            tick(done / len(sources))
+        distance = np.full(capacity, -1, dtype=np.int32)
+        paths = np.zeros(capacity)
+        distance[source] = 0
+        paths[source] = 1.0
+        frontier = np.array([source], dtype=np.int32)
+        levels = []  # (parents, children, child level) per level, edges on shortest paths only
+        depth = 0
+        while len(frontier):
+            positions, lengths = csr.rows(frontier)
+            parents = np.repeat(frontier, lengths)
+            children = csr.neighbors[positions]
+            # Edges to unvisited nodes are exactly the ones on shortest paths
+            on_path = distance[children] < 0
+            parents, children = parents[on_path], children[on_path]
+            found = np.unique(children)
+            depth += 1
+            distance[found] = depth
+            # Numbered densely so the counts are a bincount over this level only
+            slot[found] = np.arange(len(found), dtype=np.int32)
+            paths[found] = np.bincount(slot[children], weights=paths[parents], minlength=len(found))
+            levels.append((parents, children, frontier))
+            frontier = found
+
+        dependency = np.zeros(capacity)
+        for parents, children, level in reversed(levels):
+            if not len(parents):
+                continue
+            weights = paths[parents] / paths[children] * (1.0 + dependency[children])
+            slot[level] = np.arange(len(level), dtype=np.int32)
+            dependency[level] += np.bincount(slot[parents], weights=weights, minlength=len(level))
+        dependency[source] = 0.0
+        centrality += dependency
+
+    # Every sampled source stands for nodes / samples; normalized as in networkx
+    return centrality * (nodes / len(sources)) / ((nodes - 1) * (nodes - 2))
+
+def label_propagation(
+    graph: GraphArrays,
+    max_iterations: int = LABEL_PROPAGATION_MAX_ITERATIONS,
+    seed: int = 0,
+    tick: Optional[Callable[[float], None]] = None,
+) -> np.ndarray:
+    """
+    Communities by label propagation on the undirected graph: every node
+    starts in its own community and repeatedly adopts the one most common
+    among its neighbors, ties broken at random. Half the nodes, chosen at
+    random, update per round, which keeps synchronous updates from
+    oscillating. Stops when fewer than 0.1% of the updating nodes change.
+    Returns community ids numbered by size (0 is the largest), -1 for
+    removed nodes.
+    """
+    capacity = len(graph.alive)
+    rng = np.random.default_rng(seed)
+    offsets, neighbors = graph.both.offsets, graph.both.neighbors
+    labels = np.arange(capacity, dtype=np.int64)
+    owners = np.repeat(np.arange(capacity, dtype=np.int64), np.diff(offsets))
+    connected = np.diff(offsets) > 0
+
+    for iteration in range(max_iterations if len(neighbors) else 0):
+        if tick:
+            tick(iteration / max_iterations)
+        keys, counts = np.unique(owners * capacity + labels[neighbors], return_counts=True)
+        node, label = np.divmod(keys, capacity)
+        score = counts + rng.random(len(counts)) * 0.5
+        starts = _group_rows(node)
+        best = np.maximum.reduceat(score, starts)
+        winners = np.flatnonzero(score == np.repeat(best, np.diff(np.r_[starts, len(node)])))
+        winners = winners[_group_rows(node[winners])]
+        proposed = labels.copy()
+        proposed[node[winners]] = label[winners]
+
+        updating = connected & (rng.random(capacity) < 0.5)
+        changed = int(np.count_nonzero(proposed[updating] != labels[updating]))
+        labels[updating] = proposed[updating]
+        if changed <= 0.001 * max(int(updating.sum()), 1):
+            break
+
+    community = np.full(capacity, -1, dtype=np.int32)
+    if graph.alive.any():
+        _, inverse, sizes = np.unique(labels[graph.alive], return_inverse=True, return_counts=True)
+        rank = np.empty(len(sizes), dtype=np.int32)
+        rank[np.argsort(-sizes, kind="stable")] = np.arange(len(sizes), dtype=np.int32)
+        community[graph.alive] = rank[inverse]
+    return community
+
+def modularity(graph: GraphArrays, community: np.ndarray) -> float:
+    """Newman modularity of an undirected partition"""
+    edges = len(graph.src)
+    if not edges:
+        return 0.0
+    groups = int(community.max()) + 1
+    same = community[graph.src] == community[graph.dst]
+    inside = np.bincount(community[graph.src][same], minlength=groups)
+    degree = np.bincount(community[graph.alive], weights=np.diff(graph.both.offsets)[graph.alive], minlength=groups)
+    return float((inside / edges - (degree / (2 * edges)) ** 2).sum())
+
+def largest_communities(community: np.ndarray, rank: np.ndarray, count: int) -> List[Dict[str, int]]:
+    """Size and best-ranked member of the count largest communities"""
+    sizes = np.bincount(community[community >= 0])
+    largest = []
+    for group in range(min(count, len(sizes))):
+        members = np.flatnonzero(community == group)
+        largest.append({"id": group, "size": int(sizes[group]), "node": int(members[np.argmax(rank[members])])})
+    return largest
+
+class AnalyticsEngine:
+    """
+    Runs graph analytics as background jobs in this worker and caches the
+    result of the latest graph version computed. A job works on the arrays
+    of the version current when it starts, so the graph can keep changing
+    meanwhile; its result is then stale but still served, with node ids
+    added since left out. Jobs can be cancelled; they stop at the next
+    iteration or sampled search.
+    """
+
+    def __init__(self, store: GraphStore):
+        self.store = store
+        self.result: Optional[Dict[str, Any]] = None
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._cancel: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        store.add_listener(self._on_change)
+
+    def _on_change(self, event: str, payload: Dict[str, Any]):
+        # Node ids of a replaced graph mean other nodes
+        if event == "reset":
+            self.result = None
+
+    def start(self, restart: bool = True) -> Dict[str, Any]:
+        """
+        A job for the current graph version: the running or finished one if
+        there is one, else a new queued job to pass to run(). A job still
+        running on an older version is cancelled, or with restart False
+        returned instead, so a graph that keeps changing still gets results.
+        """
+        version = self.store.version
+        with self._lock:
+            for job in self._jobs.values():
+                if job["version"] == version and job["status"] in ("queued", "running", "completed"):
+                    return dict(job)
+            for job in self._jobs.values():
+                if job["status"] in ("queued", "running") and not restart:
+                    return dict(job)
+                if job["status"] == "queued":
+                    job["status"] = "cancelled"
+                elif job["status"] == "running":
+                    self._cancel[job["id"]].set()
+                    job["status"] = "cancelling"
+            job = {
+                "id": str(uuid.uuid4()),
+                "version": version,
+                "status": "queued",
+                "stage": None,
+                "progress": 0.0,
+                "error": None,
+                "created_at": datetime.now().isoformat(),
+                "finished_at": None,
+                "elapsed_seconds": 0.0,
+            }
+            self._jobs[job["id"]] = job
+            self._cancel[job["id"]] = threading.Event()
+            # Oldest finished jobs go first; running ones still report progress to their entry
+            finished = [key for key, old in self._jobs.items() if old["status"] in ("completed", "cancelled", "failed")]
+            for old in finished[:len(self._jobs) - MAX_ANALYTICS_JOBS]:
+                self._jobs.pop(old)
+                self._cancel.pop(old)
+            return dict(job)
+
+    def jobs(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(job) for job in reversed(self._jobs.values())]
+
+    def job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if job["status"] == "queued":
+                job["status"] = "cancelled"
+            elif job["status"] == "running":
+                self._cancel[job_id].set()
+                job["status"] = "cancelling"
+            return dict(job)
+
+    def _update(self, job_id: str, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields)
+
+    def run(self, job_id: str):
+        """Compute every metric for a queued job; meant for a background task"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] != "queued":
+                return
+            job["status"] = "running"
+            cancel = self._cancel[job_id]
+        started = time.perf_counter()
+
+        def stage(name: str, start: float, end: float) -> Callable[[float], None]:
+            def tick(fraction: float):
+                if cancel.is_set():
+                    raise AnalyticsCancelled()
+                self._update(job_id, stage=name, progress=round(start + (end - start) * fraction, 3),
+                             elapsed_seconds=round(time.perf_counter() - started, 3))
+            tick(0.0)
+            return tick
+
+        try:
+            stage("loading", 0.0, 0.05)
+            graph = graph_arrays(self.store)
+            if graph.version != job["version"]:
+                # The graph changed while queued; the job covers the newer version
+                self._update(job_id, version=graph.version)
+            result = {"version": graph.version, "alive": graph.alive}
+            result["degree_centrality"] = degree_centrality(graph)
+            result["pagerank"] = pagerank(graph, tick=stage("pagerank", 0.05, 0.25))
+            result["betweenness"] = betweenness(graph, tick=stage("betweenness", 0.25, 0.8))
+            result["community"] = label_propagation(graph, tick=stage("communities", 0.8, 1.0))
+            result["modularity"] = modularity(graph, result["community"])
+            result["communities"] = int(result["community"].max()) + 1
+            result["largest_communities"] = largest_communities(result["community"], result["pagerank"], 10)
+            result["computed_at"] = datetime.now().isoformat()
+            result["elapsed_seconds"] = round(time.perf_counter() - started, 3)
+            with self._lock:
+                if self.result is None or self.result["version"] <= graph.version:
+                    self.result = result
+            self._update(job_id, status="completed", stage=None, progress=1.0, finished_at=datetime.now().isoformat(),
+                         elapsed_seconds=result["elapsed_seconds"])
+            print(f"Graph analytics for version {graph.version} took {result['elapsed_seconds']}s")
+        except AnalyticsCancelled:
+            self._update(job_id, status="cancelled", finished_at=datetime.now().isoformat())
+        except Exception as e:
+            self._update(job_id, status="failed", error=str(e), finished_at=datetime.now().isoformat())
+            print(f"Graph analytics job {job_id} failed: {e}")
+
+    def node(self, node_id: int) -> Dict[str, Any]:
+        """
+        One node with its cached metrics, which are None when there is no
+        result yet or the node is newer than it. KeyError if there is no
+        such node.
+        """
+        with self.store.lock:
+            alive = self.store.node_alive.view()
+            if not 0 <= node_id < len(alive) or not alive[node_id]:
+                raise KeyError(node_id)
+            node = self.store.node_dicts([node_id])[0]
+        node.update({name: None for name in NODE_METRICS + ("community",)})
+        return self.annotate([node])[0]
+
+    def annotate(self, nodes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Add the cached metrics to node dicts in place, as attributes"""
+        result = self.result
+        if result is None:
+            return nodes
+        ids = np.fromiter((node["id"] for node in nodes), dtype=np.int64, count=len(nodes))
+        known = ids < len(result["alive"])
+        known[known] = result["alive"][ids[known]]
+        columns = {name: np.where(known, result[name][np.where(known, ids, 0)], np.nan) for name in NODE_METRICS}
+        community = np.where(known, result["community"][np.where(known, ids, 0)], -1)
+        values = {name: column.tolist() for name, column in columns.items()}
+        communities = community.tolist()
+        for i, node in enumerate(nodes):
+            if known[i]:
+                for name in NODE_METRICS:
+                    node[name] = round(values[name][i], 8)
+                node["community"] = communities[i]
+        return nodes
+
+    def top(self, metric: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Live nodes with the highest value of metric, with all their metrics"""
+        result = self.result
+        if result is None:
+            return []
+        with self.store.lock:
+            values = result[metric].copy()
+            alive = self.store.node_alive.view()[:len(values)]
+            values[:len(alive)][~alive] = -np.inf
+            values[len(alive):] = -np.inf
+            count = min(limit, int(np.isfinite(values).sum()))
+            if not count:
+                return []
+            best = np.argpartition(-values, count - 1)[:count]
+            best = best[np.argsort(-values[best], kind="stable")]
+            return self.annotate(self.store.node_dicts(best))
+
+    def summary(self, top: int = 5) -> Optional[Dict[str, Any]]:
+        """The cached result in the GraphAnalytics shape, or None before the first job completes"""
+        result = self.result
+        if result is None:
+            return None
+        largest = result["largest_communities"][:top]
+        with self.store.lock:
+            labels = [node["label"] for node in self.store.node_dicts([group["node"] for group in largest])]
+            stale = result["version"] != self.store.version
+        return {
+            "version": result["version"],
+            "stale": stale,
+            "computed_at": result["computed_at"],
+            "elapsed_seconds": result["elapsed_seconds"],
+            "communities": result["communities"],
+            "modularity": round(result["modularity"], 6),
+            "largest_communities": [
+                {"id": group["id"], "size": group["size"], "label": label} for group, label in zip(largest, labels)
+            ],
+            "top_pagerank": self.top("pagerank", top),
+            "top_betweenness": self.top("betweenness", top),
+        }
+
+analytics_engine = AnalyticsEngine(graph_store)
@@ -0,0 +1,370 @@
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from itertools import repeat
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .graph_store import GraphStore, StringTable, graph_store
+from .models import GraphBuildJob, SessionLocal, UploadedFile
+
+GRAPH_BUILD_CHUNK_SIZE = int(os.environ.get("GRAPH_BUILD_CHUNK_SIZE", 10000))
+# A running job whose worker has not touched it for this long died with the worker
+GRAPH_BUILD_STALE_SECONDS = float(os.environ.get("GRAPH_BUILD_STALE_SECONDS", 120))
+
+class MappingError(ValueError):
+    """The mapping does not fit the file"""
+
+class EntityIndex:
+    """
+    Hash indexes from source keys to graph ids, so loading the same entity
+    or relationship twice (within a file, across chunks or across builds)
+    reuses the existing node or edge. One dict per node type maps key ->
+    node id; one per relationship label maps the (source, target) pair,
+    packed into an int, -> edge id. Ids removed from the store since are
+    treated as missing and recreated.
+
+    The index lives in memory next to the graph store; epoch identifies
+    this instance, so a checkpoint taken against another process's graph
+    is recognised as not resumable.
+    """
+
+    def __init__(self, store: GraphStore):
+        self.store = store
+        self.epoch = uuid.uuid4().hex
+        self._nodes: Dict[str, Dict[str, int]] = {}
+        self._edges: Dict[str, Dict[int, int]] = {}
+        # Restored from a snapshot, turned into dicts on first use
+        self._frozen_nodes: Dict[str, Tuple[StringTable, np.ndarray]] = {}
+        self._frozen_edges: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+    def _node_keys(self, type_name: str) -> Dict[str, int]:
+        known = self._nodes.get(type_name)
+        if known is None:
+            known = self._nodes[type_name] = {}
+            if type_name in self._frozen_nodes:
+                keys, ids = self._frozen_nodes.pop(type_name)
+                known.update(zip(keys.all(), ids.tolist()))
+        return known
+
+    def _edge_pairs(self, type_name: str) -> Dict[int, int]:
+        known = self._edges.get(type_name)
+        if known is None:
+            known = self._edges[type_name] = {}
+            if type_name in self._frozen_edges:
+                pairs, ids = self._frozen_edges.pop(type_name)
+                known.update(zip(pairs.tolist(), ids.tolist()))
+        return known
+
+    def export(self) -> Tuple[Dict[str, Tuple[StringTable, np.ndarray]], Dict[str, Tuple[np.ndarray, np.ndarray]]]:
+        """The indexes as arrays, for snapshots: {type: (keys, node ids)}, {label: (packed pairs, edge ids)}"""
+        with self.store.lock:
+            nodes = {}
+            for type_name in list(self._nodes) + list(self._frozen_nodes):
+                known = self._node_keys(type_name)
+                keys = StringTable()
+                keys.strings = list(known)
+                nodes[type_name] = (keys, np.fromiter(known.values(), dtype=np.int64, count=len(known)))
+            edges = {}
+            for type_name in list(self._edges) + list(self._frozen_edges):
+                known = self._edge_pairs(type_name)
+                edges[type_name] = (
+                    np.fromiter(known.keys(), dtype=np.int64, count=len(known)),
+                    np.fromiter(known.values(), dtype=np.int64, count=len(known)),
+                )
+            return nodes, edges
+
+    def restore(
+        self,
+        nodes: Dict[str, Tuple[StringTable, np.ndarray]],
+        edges: Dict[str, Tuple[np.ndarray, np.ndarray]],
+        epoch: str,
+    ):
+        """
+        Replace the indexes, after the store was restored from the same
+        snapshot. Keeping the epoch the snapshot was taken in lets builds
+        checkpointed before it resume instead of starting over.
+        """
+        with self.store.lock:
+            self._nodes = {}
+            self._edges = {}
+            self._frozen_nodes = dict(nodes)
+            self._frozen_edges = dict(edges)
+            self.epoch = epoch
+
+    def resolve_nodes(self, type_name: str, keys: Sequence[str], labels: Sequence[str]) -> Tuple[np.ndarray, int, int]:
+        """
+        Node ids for the keys, creating nodes for unseen ones (labelled from
+        the key's first row). Empty keys get -1. Returns (ids, created, matched).
+        """
+        store = self.store
+        with store.lock:
+            known = self._node_keys(type_name)
+            ids = np.fromiter(map(known.get, keys, repeat(-1)), dtype=np.int64, count=len(keys))
+            found = ids >= 0
+            found[found] = store.node_alive.view()[ids[found]]
+            present = np.fromiter(map(bool, keys), dtype=np.bool_, count=len(keys))
+            missing = np.flatnonzero(~found & present)
+            created = 0
+            if len(missing):
+                # Each new key once, labelled from its first row
+                rows = missing[::-1].tolist()
+                first = dict(zip(map(keys.__getitem__, rows), rows))
+                new_ids = store.add_nodes([labels[row] or keys[row] for row in first.values()], [type_name] * len(first))
+                known.update(zip(first, new_ids.tolist()))
+                ids[missing] = np.fromiter(map(known.__getitem__, map(keys.__getitem__, missing.tolist())),
+                                           dtype=np.int64, count=len(missing))
+                created = len(first)
+            ids[~present] = -1
+            return ids, created, int(present.sum()) - created
+
+    def resolve_edges(self, type_name: str, src: np.ndarray, dst: np.ndarray) -> Tuple[int, int]:
+        """Create the edges not loaded before; returns (created, matched)"""
+        store = self.store
+        with store.lock:
+            known = self._edge_pairs(type_name)
+            pairs = (src.astype(np.int64) << 32) | dst.astype(np.int64)
+            existing = np.fromiter(map(known.get, pairs.tolist(), repeat(-1)), dtype=np.int64, count=len(pairs))
+            edge_alive = store.edge_alive.view()
+            found = existing >= 0
+            found[found] = edge_alive[existing[found]]
+            new_pairs, first = np.unique(pairs[~found], return_index=True)
+            if len(new_pairs):
+                new_ids = store.add_edges(src[~found][first], dst[~found][first], [type_name] * len(new_pairs))
+                known.update(zip(new_pairs.tolist(), new_ids.tolist()))
+            return len(new_pairs), len(pairs) - len(new_pairs)
+
+entity_index = EntityIndex(graph_store)
+
+# Jobs this process is running
+_running: set = set()
+_running_lock = threading.Lock()
+
+def mapping_columns(mapping: Dict[str, Any]) -> List[str]:
+    columns = []
+    for node in mapping["nodes"]:
+        columns += [node["column"], node.get("label_column") or node["column"]]
+    return list(dict.fromkeys(columns))
+
+def validate_mapping(mapping: Dict[str, Any], headers: Sequence[str]):
+    """Raise MappingError unless every mapped column exists and edges join mapped nodes"""
+    if not mapping["nodes"]:
+        raise MappingError("Map at least one column to a node type")
+    missing = [column for column in mapping_columns(mapping) if column not in headers]
+    if missing:
+        raise MappingError(f"Columns not in the file: {', '.join(missing)}")
+    keys = [node["column"] for node in mapping["nodes"]]
+    if len(set(keys)) != len(keys):
+        raise MappingError("Each key column can be mapped to one node type only")
+    for edge in mapping["edges"]:
+        for end in (edge["source"], edge["target"]):
+            if end not in keys:
+                raise MappingError(f"Edge end {end} is not the key column of a node mapping")
+
+def file_headers(file_info: UploadedFile) -> List[str]:
+    if file_info.type == "csv":
+        return list(pd.read_csv(file_info.path, nrows=0, encoding="utf-8").columns)
+    with open(file_info.path, "r", encoding="utf-8") as jsonfile:
+        data = json.load(jsonfile)
+    if not isinstance(data, list) or not data or not isinstance(data[0], dict):
+        raise MappingError("JSON files must hold an array of objects")
+    return list(data[0].keys())
+
+def read_chunks(file_info: UploadedFile, columns: List[str], chunk_size: int, start_row: int) -> Iterator[Dict[str, List[str]]]:
+    """The mapped columns as lists of strings ('' when empty), chunk_size rows at a time, from start_row"""
+    if file_info.type == "csv":
+        reader = pd.read_csv(
+            file_info.path,
+            usecols=columns,
+            dtype=str,
+            keep_default_na=False,
+            encoding="utf-8",
+            chunksize=chunk_size,
+            skiprows=range(1, start_row + 1) if start_row else None,
+        )
+        for frame in reader:
+            yield {column: frame[column].tolist() for column in columns}
+    else:
+        # JSON arrays have to be parsed whole (as for schema detection)
+        with open(file_info.path, "r", encoding="utf-8") as jsonfile:
+            records = json.load(jsonfile)
+        for start in range(start_row, len(records), chunk_size):
+            chunk = records[start:start + chunk_size]
+            yield {
+                column: ["" if record.get(column) is None else str(record.get(column)) for record in chunk]
+                for column in columns
+            }
+
+def load_chunk(index: EntityIndex, mapping: Dict[str, Any], chunk: Dict[str, List[str]]) -> Tuple[int, int, int]:
+    """Add one chunk's entities and relationships to the graph; returns (nodes, edges, duplicates)"""
+    nodes = edges = duplicates = 0
+    ids_by_column = {}
+    for node in mapping["nodes"]:
+        keys = chunk[node["column"]]
+        labels = chunk[node.get("label_column") or node["column"]]
+        ids, created, matched = index.resolve_nodes(node["type"], keys, labels)
+        ids_by_column[node["column"]] = ids
+        nodes += created
+        duplicates += matched
+    for edge in mapping["edges"]:
+        src = ids_by_column[edge["source"]]
+        dst = ids_by_column[edge["target"]]
+        both = (src >= 0) & (dst >= 0)
+        created, matched = index.resolve_edges(edge["type"], src[both], dst[both])
+        edges += created
+        duplicates += matched
+    return nodes, edges, duplicates
+
+class JobHeartbeat:
+    """
+    Refreshes a running job's updated_at from a background thread while
+    this worker runs it, so a chunk that takes longer than
+    GRAPH_BUILD_STALE_SECONDS doesn't make the job look interrupted.
+    """
+
+    def __init__(self, job_id: str, interval: float = GRAPH_BUILD_STALE_SECONDS / 4):
+        self.job_id = job_id
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name=f"build-heartbeat-{self.job_id}", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join(self.interval + 1)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            db = SessionLocal()
+            try:
+                db.query(GraphBuildJob).filter(
+                    GraphBuildJob.id == self.job_id,
+                    GraphBuildJob.status.in_(("running", "cancelling")),
+                ).update({GraphBuildJob.updated_at: datetime.now()}, synchronize_session=False)
+                db.commit()
+            except Exception as e:
+                print(f"Error refreshing graph build {self.job_id}: {e}")
+                db.rollback()
+            finally:
+                db.close()
+
+def job_dict(job: GraphBuildJob) -> Dict[str, Any]:
+    status = job.status
+    if status in ("running", "cancelling") and job.updated_at and \
+            datetime.now() - job.updated_at > timedelta(seconds=GRAPH_BUILD_STALE_SECONDS):
+        status = "interrupted"
+    elapsed = job.elapsed_seconds or 0.0
+    return {
+        "id": job.id,
+        "file_id": job.file_id,
+        "mapping": json.loads(job.mapping),
+        "status": status,
+        "rows_done": job.rows_done,
+        "nodes_created": job.nodes_created,
+        "edges_created": job.edges_created,
+        "duplicates": job.duplicates,
+        "elapsed_seconds": round(elapsed, 3),
+        "rows_per_second": round(job.rows_done / elapsed, 1) if elapsed else 0.0,
+        "nodes_per_second": round(job.nodes_created / elapsed, 1) if elapsed else 0.0,
+        "edges_per_second": round(job.edges_created / elapsed, 1) if elapsed else 0.0,
+        "error": job.error,
+        "created_by": job.created_by,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+def is_resumable(job: GraphBuildJob) -> bool:
+    return job_dict(job)["status"] in ("failed", "cancelled", "interrupted")
+
+def run_build_job(job_id: str, index: EntityIndex = entity_index) -> Optional[str]:
+    """
+    Run a queued build: stream the job's file into the graph chunk by
+    chunk, checkpointing rows_done and the counters after every chunk, and
+    keeping the job's heartbeat fresh meanwhile. If the checkpoint was
+    taken against this process's entity index the run continues after it;
+    otherwise (the graph was rebuilt since) it starts over, which is safe
+    because loading is idempotent. Stops early when the job is cancelled.
+    Returns the status the run ended with, or None if it didn't run.
+    """
+    with _running_lock:
+        if job_id in _running:
+            return None
+        _running.add(job_id)
+
+    db = SessionLocal()
+    heartbeat = JobHeartbeat(job_id)
+    try:
+        # Claim the job in one statement, so only one worker gets to run it
+        claimed = db.query(GraphBuildJob).filter(
+            GraphBuildJob.id == job_id, GraphBuildJob.status == "queued"
+        ).update({GraphBuildJob.status: "running", GraphBuildJob.updated_at: datetime.now()}, synchronize_session=False)
+        db.commit()
+        if not claimed:
+            # Cancelled before it started, or already picked up
+            return None
+        heartbeat.start()
+        job = db.query(GraphBuildJob).filter(GraphBuildJob.id == job_id).first()
+        file_info = db.query(UploadedFile).filter(UploadedFile.id == job.file_id).first()
+        mapping = json.loads(job.mapping)
+        if job.checkpoint_epoch != index.epoch:
+            job.rows_done = job.nodes_created = job.edges_created = job.duplicates = 0
+            job.elapsed_seconds = 0.0
+        job.error = None
+        job.checkpoint_epoch = index.epoch
+        db.commit()
+
+        try:
+            if file_info is None:
+                raise MappingError("The uploaded file no longer exists")
+            validate_mapping(mapping, file_headers(file_info))
+            started = time.perf_counter()
+            base_elapsed = job.elapsed_seconds or 0.0
+            for chunk in read_chunks(file_info, mapping_columns(mapping), job.chunk_size, job.rows_done):
+                nodes, edges, duplicates = load_chunk(index, mapping, chunk)
+                job.rows_done += len(chunk[mapping["nodes"][0]["column"]])
+                job.nodes_created += nodes
+                job.edges_created += edges
+                job.duplicates += duplicates
+                job.elapsed_seconds = base_elapsed + time.perf_counter() - started
+                job.updated_at = datetime.now()
+                db.commit()
+                # Cancellation may come from any worker, so it is read back from the row
+                db.refresh(job, ["status"])
+                if job.status == "cancelling":
+                    job.status = "cancelled"
+                    db.commit()
+                    print(f"Graph build {job_id} cancelled after {job.rows_done} rows")
+                    return job.status
+
+            job.status = "completed"
+            job.finished_at = datetime.now()
+            db.commit()
+            print(f"Graph build {job_id} completed: {job.rows_done} rows, {job.nodes_created} nodes and "
+                  f"{job.edges_created} edges in {job.elapsed_seconds:.2f}s")
+            return job.status
+        except Exception as e:
+            db.rollback()
+            job.status = "failed"
+            job.error = str(e)
+            job.updated_at = datetime.now()
+            db.commit()
+            print(f"Graph build {job_id} failed: {e}")
+            return job.status
+    finally:
+        heartbeat.stop()
+        db.close()
+        with _running_lock:
+            _running.discard(job_id)
@@ -0,0 +1,191 @@
+import os
+import threading
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .graph_store import GraphStore, graph_store
+
+# Most changes kept; clients further behind have to reload the graph
+GRAPH_CHANGELOG_SIZE = int(os.environ.get("GRAPH_CHANGELOG_SIZE", 10000))
+# Most node and edge records one page of changes carries (a single bigger change is still sent whole)
+MAX_UPDATE_ITEMS = int(os.environ.get("MAX_UPDATE_ITEMS", 5000))
+
+_SUMMARIES = {
+    "nodes_added": "{nodes} added",
+    "nodes_removed": "{nodes} removed",
+    "edges_added": "{edges} added",
+    "edges_removed": "{edges} removed",
+    "reset": "Graph loaded: {nodes}, {edges}",
+}
+
+def _count(count: int, noun: str) -> str:
+    return f"{count:,} {noun}" if count == 1 else f"{count:,} {noun}s"
+
+class ChangeLog:
+    """
+    Append-only log of graph mutations, recorded by a store listener. Each
+    change's sequence number follows the store version it produced, and
+    viewport and graph responses carry the same numbering; a client that
+    has seen version N asks for the changes after N to patch its view.
+
+    Changes keep only the affected ids; nodes and edges are read from the
+    store when a page is served. The log keeps the last GRAPH_CHANGELOG_SIZE
+    changes. A "reset" change (the graph was replaced, e.g. loaded from a
+    snapshot) can't be patched in either way: the client reloads the whole
+    graph.
+
+    Each worker has its own log and store versions, so sequences are
+    counted from a base every worker can share, the snapshot the graph
+    was last loaded from or saved to (see rebase), and the epoch names that
+    base. Workers on the same snapshot agree, and a client can move between
+    them. Once a worker changes its graph itself (a build), its epoch gets
+    a suffix of its own, and clients it served reload on the other workers
+    until the graph is saved and they pick the snapshot up.
+    """
+
+    def __init__(self, store: GraphStore, size: int = GRAPH_CHANGELOG_SIZE):
+        self.store = store
+        self._process = uuid.uuid4().hex[:12]
+        self._changes = deque(maxlen=size)
+        self._lock = threading.Lock()
+        with store.lock:
+            # Every worker builds the same graph on startup
+            self._base, self._base_version, self._base_sequence = "builtin", store.version, store.version
+            # Whatever the store held before the log started counts as its first load
+            self._record("reset", store.version, np.empty(0, dtype=np.int32))
+            store.add_listener(self._on_change)
+
+    def rebase(self, base: str, version: int, sequence: int):
+        """Count sequences from a graph state other workers share: base names it, at store version here and sequence there"""
+        with self._lock:
+            self._base, self._base_version, self._base_sequence = base, version, sequence
+
+    def sequence(self, version: int) -> int:
+        """The sequence of a store version, as clients see it"""
+        with self._lock:
+            return version + self._base_sequence - self._base_version
+
+    @property
+    def epoch(self) -> str:
+        with self._lock:
+            return self._epoch()
+
+    def _epoch(self) -> str:
+        # Changes made in this worker alone aren't in other workers' logs
+        if self.store.version == self._base_version:
+            return self._base
+        return f"{self._base}+{self._process}"
+
+    def _record(self, event: str, sequence: int, ids: np.ndarray):
+        store = self.store
+        change = {"sequence": sequence, "event": event, "time": datetime.now(), "ids": ids}
+        nodes = edges = len(ids)
+        if event == "reset":
+            nodes, edges = store.node_count, store.edge_count
+        change["summary"] = _SUMMARIES[event].format(nodes=_count(nodes, "node"), edges=_count(edges, "relationship"))
+        with self._lock:
+            self._changes.append(change)
+
+    def _on_change(self, event: str, payload: Dict[str, Any]):
+        # A reset lists every node, which clients reload anyway
+        ids = np.empty(0, dtype=np.int32) if event == "reset" else payload["ids"]
+        self._record(event, self.store.version, ids)
+
+    def changes(self, since: Optional[int] = None, limit: int = 100, epoch: Optional[str] = None) -> Dict[str, Any]:
+        """
+        The changes after sequence since, oldest first, at most limit of
+        them and about MAX_UPDATE_ITEMS nodes and edges. Without since, the
+        latest limit changes. reload is true when the client can't catch
+        up by applying them: its epoch or sequence is from another graph,
+        the changes it missed were dropped, or the graph was reset since, in
+        which case the page starts at the latest reset. Added nodes carry
+        their coordinates as they are when the page is read, so lay the
+        graph out first.
+        """
+        store = self.store
+        # Changes are recorded under the store lock, so none can land between reading them and the store
+        with store.lock:
+            with self._lock:
+                current, base, base_sequence = self._epoch(), self._base, self._base_sequence
+                offset = base_sequence - self._base_version
+                # Changes from before the base belong to another numbering
+                changes = [change for change in self._changes if change["sequence"] >= self._base_version]
+            latest = store.version + offset
+            # A client still at the shared base can take the changes made here on top of it
+            at_base = epoch == base and since is not None and since <= base_sequence
+            reload = epoch is not None and epoch != current and not at_base
+            if since is None:
+                page = changes[-limit:]
+            else:
+                first = changes[0]["sequence"] + offset if changes else latest + 1
+                reload = reload or since > latest or since < first - 1
+                page = [change for change in changes if change["sequence"] + offset > since][:limit]
+            # Ids of changes before a reset are from the replaced graph
+            resets = [i for i, change in enumerate(page) if change["event"] == "reset"]
+            if resets:
+                reload = reload or since is not None
+                page = page[resets[-1]:]
+
+            # Close the page once it holds enough records, always keeping at least one change
+            total = 0
+            for end, change in enumerate(page):
+                total += len(change["ids"])
+                if total > MAX_UPDATE_ITEMS and end:
+                    page = page[:end]
+                    break
+            items = [self._change_dict(store, change, offset) for change in page]
+        return {
+            "epoch": current,
+            "sequence": items[-1]["sequence"] if items else latest,
+            "latest": latest,
+            "has_more": bool(items) and items[-1]["sequence"] < latest,
+            "reload": reload,
+            "changes": items,
+        }
+
+    @staticmethod
+    def _change_dict(store: GraphStore, change: Dict[str, Any], offset: int) -> Dict[str, Any]:
+        event = change["event"]
+        ids = change["ids"]
+        item = {
+            "sequence": change["sequence"] + offset,
+            "event": event,
+            "summary": change["summary"],
+            "time": change["time"].isoformat(),
+            "nodes": [],
+            "edges": [],
+            "removed_node_ids": [],
+            "removed_edge_ids": [],
+        }
+        # Current attributes of added nodes and edges, so clients can insert them as they are now
+        if event == "nodes_added":
+            item["nodes"] = store.node_dicts(ids)
+        elif event == "edges_added":
+            item["edges"] = store.edge_dicts(ids)
+        elif event == "nodes_removed":
+            item["removed_node_ids"] = ids.tolist()
+        elif event == "edges_removed":
+            item["removed_edge_ids"] = ids.tolist()
+        return item
+
+    def recent_activity(self, count: int = 4) -> List[Dict[str, str]]:
+        """The latest changes as {action, time} lines for the dashboard, newest first"""
+        with self._lock:
+            changes = list(self._changes)[-count:]
+        return [{"action": change["summary"], "time": _when(change["time"])} for change in reversed(changes)]
+
+def _when(moment: datetime) -> str:
+    today = datetime.now().date()
+    if moment.date() == today:
+        day = "Today"
+    elif moment.date() == today - timedelta(days=1):
+        day = "Yesterday"
+    else:
+        day = f"{(today - moment.date()).days} days ago"
+    return f"{day} at {moment.hour % 12 or 12}:{moment:%M %p}"
+
+graph_changelog = ChangeLog(graph_store)
@@ -0,0 +1,313 @@
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from .graph_store import GraphStore, graph_store
+
+IDEAL_EDGE_LENGTH = float(os.environ.get("LAYOUT_EDGE_LENGTH", 80))
+LAYOUT_ITERATIONS = int(os.environ.get("LAYOUT_ITERATIONS", 50))
+INCREMENTAL_ITERATIONS = 30
+# Above this share of changed nodes, re-lay-out everything rather than the changed neighborhoods
+INCREMENTAL_LIMIT = 0.25
+INCREMENTAL_MIN = 100  # Changes this small always stay incremental, so small graphs don't jump around
+CELL_SAMPLE = 16  # Most members of one grid cell a node is repelled by individually
+MARGIN = 40.0
+
+_NEIGHBOR_CELLS = [(dx, dy) for dy in (-1, 0, 1) for dx in (-1, 0, 1) if dx or dy]
+
+def _repulsion(x: np.ndarray, y: np.ndarray, movers: np.ndarray, k: float, rng: np.random.Generator):
+    """
+    Repulsive force k^2 / d on each mover, on a uniform grid with cells of 2k
+    (the grid variant of Fruchterman-Reingold: farther nodes are ignored).
+    Nodes in the mover's own cell push individually, a random run of at most
+    CELL_SAMPLE of them weighted up to stand for the rest; each adjacent cell
+    pushes as one mass at its centroid. So an iteration costs O(nodes) even
+    where clusters pack many nodes into one cell.
+    """
+    cell = 2 * k
+    cx = np.floor(x / cell).astype(np.int64)
+    cy = np.floor(y / cell).astype(np.int64)
+    cx -= cx.min() - 1
+    cy -= cy.min() - 1
+    width = int(cx.max()) + 2
+    keys = cy * width + cx
+    order = np.argsort(keys)
+    cells, starts, inverse, counts = np.unique(keys[order], return_index=True, return_inverse=True, return_counts=True)
+    mean_x = np.bincount(inverse, weights=x[order]) / counts
+    mean_y = np.bincount(inverse, weights=y[order]) / counts
+
+    grid_size = (int(cy.max()) + 2) * width
+    if grid_size <= 8 * len(x) + 1024:
+        # Dense cell -> slot table; random lookups into it beat searchsorted
+        table = np.full(grid_size, -1, dtype=np.int64)
+        table[cells] = np.arange(len(cells))
+        def find(wanted):
+            return table[wanted]
+    else:
+        # Sparse drawing (a few far-flung nodes): search the sorted cell keys
+        def find(wanted):
+            slot = np.searchsorted(cells, wanted)
+            slot[slot == len(cells)] = 0
+            return np.where(cells[slot] == wanted, slot, -1)
+
+    m = len(movers)
+    position = np.arange(m)
+    mover_keys = keys[movers]
+    fx = np.zeros(m)
+    fy = np.zeros(m)
+
+    def push(p, ddx, ddy, weight):
+        d2 = np.maximum(ddx * ddx + ddy * ddy, 0.01)
+        f = np.where(d2 < cell * cell, weight * k * k / d2, 0.0)
+        fx[:] += np.bincount(p, weights=ddx * f, minlength=m)
+        fy[:] += np.bincount(p, weights=ddy * f, minlength=m)
+
+    # Own cell, node by node
+    slot = find(mover_keys)
+    count = counts[slot]
+    take = np.minimum(count, CELL_SAMPLE)
+    start = starts[slot] + (rng.random(m) * (count - take + 1)).astype(np.int64)
+    weight = np.repeat(count / take, take)
+    p = np.repeat(position, take)
+    first = np.repeat(np.cumsum(take) - take, take)
+    j = order[np.repeat(start, take) + np.arange(len(p)) - first]
+    i = movers[p]
+    keep = i != j
+    push(p[keep], x[i[keep]] - x[j[keep]], y[i[keep]] - y[j[keep]], weight[keep])
+
+    # Adjacent cells, as their centroids
+    for dx, dy in _NEIGHBOR_CELLS:
+        wanted = mover_keys + dy * width + dx
+        slot = find(wanted)
+        found = slot >= 0
+        p = position[found]
+        slot = slot[found]
+        i = movers[p]
+        push(p, x[i] - mean_x[slot], y[i] - mean_y[slot], counts[slot])
+
+    return fx, fy
+
+def _near(x: np.ndarray, y: np.ndarray, movers: np.ndarray, reach: float) -> np.ndarray:
+    """Mask of nodes within about reach of a mover, via a coarse grid of reach-sized cells"""
+    cx = np.floor(x / reach).astype(np.int64)
+    cy = np.floor(y / reach).astype(np.int64)
+    cx -= cx.min() - 1
+    cy -= cy.min() - 1
+    width = int(cx.max()) + 2
+    keys = cy * width + cx
+    mover_keys = np.unique(keys[movers])
+    wanted = np.unique(np.concatenate([mover_keys + dy * width + dx for dy in (-1, 0, 1) for dx in (-1, 0, 1)]))
+    return np.isin(keys, wanted)
+
+def force_layout(
+    x: np.ndarray,
+    y: np.ndarray,
+    src: np.ndarray,
+    dst: np.ndarray,
+    movers: Optional[np.ndarray] = None,
+    iterations: int = LAYOUT_ITERATIONS,
+    temperature: Optional[float] = None,
+    k: float = IDEAL_EDGE_LENGTH,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Fruchterman-Reingold over dense local indices, vectorized with NumPy.
+    Only movers (default: every node) change position; the rest still exert
+    forces. With the grid approximation of repulsion an iteration costs
+    O(nodes + edges) instead of O(nodes^2).
+    """
+    n = len(x)
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    movers = np.arange(n) if movers is None else movers
+    m = len(movers)
+    if not n or not m:
+        return x, y
+    rng = np.random.default_rng(n)
+    if temperature is None:
+        temperature = k * np.sqrt(n) / 4
+
+    # Only edges with a moving end pull on anything, indexed by mover position
+    position = np.full(n, -1, dtype=np.int64)
+    position[movers] = np.arange(m)
+    pulling = (position[src] >= 0) | (position[dst] >= 0)
+    src, dst = src[pulling], dst[pulling]
+
+    if m < n:
+        # Fixed nodes farther than movers can drift plus the grid's reach never matter
+        near = _near(x, y, movers, temperature * iterations / 2 + 6 * k)
+        near[src] = True
+        near[dst] = True
+        if not near.all():
+            subset = np.flatnonzero(near)
+            local = np.full(n, -1, dtype=np.int64)
+            local[subset] = np.arange(len(subset))
+            x[subset], y[subset] = force_layout(
+                x[subset], y[subset], local[src], local[dst], local[movers], iterations, temperature, k,
+            )
+            return x, y
+    src_position, dst_position = position[src], position[dst]
+    src_moves, dst_moves = src_position >= 0, dst_position >= 0
+
+    for step in range(iterations):
+        fx, fy = _repulsion(x, y, movers, k, rng)
+
+        # Attraction d^2 / k along edges
+        if len(src):
+            ddx = x[dst] - x[src]
+            ddy = y[dst] - y[src]
+            f = np.sqrt(ddx * ddx + ddy * ddy) / k
+            fx += np.bincount(src_position[src_moves], weights=(ddx * f)[src_moves], minlength=m)
+            fy += np.bincount(src_position[src_moves], weights=(ddy * f)[src_moves], minlength=m)
+            fx -= np.bincount(dst_position[dst_moves], weights=(ddx * f)[dst_moves], minlength=m)
+            fy -= np.bincount(dst_position[dst_moves], weights=(ddy * f)[dst_moves], minlength=m)
+
+        # Move at most the current temperature, which cools linearly
+        t = temperature * (1 - step / iterations)
+        length = np.maximum(np.hypot(fx, fy), 1e-9)
+        scale = np.minimum(length, t) / length
+        x[movers] += fx * scale
+        y[movers] += fy * scale
+
+    return x, y
+
+class LayoutEngine:
+    """
+    Keeps node coordinates in the graph store laid out. Mutations only
+    record which nodes changed; ensure() then re-lays-out just those nodes
+    and their neighbors (everything else stays put), or the whole graph when
+    most of it changed. The result is cached per graph version, and the
+    heavy work runs without holding the store lock.
+    """
+
+    def __init__(self, store: GraphStore):
+        self.store = store
+        self.version = store.version  # Graph version the coordinates match
+        self.generation = 0  # Bumped whenever layout writes coordinates, which doesn't change the graph version
+        self._dirty = set()
+        self._unplaced = set()
+        self._full = False
+        self._resets = 0
+        self._lock = threading.Lock()  # One layout run at a time
+        with store.lock:
+            alive = store.alive_node_ids()
+            # Graphs loaded without coordinates get a full layout; hand-placed ones are kept
+            if len(alive) and not (store.node_x.view()[alive].any() or store.node_y.view()[alive].any()):
+                self._full = True
+                self.version = -1
+            store.add_listener(self._on_change)
+
+    def _on_change(self, event: str, payload: Dict[str, Any]):
+        ids = payload["ids"]
+        if event == "reset":
+            # A restored graph comes with its coordinates unless they are all zero
+            store = self.store
+            self._resets += 1
+            self._dirty = set()
+            self._unplaced = set()
+            self._full = bool(len(ids)) and not (store.node_x.view()[ids].any() or store.node_y.view()[ids].any())
+            self.version = -1 if self._full else store.version
+        elif event == "nodes_added":
+            self._dirty.update(ids.tolist())
+            self._unplaced.update(ids.tolist())
+        elif event in ("edges_added", "edges_removed"):
+            self._dirty.update(self.store.edge_src.view()[ids].tolist())
+            self._dirty.update(self.store.edge_dst.view()[ids].tolist())
+        elif event == "nodes_removed":
+            self._dirty.difference_update(ids.tolist())
+            self._unplaced.difference_update(ids.tolist())
+
+    def relayout(self):
+        """Lay out the whole graph again on the next ensure()"""
+        with self.store.lock:
+            self._full = True
+            self.version = -1
+
+    def ensure(self) -> int:
+        """Bring coordinates up to date with the graph; returns the version they match"""
+        with self._lock:
+            store = self.store
+            with store.lock:
+                if self.version == store.version:
+                    return self.version
+                version = store.version
+                resets = self._resets
+                ids = store.alive_node_ids()
+                local = np.full(store.node_capacity, -1, dtype=np.int64)
+                local[ids] = np.arange(len(ids))
+                edge_ids = store.alive_edge_ids()
+                src = local[store.edge_src.view()[edge_ids]]
+                dst = local[store.edge_dst.view()[edge_ids]]
+                x = store.node_x.view()[ids].astype(np.float64)
+                y = store.node_y.view()[ids].astype(np.float64)
+                dirty = np.array(sorted(self._dirty), dtype=np.int64)
+                unplaced = np.array(sorted(self._unplaced), dtype=np.int64)
+                full = self._full or len(dirty) > max(INCREMENTAL_LIMIT * len(ids), INCREMENTAL_MIN)
+                self._dirty = set()
+                self._unplaced = set()
+                self._full = False
+
+            if len(ids):
+                x, y = self._layout(x, y, src, dst, local[dirty], local[unplaced], full)
+
+            with store.lock:
+                if self._resets != resets:
+                    # The graph was replaced meanwhile; these coordinates belong to the old one
+                    return version
+                # Nodes removed meanwhile just get coordinates nobody reads
+                store.node_x.writable()[ids] = x
+                store.node_y.writable()[ids] = y
+                self.generation += 1
+                self.version = version if store.version == version else self.version
+            return version
+
+    def _layout(self, x, y, src, dst, dirty, unplaced, full):
+        n = len(x)
+        k = IDEAL_EDGE_LENGTH
+        rng = np.random.default_rng(n)
+        side = k * np.sqrt(max(n, 1))
+
+        # New nodes start next to their placed neighbors, or anywhere if they have none
+        if len(unplaced):
+            placed = np.ones(n, dtype=np.bool_)
+            placed[unplaced] = False
+            if full and not placed.any():
+                x[:] = rng.uniform(0, side, n)
+                y[:] = rng.uniform(0, side, n)
+            else:
+                both_src = np.concatenate([src, dst])
+                both_dst = np.concatenate([dst, src])
+                usable = placed[both_dst]
+                weight = np.bincount(both_src[usable], minlength=n)
+                sum_x = np.bincount(both_src[usable], weights=x[both_dst[usable]], minlength=n)
+                sum_y = np.bincount(both_src[usable], weights=y[both_dst[usable]], minlength=n)
+                has_neighbors = weight[unplaced] > 0
+                if placed.any():
+                    x0, x1, y0, y1 = x[placed].min(), x[placed].max(), y[placed].min(), y[placed].max()
+                else:
+                    x0, x1, y0, y1 = 0.0, side, 0.0, side
+                x[unplaced] = np.where(has_neighbors, sum_x[unplaced] / np.maximum(weight[unplaced], 1), rng.uniform(x0, x1, len(unplaced)))
+                y[unplaced] = np.where(has_neighbors, sum_y[unplaced] / np.maximum(weight[unplaced], 1), rng.uniform(y0, y1, len(unplaced)))
+                x[unplaced] += rng.normal(0, k / 4, len(unplaced))
+                y[unplaced] += rng.normal(0, k / 4, len(unplaced))
+
+        if full:
+            x, y = force_layout(x, y, src, dst)
+        elif len(dirty):
+            # The changed nodes and their direct neighbors move; the rest of the graph is fixed
+            touched = np.zeros(n, dtype=np.bool_)
+            touched[dirty] = True
+            near = touched[src] | touched[dst]
+            touched[src[near]] = True
+            touched[dst[near]] = True
+            x, y = force_layout(x, y, src, dst, movers=np.flatnonzero(touched),
+                                iterations=INCREMENTAL_ITERATIONS, temperature=k)
+
+        if full:
+            # Keep the drawing in positive coordinates with a margin, like the original sample
+            x += MARGIN - x.min()
+            y += MARGIN - y.min()
+        return x, y
+
+layout_engine = LayoutEngine(graph_store)
@@ -0,0 +1,202 @@
+import threading
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from .graph_store import GraphStore, graph_store
+
+def _find(parent: np.ndarray, nodes: np.ndarray) -> np.ndarray:
+    """Roots of the given nodes, compressing their paths on the way"""
+    roots = parent[nodes]
+    while True:
+        up = parent[roots]
+        if np.array_equal(up, roots):
+            break
+        roots = up
+    parent[nodes] = roots
+    return roots
+
+def _merge(parent: np.ndarray, size: np.ndarray, src: np.ndarray, dst: np.ndarray) -> int:
+    """
+    Union-find over a batch of edges, vectorized: the roots the edges touch
+    are merged by hooking onto the smallest root and pointer jumping until
+    stable. Returns how many components disappeared.
+    """
+    rs = _find(parent, src)
+    rd = _find(parent, dst)
+    joined = rs != rd
+    rs, rd = rs[joined], rd[joined]
+    if not len(rs):
+        return 0
+
+    roots, inverse = np.unique(np.concatenate([rs, rd]), return_inverse=True)
+    a, b = inverse[:len(rs)], inverse[len(rs):]
+    labels = np.arange(len(roots))
+    while True:
+        lowest = np.minimum(labels[a], labels[b])
+        hooked = labels.copy()
+        np.minimum.at(hooked, labels[a], lowest)
+        np.minimum.at(hooked, labels[b], lowest)
+        while True:
+            jumped = hooked[hooked]
+            if np.array_equal(jumped, hooked):
+                break
+            hooked = jumped
+        if np.array_equal(hooked, labels):
+            break
+        labels = hooked
+
+    # roots is sorted, so each component's label is its smallest root
+    new_roots = roots[labels]
+    merged = roots != new_roots
+    np.add.at(size, new_roots[merged], size[roots[merged]])
+    parent[roots[merged]] = new_roots[merged]
+    return int(merged.sum())
+
+class GraphMetricsTracker:
+    """
+    Keeps GraphMetrics for a GraphStore current as it changes, so reading
+    them is O(1) (O(max degree) for the distribution). Maintains per-node
+    degrees, a degree histogram and a union-find forest of connected
+    components. Removed nodes have already lost their edges, so they are
+    subtracted in place. An edge removal can split a component, which
+    union-find cannot undo, and telling whether it did needs the adjacency,
+    which the store itself rebuilds in O(E) after every change. So edge
+    removals mark components stale and the next read recounts them in one
+    vectorized pass over all edges: about 0.1s at 300k edges and 1.5s at
+    3M, against well under a millisecond after additions. Removal-heavy
+    workloads pay that once per read rather than once per removal.
+    """
+
+    def __init__(self, store: GraphStore):
+        self.store = store
+        self._lock = threading.Lock()
+        self._cache: Optional[Dict[str, Any]] = None
+        self._cache_version = -1
+        with store.lock:
+            self._rebuild()
+            store.add_listener(self._on_change)
+
+    def _grow(self, capacity: int):
+        if capacity <= len(self.degree):
+            return
+        new_capacity = max(capacity, 2 * len(self.degree))
+        extra = new_capacity - len(self.degree)
+        self.degree = np.concatenate([self.degree, np.zeros(extra, dtype=np.int64)])
+        self.parent = np.concatenate([self.parent, np.arange(len(self.parent), new_capacity, dtype=np.int64)])
+        self.size = np.concatenate([self.size, np.zeros(extra, dtype=np.int64)])
+
+    def _rebuild(self):
+        """Recompute everything from the store"""
+        store = self.store
+        capacity = max(store.node_capacity, 1)
+        alive = store.node_alive.view()
+        edge_ids = store.alive_edge_ids()
+        src = store.edge_src.view()[edge_ids].astype(np.int64)
+        dst = store.edge_dst.view()[edge_ids].astype(np.int64)
+
+        self.degree = np.zeros(capacity, dtype=np.int64)
+        np.add.at(self.degree, src, 1)
+        np.add.at(self.degree, dst, 1)
+        self.histogram = np.bincount(self.degree[:store.node_capacity][alive], minlength=1).astype(np.int64)
+        self._rebuild_components(src, dst)
+
+    def _reset(self):
+        """
+        After the whole graph is replaced: degrees come from the (usually
+        prebuilt) undirected adjacency, components are left for the first read
+        """
+        store = self.store
+        capacity = max(store.node_capacity, 1)
+        self.degree = np.zeros(capacity, dtype=np.int64)
+        self.degree[:store.node_capacity] = np.diff(store.csr("both").offsets)
+        self.histogram = np.bincount(self.degree[:store.node_capacity][store.node_alive.view()], minlength=1).astype(np.int64)
+        self.parent = np.arange(capacity, dtype=np.int64)
+        self.size = np.zeros(capacity, dtype=np.int64)
+        self.components_stale = True
+
+    def _rebuild_components(self, src=None, dst=None):
+        store = self.store
+        if src is None:
+            edge_ids = store.alive_edge_ids()
+            src = store.edge_src.view()[edge_ids].astype(np.int64)
+            dst = store.edge_dst.view()[edge_ids].astype(np.int64)
+        capacity = len(self.degree)
+        alive = np.zeros(capacity, dtype=np.bool_)
+        alive[:store.node_capacity] = store.node_alive.view()
+        self.parent = np.arange(capacity, dtype=np.int64)
+        self.size = alive.astype(np.int64)
+        self.components = int(alive.sum()) - _merge(self.parent, self.size, src, dst)
+        self.largest = int(self.size.max()) if capacity else 0
+        self.components_stale = False
+
+    def _count_degrees(self, nodes: np.ndarray, sign: int):
+        touched = np.unique(nodes)
+        np.subtract.at(self.histogram, self.degree[touched], 1)
+        np.add.at(self.degree, nodes, sign)
+        top = int(self.degree[touched].max())
+        if top >= len(self.histogram):
+            self.histogram = np.concatenate([self.histogram, np.zeros(top + 1 - len(self.histogram), dtype=np.int64)])
+        np.add.at(self.histogram, self.degree[touched], 1)
+
+    def _on_change(self, event: str, payload: Dict[str, Any]):
+        store = self.store
+        ids = payload["ids"]
+        with self._lock:
+            if event == "reset":
+                self._reset()
+            elif event == "nodes_added":
+                self._grow(store.node_capacity)
+                self.histogram[0] += len(ids)
+                self.size[ids] = 1
+                self.components += len(ids)
+                self.largest = max(self.largest, 1)
+            elif event == "nodes_removed":
+                # Their edges are already gone, so they sit in the degree 0 bucket
+                self.histogram[0] -= len(ids)
+                if not self.components_stale:
+                    # Removing their edges would have marked components stale, so they were never merged
+                    self.size[ids] = 0
+                    self.components -= len(ids)
+            elif event == "edges_added":
+                src = store.edge_src.view()[ids].astype(np.int64)
+                dst = store.edge_dst.view()[ids].astype(np.int64)
+                self._count_degrees(np.concatenate([src, dst]), 1)
+                if not self.components_stale:
+                    self.components -= _merge(self.parent, self.size, src, dst)
+                    roots = _find(self.parent, src)
+                    self.largest = max(self.largest, int(self.size[roots].max()))
+            elif event == "edges_removed":
+                src = store.edge_src.view()[ids].astype(np.int64)
+                dst = store.edge_dst.view()[ids].astype(np.int64)
+                self._count_degrees(np.concatenate([src, dst]), -1)
+                self.components_stale = True
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current metrics in the GraphMetrics shape, cached per graph version"""
+        store = self.store
+        with store.lock, self._lock:
+            if self._cache is not None and self._cache_version == store.version:
+                return self._cache
+            if self.components_stale:
+                self._rebuild_components()
+
+            nodes = store.node_count
+            edges = store.edge_count
+            nonzero = np.flatnonzero(self.histogram)
+            self._cache = {
+                "total_nodes": nodes,
+                "total_edges": edges,
+                # Directed density: edges over possible ordered pairs
+                "density": round(edges / (nodes * (nodes - 1)), 6) if nodes > 1 else 0.0,
+                "avg_degree": round(2 * edges / nodes, 4) if nodes else 0.0,
+                "max_degree": int(nonzero[-1]) if len(nonzero) else 0,
+                "isolated_nodes": int(self.histogram[0]),
+                "connected_components": self.components,
+                "largest_component": self.largest if nodes else 0,
+                "degree_distribution": [[int(d), int(self.histogram[d])] for d in nonzero],
+            }
+            self._cache_version = store.version
+            return self._cache
+
+graph_metrics = GraphMetricsTracker(graph_store)
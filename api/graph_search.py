@@ -0,0 +1,306 @@
+import bisect
+import heapq
+import os
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .graph_store import GraphStore, StringTable, graph_store
+
+MAX_SEARCH_RESULTS = int(os.environ.get("MAX_SEARCH_RESULTS", 50))
+# Lowest trigram similarity (shared / all distinct trigrams of both) a fuzzy match needs
+FUZZY_THRESHOLD = float(os.environ.get("SEARCH_FUZZY_THRESHOLD", 0.3))
+# Labels and nodes added since the last full build are kept in small side indexes up to this many
+SEARCH_DELTA_MIN = int(os.environ.get("SEARCH_DELTA_MIN", 10000))
+# Side indexes kept before they are merged in the background
+SEARCH_MAX_SEGMENTS = int(os.environ.get("SEARCH_MAX_SEGMENTS", 8))
+
+def normalize(label: str) -> str:
+    """Case-folded with runs of whitespace collapsed, the form labels are matched in"""
+    return " ".join(label.replace("\0", " ").casefold().split())
+
+def _trigrams(texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Distinct (text index, trigram) pairs of normalized texts, sorted by
+    trigram, each text padded with two spaces in front and one behind as in
+    pg_trgm so short words and word starts count. Vectorized over all texts
+    at once; a trigram is its three characters packed into one int64.
+    """
+    if not len(texts):
+        return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int64)
+    joined = "\0".join(f"  {text} " for text in texts)
+    points = np.frombuffer(joined.encode("utf-32-le"), dtype=np.uint32)
+    lengths = np.fromiter((len(text) + 3 for text in texts), dtype=np.int64, count=len(texts))
+    owner = np.repeat(np.arange(len(texts), dtype=np.int64), lengths + 1)[:len(points) - 2]
+    separator = points == 0
+    valid = ~(separator[:-2] | separator[1:-1] | separator[2:])
+
+    raw = (points[:-2].astype(np.int64) << 42) | (points[1:-1].astype(np.int64) << 21) | points[2:]
+    owner, raw = owner[valid], raw[valid]
+
+    # Sorting one int64 key is several times faster than lexsort. Characters
+    # renumbered densely (in order) usually leave room for the text index.
+    present = np.zeros(int(points.max()) + 1, dtype=np.bool_)
+    present[points] = True
+    alphabet = int(present.sum())
+    if alphabet ** 3 * len(texts) < 2 ** 63:
+        dense = np.cumsum(present) - 1
+        grams = (dense[raw >> 42] * alphabet + dense[(raw >> 21) & 0x1FFFFF]) * alphabet + dense[raw & 0x1FFFFF]
+        keys = np.unique(grams * len(texts) + owner)
+        grams, owner = np.divmod(keys, len(texts))
+        chars = np.flatnonzero(present).astype(np.int64)
+        first, rest = np.divmod(grams, alphabet * alphabet)
+        second, third = np.divmod(rest, alphabet)
+        return owner.astype(np.int32), (chars[first] << 42) | (chars[second] << 21) | chars[third]
+    order = np.lexsort((owner, raw))
+    owner, raw = owner[order], raw[order]
+    keep = np.r_[True, (np.diff(raw) != 0) | (np.diff(owner) != 0)]
+    return owner[keep].astype(np.int32), raw[keep]
+
+class LabelIndex:
+    """
+    Immutable index over a set of labels: their normalized forms sorted
+    for prefix search by binary search, and a trigram inverted index
+    (sorted trigrams with CSR postings) for fuzzy search.
+    """
+
+    def __init__(self, codes: np.ndarray, texts: List[str]):
+        order = sorted(range(len(texts)), key=texts.__getitem__)
+        self.codes = codes[np.asarray(order, dtype=np.int64)] if order else codes[:0]
+        # Kept as one UTF-8 blob: binary search decodes only the keys it visits
+        keys = StringTable()
+        keys.strings = [texts[i] for i in order]
+        self.keys = StringTable.from_blob(*keys.to_blob())
+
+        owner, grams = _trigrams(keys.strings)
+        self.trigram_count = np.bincount(owner, minlength=len(self.codes)).astype(np.int32)
+        self.grams, starts = np.unique(grams, return_index=True)
+        self.offsets = np.r_[starts, len(grams)].astype(np.int64)
+        self.postings = owner  # Already grouped by trigram
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def prefix(self, text: str) -> Iterator[Tuple[str, int]]:
+        """(normalized label, code) of the labels starting with text, in alphabetical order"""
+        for position in range(bisect.bisect_left(self.keys, text), len(self.codes)):
+            key = self.keys[position]
+            if not key.startswith(text):
+                break
+            yield key, int(self.codes[position])
+
+    def fuzzy(self, grams: np.ndarray, limit: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (codes, similarities) of the up to limit labels most similar to the
+        query trigrams, if at least FUZZY_THRESHOLD, best first
+        """
+        found = np.searchsorted(self.grams, grams)
+        hit = found < len(self.grams)
+        hit[hit] = self.grams[found[hit]] == grams[hit]
+        found = found[hit]
+        if not len(found):
+            return np.empty(0, dtype=np.int32), np.empty(0)
+        postings = np.concatenate([
+            self.postings[start:end] for start, end in zip(self.offsets[found].tolist(), self.offsets[found + 1].tolist())
+        ])
+        # Counting beats sorting here: postings of common trigrams run to many thousands
+        shared = np.bincount(postings, minlength=len(self.codes))
+        # similarity <= shared / len(grams), so fewer shared trigrams can't reach the threshold
+        labels = np.flatnonzero(shared >= FUZZY_THRESHOLD * len(grams))
+        shared = shared[labels]
+        similarity = shared / (len(grams) + self.trigram_count[labels] - shared)
+        keep = np.flatnonzero(similarity >= FUZZY_THRESHOLD)
+        if len(keep) > limit:
+            keep = keep[np.argpartition(-similarity[keep], limit - 1)[:limit]]
+        keep = keep[np.argsort(-similarity[keep], kind="stable")]
+        return self.codes[labels[keep]], similarity[keep]
+
+class NodeIndex:
+    """Nodes grouped by label code (CSR), for the nodes of a range of node ids"""
+
+    def __init__(self, labels: np.ndarray, first_id: int):
+        self.ids = (np.argsort(labels, kind="stable") + first_id).astype(np.int32)
+        # Spans only the label codes these nodes use, so a small segment stays small
+        self.first_label = int(labels.min()) if len(labels) else 0
+        label_count = int(labels.max()) + 1 - self.first_label if len(labels) else 0
+        self.offsets = np.zeros(label_count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(labels - self.first_label, minlength=label_count), out=self.offsets[1:])
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def nodes(self, code: int) -> np.ndarray:
+        code -= self.first_label
+        if not 0 <= code < len(self.offsets) - 1:
+            return self.ids[:0]
+        return self.ids[self.offsets[code]:self.offsets[code + 1]]
+
+class SearchIndex:
+    """
+    Label search over a GraphStore for typeahead. Labels are interned
+    append-only, so the index covers label codes: a full LabelIndex over
+    the labels present at the last build, and small segments over the
+    labels interned since, one appended per search that finds new labels.
+    Once there are more than SEARCH_MAX_SEGMENTS, a background thread
+    merges them into one, or folds them into a full build once they
+    outgrow SEARCH_DELTA_MIN or a quarter of the base. Nodes are found per
+    label the same way; removed nodes are skipped when results are read. A
+    graph reset (e.g. loading a snapshot) starts a full build in the
+    background. Indexes are built outside the store lock from copies of
+    the labels.
+    """
+
+    def __init__(self, store: GraphStore):
+        self.store = store
+        self._base: Optional[LabelIndex] = None
+        self._base_nodes: Optional[NodeIndex] = None
+        # (first label code, index) and (first node id, index), contiguous after the base
+        self._segments: List[Tuple[int, LabelIndex]] = []
+        self._node_segments: List[Tuple[int, NodeIndex]] = []
+        self._labels_end = 0  # Labels and nodes covered so far
+        self._nodes_end = 0
+        self._resets = 0
+        self._lock = threading.Lock()  # Guards the fields above
+        self._append_lock = threading.Lock()  # One foreground build at a time
+        self._compact_lock = threading.Lock()
+        store.add_listener(self._on_change)
+
+    def _on_change(self, event: str, payload: Dict[str, Any]):
+        if event == "reset":
+            with self._lock:
+                self._base = None
+                self._resets += 1
+            threading.Thread(target=self.ensure, daemon=True).start()
+
+    def _labels(self, start: int, end: int) -> List[str]:
+        """Labels with codes start to end; call with the store locked"""
+        table = self.store.labels
+        return table.all()[:end] if start == 0 else [table[code] for code in range(start, end)]
+
+    @staticmethod
+    def _label_index(start: int, labels: List[str]) -> LabelIndex:
+        return LabelIndex(np.arange(start, start + len(labels), dtype=np.int32), [normalize(label) for label in labels])
+
+    def ensure(self):
+        """Bring the index up to date with the store"""
+        store = self.store
+        with self._append_lock:
+            with store.lock:
+                labels, nodes = len(store.labels), store.node_capacity
+                with self._lock:
+                    full = self._base is None
+                    labels_end, nodes_end = (0, 0) if full else (self._labels_end, self._nodes_end)
+                    resets = self._resets
+                if labels_end == labels and nodes_end == nodes:
+                    return
+                texts = self._labels(labels_end, labels)
+                node_labels = store.node_label.view()[nodes_end:nodes].copy()
+
+            label_index = self._label_index(labels_end, texts)
+            node_index = NodeIndex(node_labels, nodes_end)
+            with self._lock:
+                if self._resets != resets:
+                    # The graph was replaced meanwhile; the new build is already on its way
+                    return
+                if full:
+                    self._base, self._base_nodes = label_index, node_index
+                    self._segments, self._node_segments = [], []
+                else:
+                    if len(label_index):
+                        self._segments.append((labels_end, label_index))
+                    if len(node_index):
+                        self._node_segments.append((nodes_end, node_index))
+                self._labels_end, self._nodes_end = labels, nodes
+                compact = max(len(self._segments), len(self._node_segments)) > SEARCH_MAX_SEGMENTS
+        if compact and self._compact_lock.acquire(blocking=False):
+            threading.Thread(target=self._compact, daemon=True).start()
+
+    def _compact(self):
+        """Merge the segments into one, or into a new full build once they are big; holds _compact_lock"""
+        store = self.store
+        try:
+            with store.lock:
+                with self._lock:
+                    if self._base is None:
+                        return
+                    base_labels, base_nodes = len(self._base), len(self._base_nodes)
+                    labels_end, nodes_end = self._labels_end, self._nodes_end
+                    resets = self._resets
+                full = (labels_end - base_labels > max(SEARCH_DELTA_MIN, base_labels // 4)
+                        or nodes_end - base_nodes > max(SEARCH_DELTA_MIN, base_nodes // 4))
+                labels_start, nodes_start = (0, 0) if full else (base_labels, base_nodes)
+                texts = self._labels(labels_start, labels_end)
+                node_labels = store.node_label.view()[nodes_start:nodes_end].copy()
+
+            label_index = self._label_index(labels_start, texts)
+            node_index = NodeIndex(node_labels, nodes_start)
+            with self._lock:
+                if self._resets != resets:
+                    return
+                # Keep segments appended while this ran
+                segments = [(start, index) for start, index in self._segments if start >= labels_end]
+                node_segments = [(start, index) for start, index in self._node_segments if start >= nodes_end]
+                if full:
+                    self._base, self._base_nodes = label_index, node_index
+                else:
+                    segments.insert(0, (labels_start, label_index))
+                    node_segments.insert(0, (nodes_start, node_index))
+                self._segments, self._node_segments = segments, node_segments
+        finally:
+            self._compact_lock.release()
+
+    def _nodes(self, code: int) -> np.ndarray:
+        ids = np.concatenate([self._base_nodes.nodes(code)] + [index.nodes(code) for _, index in self._node_segments])
+        return ids[self.store.node_alive.view()[ids]]
+
+    def search(self, query: str, limit: int = 10, mode: str = "auto") -> List[Dict[str, Any]]:
+        """
+        Nodes whose label matches query, best first: exact matches, then
+        labels starting with query in alphabetical order, then (mode "auto"
+        when those don't fill limit, or "fuzzy") labels sharing enough
+        trigrams with it, most similar first. Each result is a node with
+        match ("exact", "prefix" or "fuzzy") and score.
+        """
+        text = normalize(query)
+        if not text:
+            return []
+        self.ensure()
+        store = self.store
+        with store.lock, self._lock:
+            if self._base is None:
+                # The graph was replaced since ensure()
+                return []
+            indexes = [self._base] + [index for _, index in self._segments]
+            results: List[Dict[str, Any]] = []
+            matched = set()
+
+            def add(code: int, match: str, score: float):
+                matched.add(code)
+                for node in store.node_dicts(self._nodes(code)[:limit - len(results)]):
+                    node["match"] = match
+                    node["score"] = score
+                    results.append(node)
+
+            if mode in ("auto", "prefix"):
+                # Labels whose nodes were all removed yield nothing, so walk the ranges lazily
+                for key, code in heapq.merge(*(index.prefix(text) for index in indexes)):
+                    if len(results) >= limit:
+                        break
+                    add(code, "exact" if key == text else "prefix", round(len(text) / len(key), 4))
+
+            if mode == "fuzzy" or (mode == "auto" and len(results) < limit):
+                _, grams = _trigrams([text])
+                # Room for labels already matched by prefix, or without live nodes
+                wanted = 2 * limit + len(matched)
+                codes, scores = zip(*(index.fuzzy(grams, wanted) for index in indexes))
+                codes, scores = np.concatenate(codes), np.concatenate(scores)
+                order = np.lexsort((codes, -scores))
+                for code, score in zip(codes[order].tolist(), scores[order].tolist()):
+                    if len(results) >= limit:
+                        break
+                    if code not in matched:
+                        add(code, "fuzzy", round(score, 4))
+            return results
+
+search_index = SearchIndex(graph_store)
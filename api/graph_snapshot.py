@@ -0,0 +1,328 @@
+"""
+Binary graph snapshots that workers memory-map read-only.
+
+A snapshot file is a small preamble, a JSON header and then flat
+little-endian arrays, each aligned to 64 bytes:
+
+    magic b"RSWGRAPH" | uint32 format version | uint32 reserved | uint64 header length
+    JSON header: graph version, counts, entity index names, and per section
+                 its dtype, offset from the start of the data and item count
+    data: node and edge attribute arrays, CSR offsets / neighbors / edge ids
+          per direction, string tables as UTF-8 blobs with offsets, and the
+          entity index of graph builds
+
+Loading maps the file and points the graph store at the arrays without
+reading them, so startup takes milliseconds, and every worker that maps the
+same file shares one copy through the page cache. An array is copied into
+the worker's own memory only when the graph is changed.
+
+Workers also poll the snapshot and switch to a newer one another worker
+wrote, as long as their own graph hasn't changed since they last loaded or
+saved one.
+
+    python -m api.graph_snapshot [path]    # print what a snapshot holds
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .graph_builder import EntityIndex, entity_index, run_build_job
+from .graph_changelog import graph_changelog
+from .graph_store import CSR, GraphStore, StringTable, graph_store
+
+GRAPH_SNAPSHOT_PATH = Path(os.environ.get("GRAPH_SNAPSHOT_PATH", Path(__file__).parent / "graph.snapshot"))
+# Write a snapshot whenever a graph build completes, so restarted workers pick it up
+GRAPH_SNAPSHOT_ON_BUILD = os.environ.get("GRAPH_SNAPSHOT_ON_BUILD", "true").lower() in ("1", "true", "yes")
+# How often workers check for a snapshot newer than their graph; 0 turns it off
+GRAPH_SNAPSHOT_POLL_SECONDS = float(os.environ.get("GRAPH_SNAPSHOT_POLL_SECONDS", 10))
+
+MAGIC = b"RSWGRAPH"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+_PREAMBLE = struct.Struct("<8sIIQ")
+DIRECTIONS = ("out", "in", "both")
+
+class SnapshotError(ValueError):
+    """The file is not a snapshot this code can read"""
+
+def _align(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+def _string_sections(name: str, table: StringTable) -> List[Tuple[str, np.ndarray]]:
+    blob, offsets = table.to_blob()
+    return [(f"{name}.blob", np.frombuffer(blob, dtype=np.uint8)), (f"{name}.offsets", offsets)]
+
+def _collect(store: GraphStore, index: EntityIndex) -> Tuple[Dict[str, Any], List[Tuple[str, np.ndarray]]]:
+    """Header fields and (name, array) sections of the current graph; call with the store locked"""
+    sections = [(name, getattr(store, name).view()) for name in store.NODE_ARRAYS + store.EDGE_ARRAYS]
+    for name in store.STRING_TABLES:
+        sections += _string_sections(name, getattr(store, name))
+    for direction in DIRECTIONS:
+        csr = store.csr(direction)
+        sections += [(f"csr.{direction}.{field}", getattr(csr, field)) for field in CSR._fields]
+
+    node_index, edge_index = index.export()
+    for i, (keys, ids) in enumerate(node_index.values()):
+        sections += _string_sections(f"index.nodes.{i}", keys) + [(f"index.nodes.{i}.ids", ids)]
+    for i, (pairs, ids) in enumerate(edge_index.values()):
+        sections += [(f"index.edges.{i}.pairs", pairs), (f"index.edges.{i}.ids", ids)]
+
+    header = {
+        "graph_version": store.version,
+        "created_at": datetime.now().isoformat(),
+        "node_count": store.node_count,
+        "edge_count": store.edge_count,
+        "index_epoch": index.epoch,
+        "index_node_types": list(node_index),
+        "index_edge_types": list(edge_index),
+    }
+    return header, sections
+
+def save_snapshot(
+    path: Path = GRAPH_SNAPSHOT_PATH,
+    store: GraphStore = graph_store,
+    index: EntityIndex = entity_index,
+) -> Dict[str, Any]:
+    """
+    Write the graph to path. The file is written next to it and renamed
+    into place, so readers see either the old snapshot or the new one.
+    The store stays locked while the arrays are written.
+    """
+    path = Path(path)
+    started = time.perf_counter()
+    # Unique per writer: another worker may be saving the same snapshot right now
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        with store.lock:
+            header, sections = _collect(store, index)
+            offset = 0
+            header["sections"] = {}
+            for name, array in sections:
+                offset = _align(offset)
+                header["sections"][name] = {"dtype": array.dtype.str, "offset": offset, "count": len(array)}
+                offset += array.nbytes
+            encoded = json.dumps(header).encode("utf-8")
+            data_start = _align(_PREAMBLE.size + len(encoded))
+
+            with open(tmp, "wb") as f:
+                f.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, 0, len(encoded)))
+                f.write(encoded)
+                for name, array in sections:
+                    f.write(b"\0" * (data_start + header["sections"][name]["offset"] - f.tell()))
+                    f.write(np.ascontiguousarray(array).data)
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+    snapshot_watcher.synced(path, store, header["created_at"], header["graph_version"], header["graph_version"])
+
+    info = snapshot_info(path)
+    info["save_seconds"] = round(time.perf_counter() - started, 3)
+    print(f"Saved graph snapshot {path}: {info['node_count']} nodes, {info['edge_count']} edges, "
+          f"{info['size_bytes'] / 1e6:.1f} MB in {info['save_seconds']}s")
+    return info
+
+def _read_header(buffer) -> Tuple[Dict[str, Any], int]:
+    if len(buffer) < _PREAMBLE.size:
+        raise SnapshotError("File is too short to be a graph snapshot")
+    magic, version, _, header_length = _PREAMBLE.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise SnapshotError("Not a graph snapshot")
+    if version != FORMAT_VERSION:
+        raise SnapshotError(f"Unsupported snapshot format {version} (expected {FORMAT_VERSION})")
+    end = _PREAMBLE.size + header_length
+    if end > len(buffer):
+        raise SnapshotError("Snapshot header is truncated")
+    try:
+        header = json.loads(bytes(buffer[_PREAMBLE.size:end]))
+    except ValueError as e:
+        raise SnapshotError(f"Snapshot header is corrupt: {e}")
+    return header, _align(end)
+
+def snapshot_info(path: Path = GRAPH_SNAPSHOT_PATH) -> Dict[str, Any]:
+    """What a snapshot file holds, from its header only"""
+    path = Path(path)
+    with open(path, "rb") as f:
+        preamble = f.read(_PREAMBLE.size)
+        if len(preamble) == _PREAMBLE.size:
+            preamble += f.read(_PREAMBLE.unpack(preamble)[3])
+        header, _ = _read_header(preamble)
+    return {
+        "path": str(path),
+        "format": FORMAT_VERSION,
+        "size_bytes": path.stat().st_size,
+        "graph_version": header["graph_version"],
+        "created_at": header["created_at"],
+        "node_count": header["node_count"],
+        "edge_count": header["edge_count"],
+    }
+
+def load_snapshot(
+    path: Path = GRAPH_SNAPSHOT_PATH,
+    store: GraphStore = graph_store,
+    index: EntityIndex = entity_index,
+    if_version: Optional[int] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    Map the snapshot read-only and make it the store's graph, replacing
+    whatever the store held; the entity index of graph builds comes with it.
+    With if_version, only if the store is still at that version (else None).
+    Raises SnapshotError if the file is not a valid snapshot.
+    """
+    path = Path(path)
+    started = time.perf_counter()
+    with open(path, "rb") as f:
+        # The mapping stays valid after the file is closed
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    header, data_start = _read_header(mapped)
+
+    def section(name: str) -> np.ndarray:
+        spec = header["sections"].get(name)
+        if spec is None:
+            raise SnapshotError(f"Snapshot has no {name} section")
+        dtype = np.dtype(spec["dtype"])
+        start = data_start + spec["offset"]
+        if spec["count"] == 0:
+            return np.empty(0, dtype=dtype)
+        if start + spec["count"] * dtype.itemsize > len(mapped):
+            raise SnapshotError(f"Snapshot section {name} is truncated")
+        return np.frombuffer(mapped, dtype=dtype, count=spec["count"], offset=start)
+
+    def strings(name: str) -> StringTable:
+        return StringTable.from_blob(section(f"{name}.blob"), section(f"{name}.offsets"))
+
+    arrays = {name: section(name) for name in store.NODE_ARRAYS + store.EDGE_ARRAYS}
+    tables = {name: strings(name) for name in store.STRING_TABLES}
+    csr = {direction: CSR(*(section(f"csr.{direction}.{field}") for field in CSR._fields)) for direction in DIRECTIONS}
+    node_index = {
+        type_name: (strings(f"index.nodes.{i}"), section(f"index.nodes.{i}.ids"))
+        for i, type_name in enumerate(header["index_node_types"])
+    }
+    edge_index = {
+        type_name: (section(f"index.edges.{i}.pairs"), section(f"index.edges.{i}.ids"))
+        for i, type_name in enumerate(header["index_edge_types"])
+    }
+
+    nodes = len(arrays["node_alive"])
+    if any(len(arrays[name]) != nodes for name in store.NODE_ARRAYS) or any(
+        len(arrays[name]) != len(arrays["edge_alive"]) for name in store.EDGE_ARRAYS
+    ):
+        raise SnapshotError("Snapshot arrays have mismatched lengths")
+    if any(len(adjacency.offsets) != nodes + 1 for adjacency in csr.values()):
+        raise SnapshotError("Snapshot adjacency does not match its nodes")
+
+    with store.lock:
+        if if_version is not None and store.version != if_version:
+            return None
+        store.restore(arrays, tables, csr)
+        index.restore(node_index, edge_index, header["index_epoch"])
+        snapshot_watcher.synced(path, store, header["created_at"], store.version, header["graph_version"])
+
+    info = snapshot_info(path)
+    info["load_seconds"] = round(time.perf_counter() - started, 4)
+    return info
+
+def load_startup_snapshot() -> Optional[Dict[str, Any]]:
+    """Load GRAPH_SNAPSHOT_PATH if there is one; a bad file is reported and the built-in graph kept"""
+    if not GRAPH_SNAPSHOT_PATH.exists():
+        return None
+    try:
+        info = load_snapshot()
+        print(f"Loaded graph snapshot {GRAPH_SNAPSHOT_PATH}: {info['node_count']} nodes, "
+              f"{info['edge_count']} edges in {info['load_seconds'] * 1000:.1f}ms")
+        return info
+    except Exception as e:
+        print(f"Error loading graph snapshot {GRAPH_SNAPSHOT_PATH}: {e}")
+        return None
+
+class SnapshotWatcher:
+    """
+    Keeps this worker's graph on the latest snapshot at path: a background
+    thread reads the snapshot header every GRAPH_SNAPSHOT_POLL_SECONDS and
+    loads the file when another worker has written a new one. A graph that
+    changed here since the last snapshot this worker loaded or saved (e.g.
+    a build still running) is kept instead, until it is saved itself.
+    """
+
+    def __init__(self, path: Path, store: GraphStore, index: EntityIndex, poll_seconds: float):
+        self.path = Path(path)
+        self.store = store
+        self.index = index
+        self.poll_seconds = poll_seconds
+        self.created_at: Optional[str] = None  # Header of the snapshot the graph matches
+        self.version: Optional[int] = None  # Store version when it matched
+        self._stop = threading.Event()
+        self._thread = None
+
+    def synced(self, path: Path, store: GraphStore, created_at: str, version: int, sequence: int):
+        """Note that store matched the snapshot at path as of version, which the snapshot numbers sequence"""
+        if store is self.store and Path(path).resolve() == self.path.resolve():
+            self.created_at, self.version = created_at, version
+            graph_changelog.rebase(created_at, version, sequence)
+
+    def check(self):
+        """Load the snapshot if it is newer than the graph and the graph has no changes of its own"""
+        if not self.path.exists():
+            return
+        try:
+            info = snapshot_info(self.path)
+        except (OSError, SnapshotError) as e:
+            print(f"Error reading graph snapshot {self.path}: {e}")
+            return
+        if info["created_at"] == self.created_at or self.store.version != self.version:
+            return
+        try:
+            info = load_snapshot(self.path, self.store, self.index, if_version=self.version)
+        except (OSError, SnapshotError) as e:
+            print(f"Error loading graph snapshot {self.path}: {e}")
+            return
+        if info is not None:
+            print(f"Switched to graph snapshot {self.path} from {info['created_at']}: {info['node_count']} nodes, "
+                  f"{info['edge_count']} edges in {info['load_seconds'] * 1000:.1f}ms")
+
+    def start(self):
+        """Poll in the background; the graph as it is now counts as in sync"""
+        if self.version is None:
+            self.version = self.store.version
+        if self._thread is None and self.poll_seconds > 0:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="snapshot-watch", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join(self.poll_seconds + 1)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.poll_seconds):
+            self.check()
+
+snapshot_watcher = SnapshotWatcher(GRAPH_SNAPSHOT_PATH, graph_store, entity_index, GRAPH_SNAPSHOT_POLL_SECONDS)
+
+def build_and_snapshot(job_id: str):
+    """run_build_job, then save a snapshot if the build completed"""
+    if run_build_job(job_id) == "completed" and GRAPH_SNAPSHOT_ON_BUILD:
+        try:
+            save_snapshot()
+        except Exception as e:
+            print(f"Error saving graph snapshot after build {job_id}: {e}")
+
+def main():
+    path = Path(sys.argv[1]) if len(sys.argv) > 1 else GRAPH_SNAPSHOT_PATH
+    print(json.dumps(snapshot_info(path), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+import math
+import os
+import threading
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from .graph_layout import IDEAL_EDGE_LENGTH, LayoutEngine, layout_engine
+from .graph_store import GraphStore, graph_store
+
+# Most nodes (or clusters) and edges one viewport response carries
+MAX_VIEWPORT_NODES = int(os.environ.get("MAX_VIEWPORT_NODES", 2000))
+MAX_VIEWPORT_EDGES = int(os.environ.get("MAX_VIEWPORT_EDGES", 5000))
+# On-screen spacing of cluster super-nodes, in pixels
+CLUSTER_PIXELS = float(os.environ.get("CLUSTER_PIXELS", 40))
+BASE_CELL = IDEAL_EDGE_LENGTH  # Cell size of the node grid and of level 1 clusters
+
+def _ranges(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Concatenation of arange(start, end) for each pair, vectorized"""
+    lengths = ends - starts
+    total = int(lengths.sum())
+    if not total:
+        return np.empty(0, dtype=np.int64)
+    first = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(starts, lengths) + np.arange(total) - first
+
+class GridIndex:
+    """
+    Points bucketed into square cells and sorted row-major by cell, so a
+    box query reads one contiguous run of the sort order per cell row:
+    O(rows * log n + results).
+    """
+
+    def __init__(self, x: np.ndarray, y: np.ndarray, cell: float):
+        self.x = x
+        self.y = y
+        self.cell = cell
+        if not len(x):
+            return
+        cx = np.floor(x / cell).astype(np.int64)
+        cy = np.floor(y / cell).astype(np.int64)
+        self.col0 = int(cx.min())
+        self.row0 = int(cy.min())
+        self.width = int(cx.max()) - self.col0 + 1
+        self.height = int(cy.max()) - self.row0 + 1
+        keys = (cy - self.row0) * self.width + (cx - self.col0)
+        self.order = np.argsort(keys)
+        self.keys = keys[self.order]
+
+    def __len__(self) -> int:
+        return len(self.x)
+
+    def query(self, x0: float, y0: float, x1: float, y1: float) -> np.ndarray:
+        """Indices of the points inside the box, edges included"""
+        if not len(self.x):
+            return np.empty(0, dtype=np.int64)
+        col_lo = max(math.floor(x0 / self.cell) - self.col0, 0)
+        col_hi = min(math.floor(x1 / self.cell) - self.col0, self.width - 1)
+        row_lo = max(math.floor(y0 / self.cell) - self.row0, 0)
+        row_hi = min(math.floor(y1 / self.cell) - self.row0, self.height - 1)
+        if col_lo > col_hi or row_lo > row_hi:
+            return np.empty(0, dtype=np.int64)
+
+        rows = np.arange(row_lo, row_hi + 1, dtype=np.int64) * self.width
+        starts = np.searchsorted(self.keys, rows + col_lo, side="left")
+        ends = np.searchsorted(self.keys, rows + col_hi, side="right")
+        found = self.order[_ranges(starts, ends)]
+        # Cells on the border stick out of the box
+        x, y = self.x[found], self.y[found]
+        return found[(x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)]
+
+class ClusterLevel:
+    """
+    Nodes merged into one super-node per grid cell of BASE_CELL * 2^(level - 1):
+    member count, centroid, the most common type, and the best-connected
+    member as representative. Edges between clusters are merged too,
+    undirected, with how many graph edges each stands for.
+    """
+
+    def __init__(self, snapshot: "ViewportSnapshot", level: int):
+        self.level = level
+        self.cell = BASE_CELL * 2 ** (level - 1)
+        x, y = snapshot.x, snapshot.y
+        cx = np.floor(x / self.cell).astype(np.int64)
+        cy = np.floor(y / self.cell).astype(np.int64)
+        width = int(cx.max() - cx.min()) + 1
+        keys = (cy - cy.min()) * width + (cx - cx.min())
+        _, self.member_of, self.count = np.unique(keys, return_inverse=True, return_counts=True)
+        clusters = len(self.count)
+        self.x = np.bincount(self.member_of, weights=x, minlength=clusters) / self.count
+        self.y = np.bincount(self.member_of, weights=y, minlength=clusters) / self.count
+
+        # Most common type: count (cluster, type) pairs, keep the largest per cluster
+        type_count = int(snapshot.types.max()) + 1
+        pairs, pair_counts = np.unique(self.member_of * type_count + snapshot.types, return_counts=True)
+        pair_cluster = pairs // type_count
+        order = np.lexsort((-pair_counts, pair_cluster))
+        first = np.flatnonzero(np.r_[True, np.diff(pair_cluster[order]) != 0])
+        self.type = (pairs[order][first] % type_count).astype(np.int32)
+
+        # Representative: highest degree member
+        order = np.lexsort((-snapshot.degree, self.member_of))
+        first = np.flatnonzero(np.r_[True, np.diff(self.member_of[order]) != 0])
+        self.representative = snapshot.ids[order[first]]
+
+        a = self.member_of[snapshot.src]
+        b = self.member_of[snapshot.dst]
+        between = a != b
+        a, b = np.minimum(a[between], b[between]), np.maximum(a[between], b[between])
+        pairs, self.edge_count = np.unique(a * clusters + b, return_counts=True)
+        self.edge_src = pairs // clusters
+        self.edge_dst = pairs % clusters
+
+        self.grid = GridIndex(self.x, self.y, self.cell)
+
+class ViewportSnapshot:
+    """Laid-out node positions of one graph version, indexed for viewport queries"""
+
+    def __init__(self, store: GraphStore, version: int):
+        self.version = version
+        self.store = store
+        self.ids = store.alive_node_ids()
+        self.x = store.node_x.view()[self.ids].astype(np.float64)
+        self.y = store.node_y.view()[self.ids].astype(np.float64)
+        self.types = store.node_type.view()[self.ids]
+        self.csr = store.csr("both")
+        self.degree = self.csr.offsets[self.ids + 1] - self.csr.offsets[self.ids]
+
+        local = np.full(store.node_capacity, -1, dtype=np.int64)
+        local[self.ids] = np.arange(len(self.ids))
+        edge_ids = store.alive_edge_ids()
+        self.src = local[store.edge_src.view()[edge_ids]]
+        self.dst = local[store.edge_dst.view()[edge_ids]]
+
+        self.grid = GridIndex(self.x, self.y, BASE_CELL)
+        if len(self.ids):
+            extent = max(np.ptp(self.x), np.ptp(self.y), BASE_CELL)
+            # At the top level a couple of clusters cover the whole drawing
+            self.max_level = int(math.ceil(math.log2(extent / BASE_CELL))) + 1
+        else:
+            self.max_level = 0
+        self._levels: Dict[int, ClusterLevel] = {}
+        self._levels_lock = threading.Lock()
+
+    def level(self, level: int) -> ClusterLevel:
+        with self._levels_lock:
+            clusters = self._levels.get(level)
+            if clusters is None:
+                clusters = self._levels[level] = ClusterLevel(self, level)
+            return clusters
+
+class SpatialIndex:
+    """
+    Answers viewport queries (a box in graph coordinates plus a zoom in
+    pixels per graph unit) so the payload is bounded by the screen rather
+    than the graph. A viewport with at most MAX_VIEWPORT_NODES nodes gets
+    them individually, with their edges; a more crowded one gets cluster
+    super-nodes, and the edge bundles between them, from the level whose
+    cells are CLUSTER_PIXELS apart on screen, coarser if that still doesn't fit. The index is rebuilt per
+    graph version and layout run, and cluster levels are built on first use.
+    """
+
+    def __init__(self, store: GraphStore, layout: LayoutEngine):
+        self.store = store
+        self.layout = layout
+        self._snapshot: Optional[ViewportSnapshot] = None
+        self._key = None
+        self._lock = threading.Lock()
+
+    def snapshot(self) -> ViewportSnapshot:
+        self.layout.ensure()
+        with self._lock, self.store.lock:
+            # Layout moves nodes without a new graph version
+            key = (self.store.version, self.layout.generation)
+            if self._snapshot is None or self._key != key:
+                self._snapshot = ViewportSnapshot(self.store, self.store.version)
+                self._key = key
+            return self._snapshot
+
+    def viewport(self, x0: float, y0: float, x1: float, y1: float, zoom: float) -> Dict[str, Any]:
+        snapshot = self.snapshot()
+        visible = snapshot.grid.query(x0, y0, x1, y1)
+        result = {
+            "version": snapshot.version,
+            "level": 0,
+            "truncated": False,
+            "nodes": [],
+            "edges": [],
+            "clusters": [],
+            "cluster_edges": [],
+        }
+        if len(visible) <= MAX_VIEWPORT_NODES:
+            self._fill_nodes(snapshot, visible, result)
+            return result
+
+        # Cells CLUSTER_PIXELS apart on screen, and never finer than level 1
+        wanted_cell = CLUSTER_PIXELS / max(zoom, 1e-9)
+        level = min(max(1, int(math.ceil(math.log2(wanted_cell / BASE_CELL))) + 1), snapshot.max_level)
+        while True:
+            clusters = snapshot.level(level)
+            shown = clusters.grid.query(x0, y0, x1, y1)
+            if len(shown) <= MAX_VIEWPORT_NODES or level >= snapshot.max_level:
+                break
+            level += 1
+        result["level"] = level
+        self._fill_clusters(clusters, shown, result)
+        return result
+
+    def _fill_nodes(self, snapshot: ViewportSnapshot, visible: np.ndarray, result: Dict[str, Any]):
+        ids = snapshot.ids[visible]
+        positions, _ = snapshot.csr.rows(ids)
+        edge_ids = np.unique(snapshot.csr.edge_ids[positions])
+        if len(edge_ids) > MAX_VIEWPORT_EDGES:
+            edge_ids = edge_ids[:MAX_VIEWPORT_EDGES]
+            result["truncated"] = True
+        # Edges leaving the viewport bring their far end along so they can be drawn
+        store = self.store
+        ends = np.concatenate([ids, store.edge_src.view()[edge_ids], store.edge_dst.view()[edge_ids]])
+        result["nodes"] = store.node_dicts(np.unique(ends))
+        result["edges"] = store.edge_dicts(edge_ids)
+
+    def _fill_clusters(self, clusters: ClusterLevel, shown: np.ndarray, result: Dict[str, Any]):
+        flags = np.zeros(len(clusters.count), dtype=np.bool_)
+        flags[shown] = True
+        # Only bundles between shown clusters: at this zoom, lines off the screen are noise
+        edges = np.flatnonzero(flags[clusters.edge_src] & flags[clusters.edge_dst])
+        if len(edges) > MAX_VIEWPORT_EDGES:
+            # Keep the heaviest bundles
+            edges = edges[np.argsort(-clusters.edge_count[edges], kind="stable")[:MAX_VIEWPORT_EDGES]]
+            result["truncated"] = True
+        members = np.sort(shown)
+
+        store = self.store
+        labels = store.node_label.view()[clusters.representative[members]].tolist()
+        result["clusters"] = [
+            {
+                "id": cluster,
+                "label": store.labels[label],
+                "type": store.node_types[type_code],
+                "color": store.type_color(type_code),
+                "x": x,
+                "y": y,
+                "count": count,
+            }
+            for cluster, label, type_code, x, y, count in zip(
+                members.tolist(), labels, clusters.type[members].tolist(), clusters.x[members].tolist(),
+                clusters.y[members].tolist(), clusters.count[members].tolist(),
+            )
+        ]
+        result["cluster_edges"] = [
+            {"from_cluster": a, "to_cluster": b, "count": count}
+            for a, b, count in zip(
+                clusters.edge_src[edges].tolist(), clusters.edge_dst[edges].tolist(), clusters.edge_count[edges].tolist(),
+            )
+        ]
+
+spatial_index = SpatialIndex(graph_store, layout_engine)
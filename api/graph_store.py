@@ -0,0 +1,405 @@
+import threading
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Colours the UI uses for the built-in node types; other types cycle through the palette
+TYPE_COLORS = {
+    "Person": "#8B5CF6",
+    "Organization": "#EC4899",
+    "Location": "#3B82F6",
+    "Event": "#10B981",
+}
+PALETTE = ("#F59E0B", "#EF4444", "#14B8A6", "#6366F1", "#84CC16", "#F97316")
+
+class GrowableArray:
+    """
+    A NumPy array with amortised O(1) appends; view() is the filled part.
+    It can also wrap an existing array, such as a read-only memory map of a
+    snapshot, which is copied on the first write (writable() or extend()).
+    """
+
+    def __init__(self, dtype, capacity: int = 1024):
+        self._data = np.empty(capacity, dtype=dtype)
+        self.size = 0
+
+    @classmethod
+    def wrap(cls, array: np.ndarray) -> "GrowableArray":
+        wrapped = cls.__new__(cls)
+        wrapped._data = array
+        wrapped.size = len(array)
+        return wrapped
+
+    def __len__(self) -> int:
+        return self.size
+
+    def extend(self, values) -> int:
+        """Append values and return the index of the first one"""
+        values = np.asarray(values, dtype=self._data.dtype)
+        start = self.size
+        end = start + len(values)
+        if end > len(self._data):
+            grown = np.empty(max(end, 2 * len(self._data)), dtype=self._data.dtype)
+            grown[:start] = self._data[:start]
+            self._data = grown
+        self._data[start:end] = values
+        self.size = end
+        return start
+
+    def view(self) -> np.ndarray:
+        return self._data[:self.size]
+
+    def writable(self) -> np.ndarray:
+        """view() for updating in place"""
+        if not self._data.flags.writeable:
+            self._data = self._data.copy()
+        return self._data[:self.size]
+
+    @property
+    def nbytes(self) -> int:
+        return self._data.nbytes
+
+class StringTable:
+    """
+    Interns strings to dense int32 codes, so repeated labels and types are
+    stored once. A table loaded with from_blob() keeps its strings as one
+    UTF-8 blob with byte offsets, decodes them one at a time on access, and
+    only builds the string -> code dict when it is first needed.
+    """
+
+    def __init__(self):
+        self.strings: List[str] = []  # Strings added after the blob
+        self._codes: Optional[Dict[str, int]] = {}
+        self._blob = b""
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._frozen = 0  # Strings held in the blob
+
+    @classmethod
+    def from_blob(cls, blob, offsets: np.ndarray) -> "StringTable":
+        table = cls()
+        table._blob = blob
+        table._offsets = offsets
+        table._frozen = len(offsets) - 1
+        table._codes = None
+        return table
+
+    def to_blob(self) -> Tuple[bytes, np.ndarray]:
+        encoded = [value.encode("utf-8") for value in self.all()]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)), out=offsets[1:])
+        return b"".join(encoded), offsets
+
+    def __len__(self) -> int:
+        return self._frozen + len(self.strings)
+
+    def __getitem__(self, code: int) -> str:
+        if code < self._frozen:
+            return bytes(self._blob[self._offsets[code]:self._offsets[code + 1]]).decode("utf-8")
+        return self.strings[code - self._frozen]
+
+    def all(self) -> List[str]:
+        offsets = self._offsets.tolist()
+        return [bytes(self._blob[start:end]).decode("utf-8") for start, end in zip(offsets, offsets[1:])] + self.strings
+
+    @property
+    def codes(self) -> Dict[str, int]:
+        if self._codes is None:
+            self._codes = {value: code for code, value in enumerate(self.all()[:self._frozen])}
+        return self._codes
+
+    def intern(self, value: str) -> int:
+        codes = self.codes
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(self)
+            self.strings.append(value)
+        return code
+
+    def intern_many(self, values: Sequence[str]) -> np.ndarray:
+        # Intern the distinct values first so the bulk lookup runs at C speed
+        for value in dict.fromkeys(values):
+            self.intern(value)
+        return np.fromiter(map(self.codes.__getitem__, values), dtype=np.int32, count=len(values))
+
+    def lookup(self, value: str) -> Optional[int]:
+        return self.codes.get(value)
+
+class CSR(NamedTuple):
+    """Compressed sparse rows: the neighbors of node i are neighbors[offsets[i]:offsets[i + 1]]"""
+    offsets: np.ndarray  # int64, one more entry than there are node ids
+    neighbors: np.ndarray  # int32 node ids
+    edge_ids: np.ndarray  # int32 id of the edge behind each neighbor entry
+
+    def rows(self, nodes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Positions of the given nodes' entries in neighbors/edge_ids, row after row, and each row's length"""
+        starts = self.offsets[nodes]
+        lengths = self.offsets[nodes + 1] - starts
+        total = int(lengths.sum())
+        if not total:
+            return np.empty(0, dtype=np.int64), lengths
+        first = np.repeat(np.cumsum(lengths) - lengths, lengths)
+        return np.repeat(starts, lengths) + np.arange(total) - first, lengths
+
+class GraphStore:
+    """
+    Knowledge graph held in flat NumPy arrays: one slot per node (interned
+    label and type codes, coordinates) and per edge (source, target,
+    interned relationship type). Ids are array indices and never reused;
+    removal only clears the alive flag.
+
+    Adjacency is served as CSR arrays, built on demand and cached until the
+    next mutation. Every mutation bumps version and is reported to the
+    listeners registered with add_listener(fn), called as fn(event, payload)
+    while the store lock is held. restore() replaces the whole graph and
+    reports a "reset" event.
+    """
+
+    NODE_ARRAYS = ("node_label", "node_type", "node_alive", "node_x", "node_y")
+    EDGE_ARRAYS = ("edge_src", "edge_dst", "edge_type", "edge_alive")
+    STRING_TABLES = ("labels", "node_types", "edge_types")
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.labels = StringTable()
+        self.node_types = StringTable()
+        self.edge_types = StringTable()
+
+        self.node_label = GrowableArray(np.int32)
+        self.node_type = GrowableArray(np.int32)
+        self.node_alive = GrowableArray(np.bool_)
+        self.node_x = GrowableArray(np.float32)
+        self.node_y = GrowableArray(np.float32)
+
+        self.edge_src = GrowableArray(np.int32)
+        self.edge_dst = GrowableArray(np.int32)
+        self.edge_type = GrowableArray(np.int32)
+        self.edge_alive = GrowableArray(np.bool_)
+
+        self.node_count = 0  # Alive nodes
+        self.edge_count = 0  # Alive edges
+        self.version = 0
+        self._listeners: List[Callable[[str, Dict[str, Any]], None]] = []
+        self._csr_cache: Dict[str, CSR] = {}
+        self._csr_version = -1
+
+    @property
+    def lock(self) -> threading.RLock:
+        return self._lock
+
+    @property
+    def node_capacity(self) -> int:
+        """Number of node ids handed out so far, including removed ones"""
+        return len(self.node_label)
+
+    def add_listener(self, fn: Callable[[str, Dict[str, Any]], None]):
+        with self._lock:
+            self._listeners.append(fn)
+
+    def _changed(self, event: str, **payload):
+        self.version += 1
+        for listener in self._listeners:
+            try:
+                listener(event, payload)
+            except Exception as e:
+                # A broken listener must not leave the store half-updated
+                print(f"Error in graph listener for {event}: {e}")
+
+    # Mutations
+
+    def add_nodes(self, labels: Sequence[str], types: Sequence[str], x=None, y=None) -> np.ndarray:
+        """Add nodes and return their ids"""
+        count = len(labels)
+        if len(types) != count:
+            raise ValueError("labels and types must have the same length")
+        with self._lock:
+            start = self.node_label.extend(self.labels.intern_many(labels))
+            self.node_type.extend(self.node_types.intern_many(types))
+            self.node_alive.extend(np.ones(count, dtype=np.bool_))
+            self.node_x.extend(np.zeros(count) if x is None else x)
+            self.node_y.extend(np.zeros(count) if y is None else y)
+            self.node_count += count
+            ids = np.arange(start, start + count, dtype=np.int32)
+            self._changed("nodes_added", ids=ids)
+            return ids
+
+    def add_node(self, label: str, type_name: str, x: float = 0.0, y: float = 0.0) -> int:
+        return int(self.add_nodes([label], [type_name], [x], [y])[0])
+
+    def add_edges(self, src, dst, types: Sequence[str]) -> np.ndarray:
+        """Add edges between existing nodes and return their ids"""
+        src = np.asarray(src, dtype=np.int32)
+        dst = np.asarray(dst, dtype=np.int32)
+        if not (len(src) == len(dst) == len(types)):
+            raise ValueError("src, dst and types must have the same length")
+        with self._lock:
+            alive = self.node_alive.view()
+            endpoints = np.concatenate([src, dst])
+            if len(endpoints) and (endpoints.min() < 0 or endpoints.max() >= len(alive) or not alive[endpoints].all()):
+                raise ValueError("Edges must connect existing nodes")
+            start = self.edge_src.extend(src)
+            self.edge_dst.extend(dst)
+            self.edge_type.extend(self.edge_types.intern_many(types))
+            self.edge_alive.extend(np.ones(len(src), dtype=np.bool_))
+            self.edge_count += len(src)
+            ids = np.arange(start, start + len(src), dtype=np.int32)
+            self._changed("edges_added", ids=ids)
+            return ids
+
+    def add_edge(self, src: int, dst: int, type_name: str) -> int:
+        return int(self.add_edges([src], [dst], [type_name])[0])
+
+    def remove_edges(self, ids) -> np.ndarray:
+        """Remove edges; returns the ids that were actually alive"""
+        ids = np.unique(np.asarray(ids, dtype=np.int32))
+        with self._lock:
+            alive = self.edge_alive.view()
+            ids = ids[(ids >= 0) & (ids < len(alive))]
+            ids = ids[alive[ids]]
+            if len(ids):
+                self.edge_alive.writable()[ids] = False
+                self.edge_count -= len(ids)
+                self._changed("edges_removed", ids=ids)
+            return ids
+
+    def remove_nodes(self, ids) -> np.ndarray:
+        """Remove nodes together with their edges; returns the ids that were actually alive"""
+        ids = np.unique(np.asarray(ids, dtype=np.int32))
+        with self._lock:
+            alive = self.node_alive.view()
+            ids = ids[(ids >= 0) & (ids < len(alive))]
+            ids = ids[alive[ids]]
+            if not len(ids):
+                return ids
+            # Incident edges go first, so listeners always see edges between live nodes
+            edge_alive = self.edge_alive.view()
+            incident = edge_alive & (np.isin(self.edge_src.view(), ids) | np.isin(self.edge_dst.view(), ids))
+            self.remove_edges(np.flatnonzero(incident))
+            self.node_alive.writable()[ids] = False
+            self.node_count -= len(ids)
+            self._changed("nodes_removed", ids=ids)
+            return ids
+
+    def restore(self, arrays: Dict[str, np.ndarray], tables: Dict[str, StringTable], csr: Dict[str, CSR]):
+        """
+        Replace the whole graph, e.g. with the memory-mapped arrays of a
+        snapshot, which are used in place until something writes to them.
+        Prebuilt CSR adjacency is adopted as the cache.
+        """
+        with self._lock:
+            for name in self.NODE_ARRAYS + self.EDGE_ARRAYS:
+                setattr(self, name, GrowableArray.wrap(arrays[name]))
+            for name in self.STRING_TABLES:
+                setattr(self, name, tables[name])
+            self.node_count = int(np.count_nonzero(self.node_alive.view()))
+            self.edge_count = int(np.count_nonzero(self.edge_alive.view()))
+            self._csr_cache = dict(csr)
+            self._csr_version = self.version + 1
+            self._changed("reset", ids=self.alive_node_ids())
+
+    # Reads
+
+    def alive_edge_ids(self) -> np.ndarray:
+        return np.flatnonzero(self.edge_alive.view()).astype(np.int32)
+
+    def alive_node_ids(self) -> np.ndarray:
+        return np.flatnonzero(self.node_alive.view()).astype(np.int32)
+
+    def csr(self, direction: str = "out") -> CSR:
+        """Adjacency of live edges; direction is "out", "in" or "both" (undirected)"""
+        with self._lock:
+            if self._csr_version != self.version:
+                self._csr_cache = {}
+                self._csr_version = self.version
+            cached = self._csr_cache.get(direction)
+            if cached is not None:
+                return cached
+
+            edge_ids = self.alive_edge_ids()
+            src = self.edge_src.view()[edge_ids]
+            dst = self.edge_dst.view()[edge_ids]
+            if direction == "out":
+                keys, values = src, dst
+            elif direction == "in":
+                keys, values = dst, src
+            elif direction == "both":
+                keys, values = np.concatenate([src, dst]), np.concatenate([dst, src])
+                edge_ids = np.concatenate([edge_ids, edge_ids])
+            else:
+                raise ValueError(f"Unknown direction: {direction}")
+
+            order = np.argsort(keys)
+            offsets = np.zeros(self.node_capacity + 1, dtype=np.int64)
+            np.cumsum(np.bincount(keys, minlength=self.node_capacity), out=offsets[1:])
+            result = CSR(offsets, values[order].astype(np.int32), edge_ids[order].astype(np.int32))
+            self._csr_cache[direction] = result
+            return result
+
+    def type_color(self, type_code: int) -> str:
+        name = self.node_types[type_code]
+        return TYPE_COLORS.get(name) or PALETTE[type_code % len(PALETTE)]
+
+    def node_dicts(self, ids=None) -> List[Dict[str, Any]]:
+        """Nodes in the GraphNode shape; all live nodes unless ids are given"""
+        with self._lock:
+            ids = self.alive_node_ids() if ids is None else np.asarray(ids, dtype=np.int32)
+            labels = self.node_label.view()[ids].tolist()
+            types = self.node_type.view()[ids].tolist()
+            xs = self.node_x.view()[ids].tolist()
+            ys = self.node_y.view()[ids].tolist()
+            colors = [self.type_color(code) for code in range(len(self.node_types))]
+            return [
+                {
+                    "id": node_id,
+                    "label": self.labels[label],
+                    "type": self.node_types[type_code],
+                    "color": colors[type_code],
+                    "x": x,
+                    "y": y,
+                }
+                for node_id, label, type_code, x, y in zip(ids.tolist(), labels, types, xs, ys)
+            ]
+
+    def edge_dicts(self, ids=None) -> List[Dict[str, Any]]:
+        """Edges in the GraphEdge shape; all live edges unless ids are given"""
+        with self._lock:
+            ids = self.alive_edge_ids() if ids is None else np.asarray(ids, dtype=np.int32)
+            src = self.edge_src.view()[ids].tolist()
+            dst = self.edge_dst.view()[ids].tolist()
+            types = self.edge_type.view()[ids].tolist()
+            return [
+                {"id": edge_id, "from_node": s, "to_node": d, "label": self.edge_types[t]}
+                for edge_id, s, d, t in zip(ids.tolist(), src, dst, types)
+            ]
+
+    def to_dict(self) -> Dict[str, List[Dict[str, Any]]]:
+        with self._lock:
+            return {"nodes": self.node_dicts(), "edges": self.edge_dicts()}
+
+    def memory_bytes(self) -> int:
+        """Approximate size of the array storage (excluding interned strings)"""
+        arrays = (
+            self.node_label, self.node_type, self.node_alive, self.node_x, self.node_y,
+            self.edge_src, self.edge_dst, self.edge_type, self.edge_alive,
+        )
+        return sum(array.nbytes for array in arrays) + sum(
+            csr.offsets.nbytes + csr.neighbors.nbytes + csr.edge_ids.nbytes for csr in self._csr_cache.values()
+        )
+
+def seed_sample_graph(store: GraphStore):
+    """The demo graph the KGInsights pages have always shown"""
+    ids = store.add_nodes(
+        ["Person A", "Person B", "Organization X", "Location Y", "Event Z"],
+        ["Person", "Person", "Organization", "Location", "Event"],
+        x=[150, 250, 100, 200, 300],
+        y=[100, 150, 200, 250, 100],
+    )
+    person_a, person_b, organization_x, location_y, event_z = ids.tolist()
+    store.add_edges(
+        [person_a, person_a, person_b, organization_x, location_y],
+        [person_b, organization_x, location_y, event_z, event_z],
+        ["knows", "works at", "lives in", "hosts", "location of"],
+    )
+
+# Graph served by the KGInsights API (one per worker)
+graph_store = GraphStore()
+seed_sample_graph(graph_store)
@@ -0,0 +1,195 @@
+import os
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .graph_store import CSR, GraphStore
+
+MAX_HOPS = int(os.environ.get("MAX_TRAVERSAL_HOPS", 6))
+# Most nodes one neighborhood response carries; a bigger ego network is cut off
+MAX_TRAVERSAL_NODES = int(os.environ.get("MAX_TRAVERSAL_NODES", 5000))
+
+DIRECTIONS = ("out", "in", "both")
+_REVERSE = {"out": "in", "in": "out", "both": "both"}
+
+def _check_node(store: GraphStore, node_id: int):
+    alive = store.node_alive.view()
+    if not 0 <= node_id < len(alive) or not alive[node_id]:
+        raise KeyError(node_id)
+
+def _type_filter(store: GraphStore, edge_types: Optional[Sequence[str]]) -> Optional[np.ndarray]:
+    """Mask over edge type codes, or None for no filter; unknown labels simply match nothing"""
+    if not edge_types:
+        return None
+    allowed = np.zeros(max(len(store.edge_types), 1), dtype=np.bool_)
+    codes = [store.edge_types.lookup(label) for label in edge_types]
+    allowed[[code for code in codes if code is not None]] = True
+    return allowed
+
+def _expand(store: GraphStore, csr: CSR, frontier: np.ndarray, allowed: Optional[np.ndarray]):
+    """
+    Every (from node, neighbor, edge id) step out of the frontier, following
+    only edges whose type is allowed.
+    """
+    positions, lengths = csr.rows(frontier)
+    origins = np.repeat(frontier, lengths)
+    neighbors = csr.neighbors[positions]
+    edge_ids = csr.edge_ids[positions]
+    if allowed is not None:
+        keep = allowed[store.edge_type.view()[edge_ids]]
+        origins, neighbors, edge_ids = origins[keep], neighbors[keep], edge_ids[keep]
+    return origins, neighbors, edge_ids
+
+def neighbors(
+    store: GraphStore,
+    node_id: int,
+    edge_types: Optional[Sequence[str]] = None,
+    direction: str = "both",
+    limit: int = MAX_TRAVERSAL_NODES,
+) -> Dict[str, Any]:
+    """Direct neighbors of a node, optionally only along edges with the given relationship labels"""
+    with store.lock:
+        _check_node(store, node_id)
+        frontier = np.array([node_id], dtype=np.int32)
+        _, found, edge_ids = _expand(store, store.csr(direction), frontier, _type_filter(store, edge_types))
+        truncated = len(edge_ids) > limit
+        edge_ids = edge_ids[:limit]
+        found = found[:limit]
+        return {
+            "nodes": store.node_dicts(np.unique(found)),
+            "edges": store.edge_dicts(edge_ids),
+            "truncated": bool(truncated),
+        }
+
+def k_hop(
+    store: GraphStore,
+    node_id: int,
+    hops: int,
+    edge_types: Optional[Sequence[str]] = None,
+    direction: str = "both",
+    limit: int = MAX_TRAVERSAL_NODES,
+) -> Dict[str, Any]:
+    """
+    Ego network: every node within hops steps of node_id and the edges among
+    them. Level-synchronous BFS over the CSR arrays, one vectorized
+    expansion per hop. Stops at limit nodes, marking the result truncated.
+    """
+    with store.lock:
+        _check_node(store, node_id)
+        csr = store.csr(direction)
+        allowed = _type_filter(store, edge_types)
+        distance = np.full(store.node_capacity, -1, dtype=np.int32)
+        distance[node_id] = 0
+        reached = [np.array([node_id], dtype=np.int32)]
+        total = 1
+        truncated = False
+        frontier = reached[0]
+
+        for hop in range(1, hops + 1):
+            _, found, _ = _expand(store, csr, frontier, allowed)
+            frontier = np.unique(found[distance[found] < 0])
+            if not len(frontier):
+                break
+            if total + len(frontier) > limit:
+                frontier = frontier[:limit - total]
+                truncated = True
+            distance[frontier] = hop
+            reached.append(frontier)
+            total += len(frontier)
+            if truncated:
+                break
+
+        nodes = np.concatenate(reached)
+        # Edges among the reached nodes; each edge sits in its source's "out" row exactly once
+        origins, targets, edge_ids = _expand(store, store.csr("out"), nodes, allowed)
+        edge_ids = np.sort(edge_ids[distance[targets] >= 0])
+
+        node_dicts = store.node_dicts(np.sort(nodes))
+        for node in node_dicts:
+            node["distance"] = int(distance[node["id"]])
+        return {
+            "center": node_id,
+            "hops": hops,
+            "nodes": node_dicts,
+            "edges": store.edge_dicts(edge_ids),
+            "truncated": truncated,
+        }
+
+def _path_to(parent: np.ndarray, parent_edge: np.ndarray, node: int) -> Tuple[list, list]:
+    nodes, edges = [node], []
+    while parent[node] >= 0:
+        edges.append(int(parent_edge[node]))
+        node = int(parent[node])
+        nodes.append(node)
+    return nodes, edges
+
+def shortest_path(
+    store: GraphStore,
+    source: int,
+    target: int,
+    edge_types: Optional[Sequence[str]] = None,
+    direction: str = "both",
+    max_hops: int = MAX_HOPS,
+) -> Dict[str, Any]:
+    """
+    Fewest-hop path from source to target, by bidirectional BFS: one search
+    from each end, always growing the smaller frontier by a whole level,
+    until they meet. direction is how edges may be followed from the source
+    ("out" follows edges forward); the target side follows them reversed.
+    """
+    with store.lock:
+        _check_node(store, source)
+        _check_node(store, target)
+        not_found = {"found": False, "length": None, "nodes": [], "edges": []}
+        if source == target:
+            return {"found": True, "length": 0, "nodes": store.node_dicts([source]), "edges": []}
+
+        allowed = _type_filter(store, edge_types)
+        capacity = store.node_capacity
+        sides = []
+        for start, side_direction in ((source, direction), (target, _REVERSE[direction])):
+            distance = np.full(capacity, -1, dtype=np.int32)
+            distance[start] = 0
+            sides.append({
+                "csr": store.csr(side_direction),
+                "distance": distance,
+                "parent": np.full(capacity, -1, dtype=np.int32),
+                "parent_edge": np.full(capacity, -1, dtype=np.int32),
+                "frontier": np.array([start], dtype=np.int32),
+                "depth": 0,
+            })
+
+        meet = -1
+        while sides[0]["depth"] + sides[1]["depth"] < max_hops:
+            if not len(sides[0]["frontier"]) or not len(sides[1]["frontier"]):
+                return not_found
+            grow, other = (0, 1) if len(sides[0]["frontier"]) <= len(sides[1]["frontier"]) else (1, 0)
+            side, opposite = sides[grow], sides[other]
+
+            origins, found, edge_ids = _expand(store, side["csr"], side["frontier"], allowed)
+            new = side["distance"][found] < 0
+            found, first = np.unique(found[new], return_index=True)
+            side["depth"] += 1
+            side["distance"][found] = side["depth"]
+            side["parent"][found] = origins[new][first]
+            side["parent_edge"][found] = edge_ids[new][first]
+            side["frontier"] = found
+
+            # Whole levels are expanded, so the best meeting node found now is optimal
+            met = found[opposite["distance"][found] >= 0]
+            if len(met):
+                meet = int(met[np.argmin(opposite["distance"][met])])
+                break
+
+        if meet < 0:
+            return not_found
+        forward_nodes, forward_edges = _path_to(sides[0]["parent"], sides[0]["parent_edge"], meet)
+        backward_nodes, backward_edges = _path_to(sides[1]["parent"], sides[1]["parent_edge"], meet)
+        nodes = forward_nodes[::-1] + backward_nodes[1:]
+        edges = forward_edges[::-1] + backward_edges
+        return {
+            "found": True,
+            "length": len(edges),
+            "nodes": store.node_dicts(nodes),
+            "edges": store.edge_dicts(edges),
+        }
@@ -1,81 +1,341 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+from datetime import datetime
+import json
 import random
+import uuid
 
-from .models import User, get_db
-from .auth import get_current_active_user, has_role
-from .data_models import GraphNode, GraphEdge, GraphMetrics, KGraphDashboard
+from .models import GraphBuildJob, UploadedFile, get_db, run_db
+from .auth import get_current_active_user, has_role, Principal
+from .data_models import (
+    GraphMetrics, GraphViewport, GraphSubgraph, GraphNeighborhood, GraphPath, KGraphDashboard,
+    GraphBuildRequest, GraphChanges, GraphSearchHit, AnalyticsNode, GraphAnalytics,
+)
+from .graph_store import graph_store
+from .graph_metrics import graph_metrics
+from .graph_changelog import graph_changelog
+from .graph_layout import layout_engine
+from .graph_spatial import spatial_index
+from .graph_search import MAX_SEARCH_RESULTS, search_index
+from .graph_traversal import MAX_HOPS, MAX_TRAVERSAL_NODES, k_hop, neighbors, shortest_path
+from .graph_builder import (
+    GRAPH_BUILD_CHUNK_SIZE, MappingError, file_headers, is_resumable, job_dict, validate_mapping,
+)
+from .graph_analytics import NODE_METRICS, analytics_engine
+from .graph_snapshot import GRAPH_SNAPSHOT_PATH, SnapshotError, build_and_snapshot, save_snapshot, snapshot_info
 
 # Router
 router = APIRouter(prefix="/api/kginsights", tags=["kginsights"])
 
-# Generate sample data
-def generate_graph_nodes():
-    return [
-        GraphNode(id=1, label="Person A", type="Person", color="#8B5CF6", x=150, y=100),
-        GraphNode(id=2, label="Person B", type="Person", color="#8B5CF6", x=250, y=150),
-        GraphNode(id=3, label="Organization X", type="Organization", color="#EC4899", x=100, y=200),
-        GraphNode(id=4, label="Location Y", type="Location", color="#3B82F6", x=200, y=250),
-        GraphNode(id=5, label="Event Z", type="Event", color="#10B981", x=300, y=100)
-    ]
-
-def generate_graph_edges():
-    return [
-        GraphEdge(id=1, from_node=1, to_node=2, label="knows"),
-        GraphEdge(id=2, from_node=1, to_node=3, label="works at"),
-        GraphEdge(id=3, from_node=2, to_node=4, label="lives in"),
-        GraphEdge(id=4, from_node=3, to_node=5, label="hosts"),
-        GraphEdge(id=5, from_node=4, to_node=5, label="location of")
-    ]
-
-def generate_graph_metrics():
-    return GraphMetrics(
-        total_nodes=1245,
-        total_edges=3872,
-        density=0.68,
-        avg_degree=6.2
-    )
-
-def generate_graph_updates():
-    return [
-        {"action": "Graph updated", "time": "Today at 11:30 AM"},
-        {"action": "New nodes added", "time": "Yesterday at 3:45 PM"},
-        {"action": "Relationships modified", "time": "2 days ago at 9:20 AM"},
-        {"action": "Data source connected", "time": "3 days ago at 2:15 PM"}
-    ]
+def laid_out_graph() -> Dict[str, Any]:
+    """
+    The graph with up-to-date coordinates and the latest analytics on its
+    nodes, and the change log position it matches for fetching /updates
+    after it. Layout can take a while, so call it off the event loop.
+    """
+    layout_engine.ensure()
+    with graph_store.lock:
+        graph = graph_store.to_dict()
+        graph["version"] = graph_changelog.sequence(graph_store.version)
+        graph["epoch"] = graph_changelog.epoch
+    analytics_engine.annotate(graph["nodes"])
+    return graph
+
+def laid_out_changes(since: Optional[int], limit: int, epoch: Optional[str]) -> Dict[str, Any]:
+    """A page of graph changes, with added nodes at their laid-out positions rather than the origin"""
+    layout_engine.ensure()
+    return graph_changelog.changes(since, limit, epoch)
+
+def numbered_viewport(x0: float, y0: float, x1: float, y1: float, zoom: float) -> Dict[str, Any]:
+    """A viewport with its version in the change log's numbering, as /updates takes it"""
+    viewport = spatial_index.viewport(x0, y0, x1, y1, zoom)
+    viewport["version"] = graph_changelog.sequence(viewport["version"])
+    return viewport
 
 # API Routes
 @router.get("/graph", response_model=Dict[str, Any])
-async def get_graph_data(current_user: User = Depends(has_role("researcher"))):
-    nodes = generate_graph_nodes()
-    edges = generate_graph_edges()
-    return {
-        "nodes": [node.dict() for node in nodes],
-        "edges": [edge.dict() for edge in edges]
-    }
+async def get_graph_data(current_user: Principal = Depends(has_role("researcher"))):
+    return await run_in_threadpool(laid_out_graph)
+
+@router.post("/layout", response_model=Dict[str, Any])
+async def relayout_graph(current_user: Principal = Depends(has_role("researcher"))):
+    """Discard the cached coordinates and lay out the whole graph again"""
+    layout_engine.relayout()
+    return await run_in_threadpool(laid_out_graph)
+
+@router.get("/viewport", response_model=GraphViewport)
+async def get_graph_viewport(
+    x0: float,
+    y0: float,
+    x1: float,
+    y1: float,
+    zoom: float = Query(1.0, gt=0),
+    current_user: Principal = Depends(has_role("researcher")),
+):
+    """The part of the graph inside a box of graph coordinates, clustered when zoomed out (zoom is pixels per unit)"""
+    if x1 < x0 or y1 < y0:
+        raise HTTPException(status_code=400, detail="Viewport corners must be given as (x0, y0) <= (x1, y1)")
+    return await run_in_threadpool(numbered_viewport, x0, y0, x1, y1, zoom)
+
+@router.get("/search", response_model=List[GraphSearchHit])
+async def search_nodes(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(10, ge=1, le=MAX_SEARCH_RESULTS),
+    mode: str = Query("auto", pattern="^(auto|prefix|fuzzy)$"),
+    current_user: Principal = Depends(has_role("researcher")),
+):
+    """
+    Typeahead over node labels, case-insensitive: exact and prefix matches
+    first, then (mode auto) similar labels when those don't fill limit
+    """
+    return await run_in_threadpool(search_index.search, q, limit, mode)
+
+def run_traversal(fn, *args, **kwargs):
+    """Run a graph_traversal query, turning an unknown node id into a 404"""
+    try:
+        return fn(graph_store, *args, **kwargs)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=f"Node {e.args[0]} not found")
+
+@router.get("/nodes/{node_id}/neighbors", response_model=GraphSubgraph)
+async def get_node_neighbors(
+    node_id: int,
+    label: Optional[List[str]] = Query(None, description="Only follow relationships with these labels"),
+    direction: str = Query("both", pattern="^(out|in|both)$"),
+    limit: int = Query(1000, ge=1, le=MAX_TRAVERSAL_NODES),
+    current_user: Principal = Depends(has_role("researcher")),
+):
+    return await run_in_threadpool(run_traversal, neighbors, node_id, label, direction, limit)
+
+@router.get("/nodes/{node_id}/neighborhood", response_model=GraphNeighborhood)
+async def get_node_neighborhood(
+    node_id: int,
+    hops: int = Query(2, ge=1, le=MAX_HOPS),
+    label: Optional[List[str]] = Query(None, description="Only follow relationships with these labels"),
+    direction: str = Query("both", pattern="^(out|in|both)$"),
+    limit: int = Query(MAX_TRAVERSAL_NODES, ge=1, le=MAX_TRAVERSAL_NODES),
+    current_user: Principal = Depends(has_role("researcher")),
+):
+    """Every node within hops of node_id, with the edges among them"""
+    return await run_in_threadpool(run_traversal, k_hop, node_id, hops, label, direction, limit)
+
+@router.get("/path", response_model=GraphPath)
+async def get_shortest_path(
+    source: int,
+    target: int,
+    label: Optional[List[str]] = Query(None, description="Only follow relationships with these labels"),
+    direction: str = Query("both", pattern="^(out|in|both)$"),
+    max_hops: int = Query(MAX_HOPS, ge=1, le=MAX_HOPS),
+    current_user: Principal = Depends(has_role("researcher")),
+):
+    """Path with the fewest edges from source to target; found is false when there is none within max_hops"""
+    return await run_in_threadpool(run_traversal, shortest_path, source, target, label, direction, max_hops)
+
+# Graph builds from DataPuur uploads
+@router.post("/build", response_model=Dict[str, Any])
+async def start_graph_build(
+    build: GraphBuildRequest,
+    background_tasks: BackgroundTasks,
+    current_user: Principal = Depends(has_role("researcher")),
+):
+    """Load an uploaded file into the graph: mapped key columns become nodes, pairs of them edges"""
+    file_info = await run_db(lambda db: db.query(UploadedFile).filter(UploadedFile.id == build.file_id).first())
+    if not file_info:
+        raise HTTPException(status_code=404, detail="File not found")
+    mapping = {"nodes": [node.model_dump() for node in build.nodes], "edges": [edge.model_dump() for edge in build.edges]}
+    try:
+        validate_mapping(mapping, await run_in_threadpool(file_headers, file_info))
+    except (MappingError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    def create(db: Session):
+        now = datetime.now()
+        job = GraphBuildJob(
+            id=str(uuid.uuid4()),
+            file_id=build.file_id,
+            mapping=json.dumps(mapping),
+            chunk_size=max(1, build.chunk_size or GRAPH_BUILD_CHUNK_SIZE),
+            status="queued",
+            created_by=current_user.username,
+            created_at=now,
+            updated_at=now,
+        )
+        db.add(job)
+        db.commit()
+        return job_dict(job)
+
+    job = await run_db(create)
+    background_tasks.add_task(build_and_snapshot, job["id"])
+    return job
+
+@router.get("/build", response_model=List[Dict[str, Any]])
+async def list_graph_builds(current_user: Principal = Depends(has_role("researcher"))):
+    """Most recent graph builds first"""
+    def work(db: Session):
+        jobs = db.query(GraphBuildJob).order_by(GraphBuildJob.created_at.desc()).limit(50).all()
+        return [job_dict(job) for job in jobs]
+
+    return await run_db(work)
+
+@router.get("/build/{job_id}", response_model=Dict[str, Any])
+async def get_graph_build(job_id: str, current_user: Principal = Depends(has_role("researcher"))):
+    """Progress and throughput of a graph build"""
+    job = await run_db(lambda db: db.query(GraphBuildJob).filter(GraphBuildJob.id == job_id).first())
+    if not job:
+        raise HTTPException(status_code=404, detail="Build not found")
+    return job_dict(job)
+
+@router.post("/build/{job_id}/resume", response_model=Dict[str, Any])
+async def resume_graph_build(
+    job_id: str,
+    background_tasks: BackgroundTasks,
+    current_user: Principal = Depends(has_role("researcher")),
+):
+    """Continue a failed, cancelled or interrupted build from its last checkpoint"""
+    def work(db: Session):
+        job = db.query(GraphBuildJob).filter(GraphBuildJob.id == job_id).first()
+        if not job:
+            raise HTTPException(status_code=404, detail="Build not found")
+        if not is_resumable(job):
+            raise HTTPException(status_code=409, detail=f"Build is {job_dict(job)['status']}")
+        # Only if the row is still as read: another worker may resume it, or its own worker may still be alive
+        claimed = db.query(GraphBuildJob).filter(
+            GraphBuildJob.id == job_id,
+            GraphBuildJob.status == job.status,
+            GraphBuildJob.updated_at == job.updated_at,
+        ).update({GraphBuildJob.status: "queued", GraphBuildJob.updated_at: datetime.now()}, synchronize_session=False)
+        db.commit()
+        if not claimed:
+            raise HTTPException(status_code=409, detail="Build changed while resuming it; try again")
+        db.refresh(job)
+        return job_dict(job)
+
+    job = await run_db(work)
+    background_tasks.add_task(build_and_snapshot, job_id)
+    return job
+
+@router.post("/build/{job_id}/cancel", response_model=Dict[str, Any])
+async def cancel_graph_build(job_id: str, current_user: Principal = Depends(has_role("researcher"))):
+    """Stop a running build after its current chunk; it can be resumed later"""
+    def work(db: Session):
+        job = db.query(GraphBuildJob).filter(GraphBuildJob.id == job_id).first()
+        if not job:
+            return None
+        if job.status in ("queued", "running"):
+            job.status = "cancelling" if job.status == "running" else "cancelled"
+            db.commit()
+        return job_dict(job)
+
+    job = await run_db(work)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Build not found")
+    return job
+
+@router.get("/snapshot", response_model=Dict[str, Any])
+async def get_graph_snapshot(current_user: Principal = Depends(has_role("researcher"))):
+    """The snapshot workers load the graph from at startup"""
+    if not GRAPH_SNAPSHOT_PATH.exists():
+        raise HTTPException(status_code=404, detail="No graph snapshot has been saved")
+    try:
+        return await run_in_threadpool(snapshot_info)
+    except SnapshotError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/snapshot", response_model=Dict[str, Any])
+async def create_graph_snapshot(current_user: Principal = Depends(has_role("admin"))):
+    """Save this worker's graph as the snapshot; other workers load it when they restart"""
+    return await run_in_threadpool(save_snapshot)
+
+# Graph analytics, computed by background jobs in this worker
+@router.post("/analytics/jobs", response_model=Dict[str, Any])
+async def start_graph_analytics(background_tasks: BackgroundTasks, current_user: Principal = Depends(has_role("researcher"))):
+    """Compute PageRank, betweenness, degree centrality and communities for the current graph"""
+    job = analytics_engine.start()
+    if job["status"] == "queued":
+        background_tasks.add_task(analytics_engine.run, job["id"])
+    return job
+
+@router.get("/analytics/jobs", response_model=List[Dict[str, Any]])
+async def list_graph_analytics_jobs(current_user: Principal = Depends(has_role("researcher"))):
+    """Most recent analytics jobs first"""
+    return analytics_engine.jobs()
+
+@router.get("/analytics/jobs/{job_id}", response_model=Dict[str, Any])
+async def get_graph_analytics_job(job_id: str, current_user: Principal = Depends(has_role("researcher"))):
+    job = analytics_engine.job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Analytics job not found")
+    return job
+
+@router.post("/analytics/jobs/{job_id}/cancel", response_model=Dict[str, Any])
+async def cancel_graph_analytics_job(job_id: str, current_user: Principal = Depends(has_role("researcher"))):
+    """Stop a job at its next iteration"""
+    job = analytics_engine.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Analytics job not found")
+    return job
+
+@router.get("/analytics", response_model=GraphAnalytics)
+async def get_graph_analytics(
+    top: int = Query(5, ge=1, le=100),
+    current_user: Principal = Depends(has_role("researcher")),
+):
+    """Summary of the latest analytics result; stale when the graph has changed since"""
+    summary = await run_in_threadpool(analytics_engine.summary, top)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="No graph analytics have been computed yet")
+    return summary
+
+@router.get("/analytics/top", response_model=List[AnalyticsNode])
+async def get_top_nodes(
+    metric: str = Query("pagerank", pattern=f"^({'|'.join(NODE_METRICS)})$"),
+    limit: int = Query(10, ge=1, le=1000),
+    current_user: Principal = Depends(has_role("researcher")),
+):
+    """Nodes ranked by a metric of the latest analytics result"""
+    return await run_in_threadpool(analytics_engine.top, metric, limit)
+
+@router.get("/analytics/nodes/{node_id}", response_model=AnalyticsNode)
+async def get_node_analytics(node_id: int, current_user: Principal = Depends(has_role("researcher"))):
+    try:
+        return analytics_engine.node(node_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Node {node_id} not found")
 
 @router.get("/metrics", response_model=GraphMetrics)
-async def get_graph_metrics(current_user: User = Depends(has_role("researcher"))):
-    return generate_graph_metrics()
+async def get_graph_metrics(current_user: Principal = Depends(has_role("researcher"))):
+    # A removal makes the next snapshot recount components, which takes seconds on big graphs
+    return await run_in_threadpool(graph_metrics.snapshot)
 
-@router.get("/updates", response_model=List[Dict[str, str]])
-async def get_graph_updates(current_user: User = Depends(has_role("researcher"))):
-    return generate_graph_updates()
+@router.get("/updates", response_model=GraphChanges)
+async def get_graph_updates(
+    since: Optional[int] = Query(None, ge=0, description="Sequence (graph version) the client is up to date with"),
+    limit: int = Query(100, ge=1, le=1000),
+    epoch: Optional[str] = Query(None, description="Epoch the client's sequence came from"),
+    current_user: Principal = Depends(has_role("researcher")),
+):
+    """
+    Graph changes after since, oldest first; without since, the latest
+    ones. Apply them in order and ask again from the returned sequence
+    while has_more is set. If reload is set, fetch /graph again instead.
+    """
+    return await run_in_threadpool(laid_out_changes, since, limit, epoch)
 
 @router.get("/dashboard", response_model=Dict[str, Any])
-async def get_kgraph_dashboard(current_user: User = Depends(has_role("researcher"))):
-    nodes = generate_graph_nodes()
-    edges = generate_graph_edges()
-    metrics = generate_graph_metrics()
-    updates = generate_graph_updates()
+async def get_kgraph_dashboard(background_tasks: BackgroundTasks, current_user: Principal = Depends(has_role("researcher"))):
+    metrics = GraphMetrics(**await run_in_threadpool(graph_metrics.snapshot))
+    updates = graph_changelog.recent_activity()
+    # Keep analytics following the graph; the dashboard shows the last result meanwhile
+    job = analytics_engine.start(restart=False)
+    if job["status"] == "queued":
+        background_tasks.add_task(analytics_engine.run, job["id"])
     
     return {
-        "graph": {
-            "nodes": [node.dict() for node in nodes],
-            "edges": [edge.dict() for edge in edges]
-        },
+        "graph": await run_in_threadpool(laid_out_graph),
         "metrics": metrics.dict(),
-        "updates": updates
+        "updates": updates,
+        "analytics": await run_in_threadpool(analytics_engine.summary),
     }
 
@@ -1,21 +1,43 @@
 from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 import os
 from pathlib import Path
 
-from .models import get_db, User
+from sqlalchemy import text
+
+from .models import engine, run_db
 from .auth import router as auth_router
 from .datapuur import router as datapuur_router
 from .kginsights import router as kginsights_router
 from .admin import router as admin_router
-from .middleware import ActivityLoggerMiddleware
+from .settings import system_settings
+from .middleware import ActivityLoggerMiddleware, activity_sink
+from .rate_limit import RateLimitMiddleware
+from .profiling import ProfilingMiddleware
+from .sql_stats import SQLStatsMiddleware, instrument_engine as instrument_sql
 from .migrate_db import migrate_database
+from .passwords import PasswordHashingBusy, hashing_stats
+from .metrics import MetricsMiddleware, registry as metrics_registry
+from .events import broadcaster, database_tail, EVENTS_SOURCE
+from .auth import principal_cache
+from .graph_snapshot import load_startup_snapshot, snapshot_watcher
 
 app = FastAPI(title="Research AI API")
 
+# Innermost (added first), so profiles cover routing and the handler only
+app.add_middleware(ProfilingMiddleware, enabled=lambda: system_settings["request_profiling"])
+
+# Count statements per request to spot N+1 query patterns
+app.add_middleware(SQLStatsMiddleware)
+instrument_sql(engine)
+
+# Rate limiting sits inside CORS so 429 responses still carry CORS headers
+app.add_middleware(RateLimitMiddleware, enabled=lambda: system_settings["api_rate_limiting"])
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -28,64 +50,75 @@ app.add_middleware(
 # Add activity logger middleware
 app.add_middleware(ActivityLoggerMiddleware)
 
+# Record per-route latency; added last so it is the outermost layer and times everything
+app.add_middleware(MetricsMiddleware)
+metrics_registry.instrument_engine(engine)
+metrics_registry.register_gauge("password_hash_pending", "Password hash requests running or queued.", lambda: hashing_stats()["pending"])
+metrics_registry.register_gauge("password_hash_rejected_total", "Password hash requests turned away because the pool was full.", lambda: hashing_stats()["rejected"], kind="counter")
+metrics_registry.register_gauge("activity_log_dropped_total", "Page-visit logs dropped because the writer queue was full.", lambda: activity_sink.dropped, kind="counter")
+metrics_registry.register_gauge("event_stream_subscribers", "Admins connected to the live activity feed.", lambda: broadcaster.subscriber_count)
+metrics_registry.register_gauge("principal_cache_hits_total", "Authenticated requests served from the principal cache.", lambda: principal_cache.hits, kind="counter")
+metrics_registry.register_gauge("principal_cache_misses_total", "Authenticated requests that needed a user lookup.", lambda: principal_cache.misses, kind="counter")
+
 # Include routers
 app.include_router(auth_router)
 app.include_router(datapuur_router)
 app.include_router(kginsights_router)
 app.include_router(admin_router)
 
+# Shed load instead of queueing unbounded work when the password hashing pool is saturated
+@app.exception_handler(PasswordHashingBusy)
+async def password_hashing_busy_handler(request: Request, exc: PasswordHashingBusy):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Server is busy, please try again shortly"},
+        headers={"Retry-After": "1"}
+    )
+
 # Health check endpoint
 @app.get("/api/health")
 async def health_check():
     return {"status": "ok"}
 
-# Create initial admin user if it doesn't exist
+# Set once startup has finished and cleared as soon as shutdown begins
+app.state.ready = False
+app.state.schema_version = None
+
+# Readiness probe: load balancers should only send traffic while this returns 200
+@app.get("/api/ready")
+async def readiness_check():
+    if not app.state.ready:
+        return JSONResponse(status_code=503, content={"status": "not ready"})
+    try:
+        await run_db(lambda db: db.execute(text("SELECT 1")))
+    except Exception as e:
+        return JSONResponse(status_code=503, content={"status": "database unavailable", "detail": str(e)})
+    return {"status": "ready", "schema_version": app.state.schema_version, "pid": os.getpid()}
+
 @app.on_event("startup")
 async def startup_event():
-    # Run database migrations
-    migrate_database()
-    
-    db = next(get_db())
-    admin_user = db.query(User).filter(User.username == "admin").first()
-    if not admin_user:
-        hashed_password = User.get_password_hash("admin123")
-        admin = User(
-            username="admin",
-            email="admin@example.com",
-            hashed_password=hashed_password,
-            role="admin"
-        )
-        db.add(admin)
-        db.commit()
-        print("Created initial admin user")
-    
-    # Create researcher user if it doesn't exist
-    researcher_user = db.query(User).filter(User.username == "researcher").first()
-    if not researcher_user:
-        hashed_password = User.get_password_hash("password")
-        researcher = User(
-            username="researcher",
-            email="researcher@example.com",
-            hashed_password=hashed_password,
-            role="researcher"
-        )
-        db.add(researcher)
-        db.commit()
-        print("Created initial researcher user")
+    # A single version check unless migrations are pending; default users are seeded by a migration
+    app.state.schema_version = migrate_database()
+
+    # Map the saved knowledge graph instead of starting from the sample graph
+    await run_in_threadpool(load_startup_snapshot)
+    # Switch to snapshots other workers write later
+    snapshot_watcher.start()
     
-    # Create regular user if it doesn't exist
-    regular_user = db.query(User).filter(User.username == "user").first()
-    if not regular_user:
-        hashed_password = User.get_password_hash("password")
-        user = User(
-            username="user",
-            email="user@example.com",
-            hashed_password=hashed_password,
-            role="user"
-        )
-        db.add(user)
-        db.commit()
-        print("Created initial regular user")
+    # Settings and (with several workers) live events come from the shared database
+    system_settings.start()
+    if EVENTS_SOURCE == "database":
+        database_tail.start()
+    app.state.ready = True
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    app.state.ready = False
+    # Flush page-visit logs still waiting to be written
+    activity_sink.stop()
+    system_settings.stop()
+    database_tail.stop()
+    snapshot_watcher.stop()
 
 # Mount static files directory if it exists
 static_dir = Path(__file__).parent / "static"
@@ -0,0 +1,162 @@
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Tuple
+
+from sqlalchemy import event
+
+# Latency buckets in seconds (Prometheus "le" bounds)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str) -> List[str]:
+        lines = []
+        cumulative = 0
+        sep = "," if labels else ""
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels}{sep}le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {self.count}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {self.sum:.6f}")
+        lines.append(f"{name}_count{suffix} {self.count}")
+        return lines
+
+class MetricsRegistry:
+    """
+    Request and database metrics for this worker. HTTP metrics are only
+    updated from the event loop; database metrics come from pool threads
+    and are guarded by a lock.
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.requests: Dict[Tuple[str, str, int], int] = {}
+        self.latency: Dict[Tuple[str, str], Histogram] = {}
+        self.in_flight = 0
+        self.db_checkout = Histogram()
+        self.db_checked_out = 0
+        self._db_lock = threading.Lock()
+        # Extra values read on each scrape: name -> (help, type, callable)
+        self.gauges: Dict[str, Tuple[str, str, Callable[[], float]]] = {}
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float):
+        key = (method, route, status)
+        self.requests[key] = self.requests.get(key, 0) + 1
+        histogram = self.latency.get((method, route))
+        if histogram is None:
+            histogram = self.latency[(method, route)] = Histogram()
+        histogram.observe(seconds)
+
+    def register_gauge(self, name: str, help_text: str, fn: Callable[[], float], kind: str = "gauge"):
+        """Expose a value owned by another module; use kind="counter" for running totals"""
+        self.gauges[name] = (help_text, kind, fn)
+
+    def instrument_engine(self, engine):
+        """Track how long connections are checked out of the pool"""
+
+        @event.listens_for(engine, "checkout")
+        def on_checkout(dbapi_connection, connection_record, connection_proxy):
+            connection_record.info["checked_out_at"] = time.perf_counter()
+            with self._db_lock:
+                self.db_checked_out += 1
+
+        @event.listens_for(engine, "checkin")
+        def on_checkin(dbapi_connection, connection_record):
+            started = connection_record.info.pop("checked_out_at", None)
+            if started is None:
+                return
+            with self._db_lock:
+                self.db_checked_out -= 1
+                self.db_checkout.observe(time.perf_counter() - started)
+
+    def render(self) -> str:
+        """Prometheus text exposition format"""
+        lines = [
+            "# HELP http_requests_total Requests handled, by route template and status.",
+            "# TYPE http_requests_total counter",
+        ]
+        for (method, route, status), count in sorted(self.requests.items()):
+            lines.append(f'http_requests_total{{method="{method}",route="{route}",status="{status}"}} {count}')
+
+        lines += [
+            "# HELP http_request_duration_seconds Request latency, by route template.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for (method, route), histogram in sorted(self.latency.items()):
+            lines += histogram.render("http_request_duration_seconds", f'method="{method}",route="{route}"')
+
+        lines += [
+            "# HELP http_requests_in_flight Requests currently being handled.",
+            "# TYPE http_requests_in_flight gauge",
+            f"http_requests_in_flight {self.in_flight}",
+            "# HELP db_connection_checkout_seconds Time database connections stay checked out of the pool.",
+            "# TYPE db_connection_checkout_seconds histogram",
+        ]
+        with self._db_lock:
+            lines += self.db_checkout.render("db_connection_checkout_seconds", "")
+            lines += [
+                "# HELP db_connections_checked_out Database connections currently checked out.",
+                "# TYPE db_connections_checked_out gauge",
+                f"db_connections_checked_out {self.db_checked_out}",
+            ]
+
+        for name, (help_text, kind, fn) in sorted(self.gauges.items()):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {fn()}"]
+
+        lines += [
+            "# HELP process_uptime_seconds Seconds since this worker started.",
+            "# TYPE process_uptime_seconds gauge",
+            f"process_uptime_seconds {time.time() - self.started_at:.0f}",
+        ]
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+class MetricsMiddleware:
+    """
+    Records count, status and latency per route template (e.g.
+    /api/admin/users/{user_id}), so label cardinality stays bounded.
+    """
+
+    def __init__(self, app, registry: MetricsRegistry = registry):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        self.registry.in_flight += 1
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.registry.in_flight -= 1
+            route = scope.get("route")
+            if route is not None:
+                template = route.path
+            elif scope["path"].startswith("/api/"):
+                template = "unmatched"
+            else:
+                template = "static"
+            self.registry.observe_request(scope["method"], template, status_code, time.perf_counter() - started)
@@ -1,61 +1,140 @@
-from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware
-from sqlalchemy.orm import Session
-import re
-from .models import get_db
-from .auth import log_activity
-
-class ActivityLoggerMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        # Skip logging for static files, API health checks, etc.
-        path = request.url.path
-        if (path.startswith("/static/") or 
-            path == "/api/health" or 
-            path.startswith("/favicon") or
-            path.endswith(".ico") or
-            path.endswith(".png") or
-            path.endswith(".jpg") or
-            path.endswith(".css") or
-            path.endswith(".js")):
-            return await call_next(request)
-        
-        # Get the response first
-        response = await call_next(request)
-        
+import queue
+import threading
+from datetime import datetime
+from typing import Any, Dict
+
+import pytz
+
+from .models import SessionLocal, ActivityLog
+from .auth import token_username
+from .events import publish_activity, publish_stats_delta
+
+# Requests for these are never logged
+SKIP_PREFIXES = ("/static/", "/favicon", "/api/")
+SKIP_SUFFIXES = (".ico", ".png", ".jpg", ".css", ".js")
+
+class ActivityLogSink:
+    """
+    Writes page-visit logs from a background thread so requests never wait
+    on the database. Events are written in batches, one commit per batch.
+    When the queue is full new events are dropped rather than blocking.
+    """
+
+    def __init__(self, maxsize: int = 10000, batch_size: int = 200):
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=maxsize)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def put(self, event: Dict[str, Any]):
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="activity-log-sink", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Flush queued events and stop the writer thread"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while True:
+            event = self._queue.get()
+            if event is None:
+                return
+            batch = [event]
+            stopping = False
+            while len(batch) < self.batch_size:
+                try:
+                    event = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if event is None:
+                    stopping = True
+                    break
+                batch.append(event)
+            self._write(batch)
+            if stopping:
+                return
+
+    def _write(self, batch):
+        db = SessionLocal(expire_on_commit=False)
+        try:
+            logs = [ActivityLog(**event) for event in batch]
+            db.add_all(logs)
+            db.commit()
+            for log, event in zip(logs, batch):
+                publish_activity({**event, "id": log.id, "timestamp": event["timestamp"].isoformat()})
+            publish_stats_delta(total_activity_logs=len(batch))
+        except Exception as e:
+            # Don't let logging errors take down the writer
+            print(f"Error logging activity: {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+activity_sink = ActivityLogSink()
+
+class ActivityLoggerMiddleware:
+    """
+    Logs successful page visits. Implemented as plain ASGI: the response
+    (including file and streaming bodies) is passed through untouched, and
+    only the status code is observed on its way out.
+    """
+
+    def __init__(self, app, sink: ActivityLogSink = None):
+        self.app = app
+        self.sink = sink if sink is not None else activity_sink
+        self.ist = pytz.timezone('Asia/Kolkata')
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        # Skip logging for API calls, static files, etc.
+        path = scope["path"]
+        if path.startswith(SKIP_PREFIXES) or path.endswith(SKIP_SUFFIXES):
+            return await self.app(scope, receive, send)
+
+        status_code = 0
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
         # Only log successful page views (status code 200-299)
-        if 200 <= response.status_code < 300 and not path.startswith("/api/"):
-            try:
-                # Try to get the user from the session/token
-                username = "anonymous"  # Default to anonymous
-                
-                # Extract token from Authorization header
-                auth_header = request.headers.get("Authorization")
-                if auth_header and auth_header.startswith("Bearer "):
-                    from jose import JWTError, jwt
-                    from .auth import SECRET_KEY, ALGORITHM
-                    try:
-                        token = auth_header.replace("Bearer ", "")
-                        # Decode token without full validation
-                        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-                        username = payload.get("sub", "anonymous")
-                    except Exception as e:
-                        # If token validation fails, keep username as anonymous
-                        print(f"Token validation error: {e}")
-                
-                # Log the page visit with the extracted username
-                db = next(get_db())
-                log_activity(
-                    db=db,
-                    username=username,  # Use the extracted username
-                    action="Page visit",
-                    details=f"Visited {path}",
-                    ip_address=request.client.host,
-                    user_agent=request.headers.get("user-agent"),
-                    page_url=path
-                )
-            except Exception as e:
-                # Don't let logging errors affect the response
-                print(f"Error logging activity: {e}")
-        
-        return response
+        if 200 <= status_code < 300:
+            self.sink.put(self._event(scope, path))
 
+    def _event(self, scope, path: str) -> Dict[str, Any]:
+        headers = dict(scope["headers"])
+        username = None
+        auth_header = headers.get(b"authorization", b"").decode("latin-1")
+        if auth_header.startswith("Bearer "):
+            username = token_username(auth_header[len("Bearer "):])
+        client = scope.get("client")
+        user_agent = headers.get(b"user-agent")
+        return {
+            "username": username or "anonymous",
+            "action": "Page visit",
+            "details": f"Visited {path}",
+            "timestamp": datetime.now(self.ist),
+            "ip_address": client[0] if client else None,
+            "user_agent": user_agent.decode("latin-1") if user_agent else None,
+            "page_url": path,
+        }
@@ -1,42 +1,215 @@
-import sqlite3
-import os
+import argparse
 import logging
+import os
+import sys
+from datetime import datetime
+
+from sqlalchemy import Boolean, Column, DateTime, Float, Index, Integer, MetaData, String, Table, Text, func, inspect, select, text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+from .models import User, engine
+
+# Create the demo admin/researcher/user accounts on a new database
+SEED_DEFAULT_USERS = os.environ.get("SEED_DEFAULT_USERS", "true").lower() in ("1", "true", "yes")
+
+DEFAULT_USERS = [
+    # (username, email, password, role)
+    ("admin", "admin@example.com", "admin123", "admin"),
+    ("researcher", "researcher@example.com", "password", "researcher"),
+    ("user", "user@example.com", "password", "user"),
+]
+
+# Kept outside Base so it never shows up in exports or the ORM models
+schema_version = Table(
+    "schema_version",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("description", String),
+    Column("applied_at", DateTime),
+)
+
+# Tables as each migration created them. Migrations must not follow later
+# edits to the models, so their tables are copied here when they ship.
+migration_tables = MetaData()
+
+users_v1 = Table(
+    "users",
+    migration_tables,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("username", String, unique=True, index=True),
+    Column("email", String, unique=True, index=True),
+    Column("hashed_password", String),
+    Column("role", String),
+    Column("is_active", Boolean),
+    Column("created_at", DateTime),
+)
+
+roles_v1 = Table(
+    "roles",
+    migration_tables,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("name", String, unique=True, index=True),
+    Column("description", String, nullable=True),
+)
+
+activity_logs_v1 = Table(
+    "activity_logs",
+    migration_tables,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("username", String, index=True),
+    Column("action", String, index=True),
+    Column("details", Text, nullable=True),
+    Column("timestamp", DateTime, index=True),
+    Column("ip_address", String, nullable=True),
+    Column("user_agent", String, nullable=True),
+    Column("page_url", String, nullable=True),
+    Index("idx_activity_logs_timestamp", "timestamp"),
+)
+
+system_settings_v4 = Table(
+    "system_settings",
+    migration_tables,
+    Column("key", String, primary_key=True),
+    Column("value", Text),
+)
+
+uploaded_files_v4 = Table(
+    "uploaded_files",
+    migration_tables,
+    Column("id", String, primary_key=True, index=True),
+    Column("filename", String),
+    Column("path", String),
+    Column("type", String),
+    Column("uploaded_by", String, index=True),
+    Column("uploaded_at", DateTime),
+    Column("chunk_size", Integer),
+    Column("schema", Text, nullable=True),
+)
+
+graph_build_jobs_v5 = Table(
+    "graph_build_jobs",
+    migration_tables,
+    Column("id", String, primary_key=True, index=True),
+    Column("file_id", String, index=True),
+    Column("mapping", Text),
+    Column("chunk_size", Integer),
+    Column("status", String),
+    Column("rows_done", Integer),
+    Column("checkpoint_epoch", String, nullable=True),
+    Column("nodes_created", Integer),
+    Column("edges_created", Integer),
+    Column("duplicates", Integer),
+    Column("elapsed_seconds", Float),
+    Column("error", Text, nullable=True),
+    Column("created_by", String),
+    Column("created_at", DateTime),
+    Column("updated_at", DateTime),
+    Column("finished_at", DateTime, nullable=True),
+)
+
+def create_initial_schema(connection):
+    # The tables of the first release; later tables come from their own migrations
+    migration_tables.create_all(bind=connection, tables=[users_v1, roles_v1, activity_logs_v1])
 
-def migrate_database():
+def add_activity_page_url(connection):
+    # Databases created before page_url existed
+    columns = [column["name"] for column in inspect(connection).get_columns("activity_logs")]
+    if "page_url" not in columns:
+        connection.execute(text("ALTER TABLE activity_logs ADD COLUMN page_url TEXT"))
+
+def seed_default_users(connection):
+    if not SEED_DEFAULT_USERS:
+        print("Skipping default users (SEED_DEFAULT_USERS is off)")
+        return
+    existing = set(connection.execute(select(users_v1.c.username)).scalars())
+    for username, email, password, role in DEFAULT_USERS:
+        if username not in existing:
+            connection.execute(users_v1.insert().values(
+                username=username,
+                email=email,
+                hashed_password=User.get_password_hash(password),
+                role=role,
+                is_active=True,
+                created_at=datetime.utcnow()
+            ))
+            print(f"Created initial {role} user")
+
+def add_shared_state_tables(connection):
+    # State that used to live in each worker's memory
+    migration_tables.create_all(bind=connection, tables=[system_settings_v4, uploaded_files_v4])
+
+def add_graph_build_jobs(connection):
+    migration_tables.create_all(bind=connection, tables=[graph_build_jobs_v5])
+
+# Append new migrations here; never renumber or edit ones that have shipped
+MIGRATIONS = [
+    (1, "Initial schema", create_initial_schema),
+    (2, "Add activity_logs.page_url", add_activity_page_url),
+    (3, "Seed default users", seed_default_users),
+    (4, "Add system_settings and uploaded_files", add_shared_state_tables),
+    (5, "Add graph_build_jobs", add_graph_build_jobs),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def current_version() -> int:
+    """Schema version recorded in the database, or 0 if it has never been migrated"""
+    try:
+        with engine.connect() as connection:
+            return connection.execute(select(func.max(schema_version.c.version))).scalar() or 0
+    except (OperationalError, ProgrammingError):
+        # No schema_version table yet
+        return 0
+
+def migrate_database() -> int:
     """
-    Run database migrations to ensure the schema is up-to-date.
-    This function adds any missing columns to existing tables.
+    Apply pending migrations in order, each in its own transaction together
+    with its schema_version row. When the database is already current this
+    is a single query. Returns the resulting version.
+
+    With several workers, run "python -m api.migrate_db" once before
+    starting them rather than letting each worker race to migrate.
     """
     try:
-        # Get the database path
-        db_path = os.path.join(os.path.dirname(__file__), "database.db")
-        
-        # Connect to the database
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        
-        # Check if page_url column exists in activity_logs table
-        cursor.execute("PRAGMA table_info(activity_logs)")
-        columns = [column[1] for column in cursor.fetchall()]
-        
-        # Add page_url column if it doesn't exist
-        if "page_url" not in columns:
-            print("Adding page_url column to activity_logs table")
-            cursor.execute("ALTER TABLE activity_logs ADD COLUMN page_url TEXT")
-            conn.commit()
-            print("Migration completed successfully")
-        
-        # Close the connection
-        conn.close()
-        
+        version = current_version()
+        if version >= LATEST_VERSION:
+            return version
+
+        schema_version.create(engine, checkfirst=True)
+        for number, description, migrate in MIGRATIONS:
+            if number <= version:
+                continue
+            print(f"Applying migration {number}: {description}")
+            with engine.begin() as connection:
+                migrate(connection)
+                connection.execute(schema_version.insert().values(
+                    version=number,
+                    description=description,
+                    applied_at=datetime.utcnow()
+                ))
+        print(f"Database schema is at version {LATEST_VERSION}")
+        return LATEST_VERSION
+
     except Exception as e:
         logging.error(f"Database migration failed: {str(e)}")
         raise
 
+def pending_migrations():
+    version = current_version()
+    return [(number, description) for number, description, _ in MIGRATIONS if number > version]
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply database migrations")
+    parser.add_argument("--status", action="store_true", help="show the schema version and pending migrations without applying them")
+    args = parser.parse_args()
+
+    if args.status:
+        print(f"Schema version: {current_version()} (latest {LATEST_VERSION})")
+        for number, description in pending_migrations():
+            print(f"  pending {number}: {description}")
+        sys.exit(0)
+
     try:
         migrate_database()
         sys.exit(0)
     except Exception:
         sys.exit(1)
-
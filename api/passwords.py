@@ -0,0 +1,81 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any
+
+import bcrypt
+
+# bcrypt releases the GIL while hashing, so a small thread pool gives real parallelism
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", min(4, os.cpu_count() or 1)))
+# Hash requests allowed in flight (running or queued) before new ones are turned away
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get("PASSWORD_HASH_MAX_PENDING", 64))
+
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+
+# Queue metrics; only touched from the event loop
+_stats = {
+    "pending": 0,
+    "completed": 0,
+    "rejected": 0,
+    "total_wait_seconds": 0.0,
+    "total_hash_seconds": 0.0,
+    "max_wait_seconds": 0.0,
+}
+
+class PasswordHashingBusy(Exception):
+    """Raised when too many hash requests are already waiting for a worker"""
+
+def _hashpw(password: str) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+
+def _checkpw(password: str, hashed_password: str) -> bool:
+    return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
+
+async def _run(fn, *args):
+    if _stats["pending"] >= PASSWORD_HASH_MAX_PENDING:
+        _stats["rejected"] += 1
+        raise PasswordHashingBusy()
+
+    queued_at = time.perf_counter()
+    timings = {}
+
+    def timed():
+        started = time.perf_counter()
+        timings["wait"] = started - queued_at
+        try:
+            return fn(*args)
+        finally:
+            timings["hash"] = time.perf_counter() - started
+
+    _stats["pending"] += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, timed)
+    finally:
+        _stats["pending"] -= 1
+        if "hash" in timings:
+            _stats["completed"] += 1
+            _stats["total_wait_seconds"] += timings["wait"]
+            _stats["total_hash_seconds"] += timings["hash"]
+            _stats["max_wait_seconds"] = max(_stats["max_wait_seconds"], timings["wait"])
+
+async def hash_password(password: str) -> str:
+    """Hash a password on the bcrypt pool without blocking the event loop"""
+    return await _run(_hashpw, password)
+
+async def verify_password(password: str, hashed_password: str) -> bool:
+    """Check a password against its bcrypt hash on the bcrypt pool"""
+    return await _run(_checkpw, password, hashed_password)
+
+def hashing_stats() -> Dict[str, Any]:
+    completed = _stats["completed"]
+    return {
+        "workers": PASSWORD_HASH_WORKERS,
+        "max_pending": PASSWORD_HASH_MAX_PENDING,
+        "pending": _stats["pending"],
+        "completed": completed,
+        "rejected": _stats["rejected"],
+        "avg_wait_seconds": round(_stats["total_wait_seconds"] / completed, 4) if completed else 0.0,
+        "avg_hash_seconds": round(_stats["total_hash_seconds"] / completed, 4) if completed else 0.0,
+        "max_wait_seconds": round(_stats["max_wait_seconds"], 4),
+    }
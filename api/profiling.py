@@ -0,0 +1,125 @@
+import cProfile
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import pytz
+from fastapi.concurrency import run_in_threadpool
+
+from .auth import token_identity
+
+PROFILE_DIR = Path(os.environ.get("PROFILE_DIR", Path(__file__).parent / "profiles"))
+PROFILE_RETENTION = int(os.environ.get("PROFILE_RETENTION", 50))  # Number of profiles to keep
+PROFILE_HEADER = b"x-profile"
+REQUEST_ID_HEADER = b"x-request-id"
+
+_REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+ist = pytz.timezone('Asia/Kolkata')
+
+# Held while a request is profiled: the interpreter has one profiler hook per thread
+_profiling = threading.Lock()
+
+def _save_profile(profiler: cProfile.Profile, request_id: str, metadata: Dict[str, Any]):
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    profiler.dump_stats(str(PROFILE_DIR / f"{request_id}.pstats"))
+    with open(PROFILE_DIR / f"{request_id}.json", "w") as f:
+        json.dump(metadata, f, indent=2)
+
+    # Retention: drop the oldest profiles beyond the limit
+    profiles = sorted(PROFILE_DIR.glob("*.pstats"), key=lambda p: p.stat().st_mtime, reverse=True)
+    for path in profiles[PROFILE_RETENTION:]:
+        path.unlink(missing_ok=True)
+        path.with_suffix(".json").unlink(missing_ok=True)
+
+def list_profiles() -> List[Dict[str, Any]]:
+    """Stored profiles, newest first"""
+    if not PROFILE_DIR.exists():
+        return []
+    profiles = []
+    for path in sorted(PROFILE_DIR.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True):
+        with open(path) as f:
+            profiles.append(json.load(f))
+    return profiles
+
+def profile_path(request_id: str) -> Optional[Path]:
+    if not _REQUEST_ID_PATTERN.match(request_id):
+        return None
+    path = PROFILE_DIR / f"{request_id}.pstats"
+    return path if path.exists() else None
+
+class ProfilingMiddleware:
+    """
+    Profiles single requests with cProfile when an admin sends "X-Profile: 1"
+    and the request_profiling setting is on. The profile is stored under the
+    request ID (X-Request-ID, or a generated one) and returned in the
+    X-Profile-Id response header; download it from /api/admin/profiles.
+
+    cProfile follows the event loop thread, so coroutines from concurrent
+    requests may show up too, and work pushed to thread pools does not.
+    Only one request is profiled at a time; others asking for a profile
+    while one runs are served unprofiled, without X-Profile-Id.
+    When the setting is off the only cost is one boolean check.
+    """
+
+    def __init__(self, app, enabled: Callable[[], bool] = lambda: False):
+        self.app = app
+        self.enabled = enabled
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled():
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope["headers"])
+        if headers.get(PROFILE_HEADER, b"").lower() not in (b"1", b"true", b"yes"):
+            return await self.app(scope, receive, send)
+
+        auth_header = headers.get(b"authorization", b"").decode("latin-1")
+        username, role = await token_identity(auth_header[len("Bearer "):]) if auth_header.startswith("Bearer ") else (None, "anonymous")
+        if role != "admin":
+            return await self.app(scope, receive, send)
+
+        request_id = headers.get(REQUEST_ID_HEADER, b"").decode("latin-1")
+        if not _REQUEST_ID_PATTERN.match(request_id):
+            request_id = uuid.uuid4().hex
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message = {**message, "headers": list(message.get("headers", [])) + [(b"x-profile-id", request_id.encode())]}
+            await send(message)
+
+        if not _profiling.acquire(blocking=False):
+            return await self.app(scope, receive, send)
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        try:
+            profiler.enable()
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                profiler.disable()
+        finally:
+            _profiling.release()
+            duration = time.perf_counter() - started
+            try:
+                await run_in_threadpool(_save_profile, profiler, request_id, {
+                    "request_id": request_id,
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "query_string": scope.get("query_string", b"").decode("latin-1"),
+                    "status": status_code,
+                    "duration_seconds": round(duration, 6),
+                    "username": username,
+                    "created_at": datetime.now(ist).strftime("%Y-%m-%d %H:%M:%S"),
+                })
+            except Exception as e:
+                print(f"Error saving profile {request_id}: {e}")
@@ -0,0 +1,203 @@
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from .auth import token_identity
+
+# Limits per role and route class as (requests, per seconds). Requests is also the burst size.
+RATE_LIMITS: Dict[str, Dict[str, Tuple[int, int]]] = {
+    "anonymous": {"auth": (10, 60), "upload": (5, 60), "read": (60, 60), "write": (30, 60)},
+    "user": {"auth": (10, 60), "upload": (10, 60), "read": (300, 60), "write": (120, 60)},
+    "researcher": {"auth": (10, 60), "upload": (30, 60), "read": (600, 60), "write": (240, 60)},
+    "admin": {"auth": (20, 60), "upload": (60, 60), "read": (1200, 60), "write": (600, 60)},
+}
+
+# Optional JSON override, e.g. RATE_LIMITS='{"researcher": {"upload": [100, 60]}}'
+if os.environ.get("RATE_LIMITS"):
+    for _role, _classes in json.loads(os.environ["RATE_LIMITS"]).items():
+        RATE_LIMITS.setdefault(_role, dict(RATE_LIMITS["user"])).update(
+            {name: tuple(limit) for name, limit in _classes.items()}
+        )
+
+AUTH_PATHS = ("/api/auth/token", "/api/auth/register")
+UPLOAD_PATHS = ("/api/datapuur/upload",)
+EXEMPT_PATHS = ("/api/health", "/api/ready")
+
+# Only trust X-Forwarded-For when running behind a proxy that sets it
+TRUST_FORWARDED_FOR = os.environ.get("RATE_LIMIT_TRUST_FORWARDED", "").lower() in ("1", "true", "yes")
+
+def route_class(method: str, path: str) -> str:
+    if path in AUTH_PATHS:
+        return "auth"
+    if path.startswith(UPLOAD_PATHS):
+        return "upload"
+    if method in ("GET", "HEAD"):
+        return "read"
+    return "write"
+
+class MemoryStore:
+    """
+    Token buckets kept in this process. Fast, but each worker counts separately.
+    Buckets are kept in least recently used order and capped at max_keys; past
+    the cap the oldest go first, even if they haven't refilled yet.
+    """
+
+    blocking = False  # consume() never waits, so it runs on the event loop
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        # Buckets idle this long have refilled under every configured limit
+        self.idle_seconds = max(period for classes in RATE_LIMITS.values() for _, period in classes.values())
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()  # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def consume(self, key: str, rate: float, burst: int, now: Optional[float] = None) -> Tuple[bool, float, float]:
+        """Take one token from a bucket. Returns (allowed, tokens_left, retry_after_seconds)."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            # Re-inserted below, which moves the bucket to the most recently used end
+            tokens, updated_at = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+            return allowed, tokens, 0.0 if allowed else (1 - tokens) / rate
+
+    def _prune(self, now: float):
+        # Least recently used first: idle buckets, then whatever exceeds the cap
+        while self._buckets:
+            _, updated_at = next(iter(self._buckets.values()))
+            if len(self._buckets) <= self.max_keys and now - updated_at <= self.idle_seconds:
+                break
+            self._buckets.popitem(last=False)
+
+class SQLiteStore:
+    """
+    Token buckets in a shared SQLite file, so every worker on the host draws
+    from the same counters. Another backend (e.g. Redis) only needs to
+    provide the same consume() method, and blocking = True if it can wait
+    on I/O or locks.
+    """
+
+    # BEGIN IMMEDIATE waits up to the 5 s busy timeout for other workers' writes
+    blocking = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute("CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL, updated_at REAL)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn = conn
+        return conn
+
+    def consume(self, key: str, rate: float, burst: int, now: Optional[float] = None) -> Tuple[bool, float, float]:
+        # Wall clock, since monotonic clocks are not comparable across processes
+        now = time.time() if now is None else now
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated_at = row if row else (burst, now)
+            tokens = min(burst, tokens + max(0.0, now - updated_at) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            conn.execute(
+                "INSERT INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at",
+                (key, tokens, now)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return allowed, tokens, 0.0 if allowed else (1 - tokens) / rate
+
+def create_store():
+    """Pick the counter store from RATE_LIMIT_STORE (memory or sqlite)"""
+    if os.environ.get("RATE_LIMIT_STORE", "memory") == "sqlite":
+        path = os.environ.get("RATE_LIMIT_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "ratelimit.db"))
+        return SQLiteStore(path)
+    return MemoryStore()
+
+async def _identify(headers: Dict[bytes, bytes]) -> Tuple[Optional[str], str]:
+    """Username and role for a request; the database is only asked when the principal cache misses"""
+    auth_header = headers.get(b"authorization", b"").decode("latin-1")
+    if not auth_header.startswith("Bearer "):
+        return None, "anonymous"
+    return await token_identity(auth_header[len("Bearer "):])
+
+class RateLimitMiddleware:
+    """
+    Token-bucket rate limiting for /api routes, keyed by user (or client IP
+    for anonymous requests and logins) and route class, with limits per role.
+    Rejected requests get a 429 with Retry-After.
+    """
+
+    def __init__(self, app, enabled: Callable[[], bool] = lambda: True, store=None):
+        self.app = app
+        self.enabled = enabled
+        self.store = store if store is not None else create_store()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled():
+            return await self.app(scope, receive, send)
+
+        path = scope["path"]
+        method = scope["method"]
+        if not path.startswith("/api/") or path in EXEMPT_PATHS or method == "OPTIONS":
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope["headers"])
+        username, role = await _identify(headers)
+        limit_class = route_class(method, path)
+        requests, period = RATE_LIMITS.get(role, RATE_LIMITS["user"])[limit_class]
+
+        if username and limit_class != "auth":
+            key = f"user:{username}:{limit_class}"
+        else:
+            key = f"ip:{self._client_ip(scope, headers)}:{limit_class}"
+
+        if getattr(self.store, "blocking", True):
+            allowed, _, retry_after = await run_in_threadpool(self.store.consume, key, requests / period, requests)
+        else:
+            allowed, _, retry_after = self.store.consume(key, requests / period, requests)
+        if allowed:
+            return await self.app(scope, receive, send)
+
+        body = json.dumps({"detail": "Too many requests, please slow down"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+                (b"x-ratelimit-limit", f"{requests};w={period}".encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    @staticmethod
+    def _client_ip(scope, headers) -> str:
+        if TRUST_FORWARDED_FOR and b"x-forwarded-for" in headers:
+            return headers[b"x-forwarded-for"].decode("latin-1").split(",")[0].strip()
+        client = scope.get("client")
+        return client[0] if client else "unknown"
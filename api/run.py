@@ -1,8 +1,17 @@
 import uvicorn
+import argparse
+import importlib.util
 import os
 import sys
 from pathlib import Path
 
+# Production serving defaults, overridable from the environment
+WORKERS = int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1))
+MAX_REQUESTS = int(os.environ.get("MAX_REQUESTS", 10000))  # Recycle a worker after this many requests (0 = never)
+MAX_REQUESTS_JITTER = int(os.environ.get("MAX_REQUESTS_JITTER", 1000))  # So workers don't all recycle at once
+GRACEFUL_TIMEOUT = int(os.environ.get("GRACEFUL_TIMEOUT", 30))  # Seconds in-flight requests get to finish on restart
+KEEPALIVE_TIMEOUT = int(os.environ.get("KEEPALIVE_TIMEOUT", 5))
+
 def check_static_files():
     static_dir = Path(__file__).parent / "static"
     if not static_dir.exists() or not (static_dir / "index.html").exists():
@@ -11,18 +20,102 @@ def check_static_files():
         return False
     return True
 
-if __name__ == "__main__":
+def is_available(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+def prepare_workers(workers: int):
+    """
+    Point per-process state at shared backends when running several workers.
+    Set before the workers start so they all inherit it; explicit settings win.
+    """
+    if workers > 1:
+        os.environ.setdefault("RATE_LIMIT_STORE", "sqlite")  # One set of counters for all workers
+        os.environ.setdefault("EVENTS_SOURCE", "database")  # Live feed sees writes from every worker
+        os.environ.setdefault("PRINCIPAL_CACHE_TTL", "5")  # Bounds staleness after a user change in another worker
+
+    # Migrate once here so each worker's startup is a single version check
+    from .migrate_db import migrate_database
+    from .models import engine
+    migrate_database()
+    # Don't hand pooled connections down to forked workers
+    engine.dispose()
+
+def serve_development(host: str, port: int):
+    uvicorn.run("api.main:app", host=host, port=port, reload=True)
+
+def serve_production(host: str, port: int, workers: int):
+    """
+    Serve with gunicorn managing uvicorn workers when it is installed (not on
+    Windows): dead workers are replaced, workers are recycled after
+    MAX_REQUESTS, and "kill -HUP <master pid>" restarts them gracefully.
+    Otherwise fall back to uvicorn's own process manager, which cannot
+    replace workers and so does not recycle them.
+    """
+    prepare_workers(workers)
+    loop = "uvloop" if is_available("uvloop") else "asyncio"
+    http = "httptools" if is_available("httptools") else "h11"
+    print(f"Starting {workers} worker(s) on {host}:{port} (event loop: {loop}, HTTP parser: {http})")
+
+    if os.name != "nt" and is_available("gunicorn"):
+        from gunicorn.app.base import BaseApplication
+
+        class ProductionApplication(BaseApplication):
+            def load_config(self):
+                options = {
+                    "bind": f"{host}:{port}",
+                    "workers": workers,
+                    # Uses uvloop and httptools automatically when they are installed
+                    "worker_class": "uvicorn.workers.UvicornWorker",
+                    "max_requests": MAX_REQUESTS,
+                    "max_requests_jitter": MAX_REQUESTS_JITTER,
+                    "graceful_timeout": GRACEFUL_TIMEOUT,
+                    "keepalive": KEEPALIVE_TIMEOUT,
+                }
+                for key, value in options.items():
+                    self.cfg.set(key, value)
+
+            def load(self):
+                from .main import app
+                return app
+
+        ProductionApplication().run()
+    else:
+        if MAX_REQUESTS:
+            print("Note: worker recycling needs gunicorn; install it to enable MAX_REQUESTS")
+        uvicorn.run(
+            "api.main:app",
+            host=host,
+            port=port,
+            workers=workers,
+            loop=loop,
+            http=http,
+            timeout_keep_alive=KEEPALIVE_TIMEOUT,
+            timeout_graceful_shutdown=GRACEFUL_TIMEOUT,
+        )
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the Research AI API")
+    parser.add_argument("--production", action="store_true", default=os.environ.get("SERVE_MODE") == "production",
+                        help="serve with multiple workers and no auto-reload (or set SERVE_MODE=production)")
+    parser.add_argument("--host", default=os.environ.get("HOST"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 8080)))
+    parser.add_argument("--workers", type=int, default=WORKERS, help="worker processes in production mode (WEB_CONCURRENCY)")
+    args = parser.parse_args(argv)
+
     # Check if static files exist
     has_static = check_static_files()
-    
-    # Get port from environment variable or use default
-    port = int(os.environ.get("PORT", 8080))
-    
-    print(f"Starting server on port {port}")
+
+    host = args.host or ("0.0.0.0" if args.production else "localhost")
+    print(f"Starting server on port {args.port}")
     if has_static:
-        print("Frontend will be served at http://localhost:8080")
-    print("API will be available at http://localhost:8080/api")
-    
-    # Run the FastAPI app with uvicorn
-    uvicorn.run("api.main:app", host="localhost", port=port, reload=True)
+        print(f"Frontend will be served at http://localhost:{args.port}")
+    print(f"API will be available at http://localhost:{args.port}/api")
+
+    if args.production:
+        serve_production(host, args.port, max(1, args.workers))
+    else:
+        # Run the FastAPI app with uvicorn
+        serve_development(host, args.port)
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict
+
+import pytz
+from sqlalchemy.orm import Session
+
+from .models import SessionLocal, SystemSetting
+
+# How stale another worker's settings change may be before this worker sees it
+SETTINGS_REFRESH_SECONDS = float(os.environ.get("SETTINGS_REFRESH_SECONDS", 2))
+
+ist = pytz.timezone('Asia/Kolkata')
+
+DEFAULT_SETTINGS: Dict[str, Any] = {
+    "maintenance_mode": False,
+    "debug_mode": True,
+    "api_rate_limiting": True,
+    "request_profiling": False,  # Lets admins profile requests with the X-Profile header
+    "last_backup": (datetime.now(ist) - timedelta(days=2)).strftime("%Y-%m-%d %H:%M:%S"),
+}
+
+class SystemSettingsStore:
+    """
+    Admin-editable settings kept in the system_settings table, so every
+    worker uses the same values. Reads are plain dict lookups on a local copy
+    (middlewares check them on every request); a background thread reloads
+    the copy every SETTINGS_REFRESH_SECONDS. Writes go straight to the database.
+    """
+
+    def __init__(self, defaults: Dict[str, Any], refresh_seconds: float = SETTINGS_REFRESH_SECONDS):
+        self.defaults = dict(defaults)
+        self.refresh_seconds = refresh_seconds
+        self._values = dict(defaults)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __getitem__(self, key: str) -> Any:
+        return self._values[key]
+
+    def as_dict(self) -> Dict[str, Any]:
+        return dict(self._values)
+
+    def save(self, db: Session, changes: Dict[str, Any]):
+        """Persist changes; usable with run_db"""
+        for key, value in changes.items():
+            db.merge(SystemSetting(key=key, value=json.dumps(value)))
+        db.commit()
+        self._values = {**self._values, **changes}
+
+    def reload(self):
+        db = SessionLocal()
+        try:
+            stored = {row.key: json.loads(row.value) for row in db.query(SystemSetting).all()}
+        except Exception as e:
+            print(f"Error loading system settings: {e}")
+            return
+        finally:
+            db.close()
+        # Swap in a new dict so readers never see a half-applied reload
+        self._values = {**self.defaults, **stored}
+
+    def start(self):
+        """Load the stored settings and keep them fresh in the background"""
+        self.reload()
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="settings-refresh", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join(self.refresh_seconds + 1)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.refresh_seconds):
+            self.reload()
+
+system_settings = SystemSettingsStore(DEFAULT_SETTINGS)
@@ -0,0 +1,143 @@
+import contextvars
+import os
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, List
+
+import pytz
+from sqlalchemy import event
+
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 100))
+SLOW_QUERY_BUFFER_SIZE = int(os.environ.get("SLOW_QUERY_BUFFER_SIZE", 200))
+# A statement shape run this many times within one request is reported as a likely N+1
+N_PLUS_ONE_THRESHOLD = int(os.environ.get("N_PLUS_ONE_THRESHOLD", 10))
+MAX_STATEMENT_SHAPES = 1000
+
+ist = pytz.timezone('Asia/Kolkata')
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+# Per-request statement counts, set by SQLStatsMiddleware
+_request_queries: contextvars.ContextVar = contextvars.ContextVar("request_queries", default=None)
+
+@lru_cache(maxsize=2048)
+def normalize_sql(statement: str) -> str:
+    """Reduce a statement to its shape: literals become ? and IN lists collapse"""
+    shape = _STRING_LITERAL.sub("?", statement)
+    shape = _NUMBER_LITERAL.sub("?", shape)
+    shape = _IN_LIST.sub("(?...)", shape)
+    return _WHITESPACE.sub(" ", shape).strip()
+
+class SQLStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.statements: Dict[str, List[float]] = {}  # shape -> [count, total_seconds, max_seconds]
+        self.slow_queries: deque = deque(maxlen=SLOW_QUERY_BUFFER_SIZE)
+        self.n_plus_one: deque = deque(maxlen=SLOW_QUERY_BUFFER_SIZE)
+
+    def record(self, statement: str, parameters: Any, seconds: float):
+        shape = normalize_sql(statement)
+        request = _request_queries.get()
+        with self._lock:
+            entry = self.statements.get(shape)
+            if entry is None:
+                if len(self.statements) >= MAX_STATEMENT_SHAPES:
+                    shape = "<other>"
+                entry = self.statements.setdefault(shape, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+
+            if seconds * 1000 >= SLOW_QUERY_MS:
+                self.slow_queries.append({
+                    "statement": statement,
+                    "parameters": repr(parameters)[:500],
+                    "duration_ms": round(seconds * 1000, 3),
+                    "path": request["path"] if request else None,
+                    "at": datetime.now(ist).strftime("%Y-%m-%d %H:%M:%S"),
+                })
+
+        if request is not None:
+            counts = request["counts"]
+            counts[shape] = counts.get(shape, 0) + 1
+
+    def record_request(self, method: str, path: str, counts: Dict[str, int]):
+        repeated = {shape: count for shape, count in counts.items() if count >= N_PLUS_ONE_THRESHOLD}
+        if not repeated:
+            return
+        with self._lock:
+            for shape, count in repeated.items():
+                self.n_plus_one.append({
+                    "method": method,
+                    "path": path,
+                    "statement": shape,
+                    "executions": count,
+                    "at": datetime.now(ist).strftime("%Y-%m-%d %H:%M:%S"),
+                })
+
+    def summary(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """Statement shapes ordered by total time spent"""
+        with self._lock:
+            rows = [
+                {
+                    "statement": shape,
+                    "count": count,
+                    "total_ms": round(total * 1000, 3),
+                    "avg_ms": round(total * 1000 / count, 3) if count else 0.0,
+                    "max_ms": round(maximum * 1000, 3),
+                }
+                for shape, (count, total, maximum) in self.statements.items()
+            ]
+        rows.sort(key=lambda row: row["total_ms"], reverse=True)
+        return rows[:limit]
+
+    def reset(self):
+        with self._lock:
+            self.statements.clear()
+            self.slow_queries.clear()
+            self.n_plus_one.clear()
+
+sql_stats = SQLStats()
+
+def instrument_engine(engine, stats: SQLStats = sql_stats):
+    """Time every statement run through the engine"""
+
+    # The start time lives on the statement's execution context, so one that fails leaves nothing behind
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._query_started_at = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_query_started_at", None)
+        if started is not None:
+            stats.record(statement, parameters, time.perf_counter() - started)
+
+class SQLStatsMiddleware:
+    """Counts statements per request so repeated shapes (N+1 patterns) can be reported"""
+
+    def __init__(self, app, stats: SQLStats = sql_stats):
+        self.app = app
+        self.stats = stats
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith("/api/"):
+            return await self.app(scope, receive, send)
+
+        request = {"path": scope["path"], "counts": {}}
+        token = _request_queries.set(request)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_queries.reset(token)
+            route = scope.get("route")
+            path = route.path if route is not None else scope["path"]
+            self.stats.record_request(scope["method"], path, request["counts"])
@@ -148,12 +148,66 @@ export async function getGraphData() {
   return fetchAPI("/kginsights/graph")
 }
 
+export async function getGraphViewport(x0: number, y0: number, x1: number, y1: number, zoom = 1) {
+  return fetchAPI(`/kginsights/viewport?x0=${x0}&y0=${y0}&x1=${x1}&y1=${y1}&zoom=${zoom}`)
+}
+
+// Typeahead over node labels; "auto" falls back to fuzzy matches when there are few prefix matches
+export async function searchGraphNodes(q: string, limit = 10, mode: "auto" | "prefix" | "fuzzy" = "auto") {
+  return fetchAPI(`/kginsights/search?${traversalQuery({ q, limit, mode })}`)
+}
+
+function traversalQuery(params: Record<string, string | number | string[] | undefined>) {
+  const query = new URLSearchParams()
+  for (const [key, value] of Object.entries(params)) {
+    if (value === undefined) continue
+    for (const item of Array.isArray(value) ? value : [value]) query.append(key, String(item))
+  }
+  return query.toString()
+}
+
+export async function getNodeNeighbors(nodeId: number, labels?: string[], direction: "out" | "in" | "both" = "both") {
+  return fetchAPI(`/kginsights/nodes/${nodeId}/neighbors?${traversalQuery({ label: labels, direction })}`)
+}
+
+export async function getNodeNeighborhood(
+  nodeId: number,
+  hops = 2,
+  labels?: string[],
+  direction: "out" | "in" | "both" = "both",
+) {
+  return fetchAPI(`/kginsights/nodes/${nodeId}/neighborhood?${traversalQuery({ hops, label: labels, direction })}`)
+}
+
+export async function getShortestPath(
+  source: number,
+  target: number,
+  labels?: string[],
+  direction: "out" | "in" | "both" = "both",
+) {
+  return fetchAPI(`/kginsights/path?${traversalQuery({ source, target, label: labels, direction })}`)
+}
+
 export async function getGraphMetrics() {
   return fetchAPI("/kginsights/metrics")
 }
 
-export async function getGraphUpdates() {
-  return fetchAPI("/kginsights/updates")
+// Changes after since (a graph version), to patch a graph loaded earlier; reload the graph when reload is set
+export async function getGraphUpdates(since?: number, epoch?: string, limit?: number) {
+  return fetchAPI(`/kginsights/updates?${traversalQuery({ since, epoch, limit })}`)
+}
+
+// Latest analytics result; the dashboard keeps it computing in the background
+export async function getGraphAnalytics(top = 5) {
+  return fetchAPI(`/kginsights/analytics?${traversalQuery({ top })}`)
+}
+
+export async function getTopNodes(metric: AnalyticsMetric = "pagerank", limit = 10) {
+  return fetchAPI(`/kginsights/analytics/top?${traversalQuery({ metric, limit })}`)
+}
+
+export async function getNodeAnalytics(nodeId: number) {
+  return fetchAPI(`/kginsights/analytics/nodes/${nodeId}`)
 }
 
 export async function getKGraphDashboard() {
@@ -199,6 +253,100 @@ export interface GraphEdge {
   label: string
 }
 
+export interface GraphSubgraph {
+  nodes: GraphNode[]
+  edges: GraphEdge[]
+  truncated: boolean
+}
+
+export interface GraphNeighborhood {
+  center: number
+  hops: number
+  nodes: (GraphNode & { distance: number })[]
+  edges: GraphEdge[]
+  truncated: boolean
+}
+
+export interface GraphPath {
+  found: boolean
+  length: number | null
+  nodes: GraphNode[]
+  edges: GraphEdge[]
+}
+
+export interface GraphSearchHit extends GraphNode {
+  match: "exact" | "prefix" | "fuzzy"
+  score: number
+}
+
+export type AnalyticsMetric = "pagerank" | "betweenness" | "degree_centrality"
+
+// Metrics are null until analytics have run on a graph version that has the node
+export interface AnalyticsNode extends GraphNode {
+  pagerank?: number | null
+  betweenness?: number | null
+  degree_centrality?: number | null
+  community?: number | null
+}
+
+export interface GraphAnalytics {
+  version: number
+  stale: boolean
+  computed_at: string
+  elapsed_seconds: number
+  communities: number
+  modularity: number
+  largest_communities: { id: number; size: number; label: string }[]
+  top_pagerank: AnalyticsNode[]
+  top_betweenness: AnalyticsNode[]
+}
+
+export interface GraphCluster {
+  id: number
+  label: string
+  type: string
+  color: string
+  x: number
+  y: number
+  count: number
+}
+
+export interface GraphClusterEdge {
+  from_cluster: number
+  to_cluster: number
+  count: number
+}
+
+export interface GraphViewport {
+  version: number
+  level: number
+  truncated: boolean
+  nodes: GraphNode[]
+  edges: GraphEdge[]
+  clusters: GraphCluster[]
+  cluster_edges: GraphClusterEdge[]
+}
+
+export interface GraphChange {
+  sequence: number
+  event: "nodes_added" | "nodes_removed" | "edges_added" | "edges_removed" | "reset"
+  summary: string
+  time: string
+  nodes: GraphNode[]
+  edges: GraphEdge[]
+  removed_node_ids: number[]
+  removed_edge_ids: number[]
+}
+
+export interface GraphChanges {
+  epoch: string
+  sequence: number
+  latest: number
+  has_more: boolean
+  reload: boolean
+  changes: GraphChange[]
+}
+
 export interface GraphMetrics {
   total_nodes: number
   total_edges: number
@@ -221,10 +369,11 @@ export interface DashboardData {
 
 export interface KGraphDashboard {
   graph: {
-    nodes: GraphNode[]
+    nodes: AnalyticsNode[]
     edges: GraphEdge[]
   }
   metrics: GraphMetrics
   updates: { action: string; time: string }[]
+  analytics?: GraphAnalytics | null
 }
 
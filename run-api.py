@@ -13,23 +13,12 @@ if __name__ == "__main__":
     
     # Now try to import from the api module
     try:
-        from api.run import check_static_files
+        from api.run import main
         print("API module imported successfully!")
         
-        # Check if static files exist
-        has_static = check_static_files()
-        
-        # Get port from environment variable or use default
-        port = int(os.environ.get("PORT", 8080))
-        
-        print(f"Starting server on port {port}")
-        if has_static:
-            print("Frontend will be served at http://localhost:8080")
-        print("API will be available at http://localhost:8080/api")
-        
-        # Run the FastAPI app with uvicorn
-        import uvicorn
-        uvicorn.run("api.main:app", host="localhost", port=port, reload=True)
+        # Development server with auto-reload by default; pass --production
+        # (or set SERVE_MODE=production) for multiple workers
+        main()
         
     except ImportError as e:
         print(f"Error importing API module: {e}")